@@ -39,13 +39,15 @@ reconfigure_slapd() {
 }
 
 
-# Run slapd reconfiguration once at runtime (!)
-init_file=/app/.slapd_init_done
-if [ ! -e "$init_file" ]; then
-    reconfigure_slapd
-    touch "$init_file"
+# Run slapd reconfiguration once at runtime (!), unless phone books are served from memory
+if [ "${LDAP_BACKEND:-slapd}" = "slapd" ]; then
+    init_file=/app/.slapd_init_done
+    if [ ! -e "$init_file" ]; then
+        reconfigure_slapd
+        touch "$init_file"
+    fi
+    start_server
 fi
-start_server
 
 # Start main script
 echo "Starting nc2ldap application."
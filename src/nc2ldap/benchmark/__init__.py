@@ -0,0 +1 @@
+"""Module for end-to-end sync benchmarks using local stand-ins for all servers."""
@@ -0,0 +1,289 @@
+"""Run end-to-end sync benchmarks and print throughput and peak memory per stage."""
+
+import gc
+import json
+import logging
+import tracemalloc
+from argparse import ArgumentParser, Namespace
+from dataclasses import asdict, dataclass, replace
+from time import perf_counter
+from typing import Any, Callable, Dict, List, TypeVar
+
+from ldap3 import MOCK_ASYNC, MOCK_SYNC, Connection
+from vobject.base import readOne
+
+from nc2ldap.contact import (
+    VCARD_CONVERTER,
+    Contact,
+    ParsePool,
+    contact_to_ldap_dict,
+    read_vcard,
+)
+from nc2ldap.contact.converters import format_phone_number
+from nc2ldap.ldap import ContactDiff, PhoneBook, PhoneBookEntry, StreamingDiff, diff_contacts
+from nc2ldap.nextcloud import AddressBook
+from nc2ldap.nextcloud.carddav import CardData
+from nc2ldap.server import Directory
+from nc2ldap.server.directory import WHOLE_SUBTREE
+from nc2ldap.server.filters import EqualityFilter, Filter, SubstringFilter, normalize
+
+from .generator import generate_address_book
+from .webdav_server import CardDavServer
+
+logging.basicConfig(level=logging.WARNING)
+logging.disable(logging.INFO)
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+USER: str = "bench"
+PHONE_BOOK: str = "ou=phonebook,dc=mytld,dc=com"
+
+
+@dataclass(frozen=True)
+class StageResult:
+    """Timing and memory results of a single benchmark stage."""
+
+    size: int
+    stage: str
+    items: int
+    seconds: float
+    peak_mib: float
+
+    def __str__(self) -> str:
+        """Format as a table row."""
+        rate: float = self.items / self.seconds if self.seconds else 0.0
+        return (
+            f"{self.size:>8} | {self.stage:<28} | {self.items:>8} | {self.seconds:>9.3f} | "
+            f"{rate:>11.0f} | {self.peak_mib:>9.1f}"
+        )
+
+
+HEADER: str = (
+    f"{'size':>8} | {'stage':<28} | {'items':>8} | {'seconds':>9} | {'items/s':>11} | "
+    f"{'peak MiB':>9}"
+)
+
+
+class Benchmark:
+    """Collects results of all stages for all address book sizes."""
+
+    def __init__(self, memory: bool) -> None:
+        self.memory: bool = memory
+        self.results: List[StageResult] = []
+
+    def run(self, size: int, stage: str, items: Callable[[T], int], func: Callable[[], T]) -> T:
+        """Run and measure a single stage, counting processed items from its result."""
+        gc.collect()
+        if self.memory:
+            tracemalloc.reset_peak()
+        start: float = perf_counter()
+        value: T = func()
+        seconds: float = perf_counter() - start
+        peak: float = tracemalloc.get_traced_memory()[1] / 2**20 if self.memory else 0.0
+
+        result: StageResult = StageResult(size, stage, items(value), seconds, peak)
+        self.results.append(result)
+        print(result, flush=True)
+        return value
+
+
+def mock_phone_book() -> PhoneBook:
+    """Create a phone book backed by ldap3's in-memory mock strategies."""
+    phone_book: PhoneBook = PhoneBook("mock", PHONE_BOOK)
+    phone_book.ldap = Connection(phone_book.server, client_strategy=MOCK_SYNC)
+    phone_book.ldap_async = Connection(phone_book.server, client_strategy=MOCK_ASYNC)
+    phone_book.ldap.bind()
+    phone_book.ldap_async.bind()
+    phone_book.ldap.strategy.add_entry(PHONE_BOOK, {"objectClass": ["organizationalUnit"]})
+    return phone_book
+
+
+def slapd_phone_book(args: Namespace) -> PhoneBook:
+    """Connect to a local slapd instance and empty the benchmark phone book."""
+    phone_book: PhoneBook = PhoneBook(args.ldap_host, args.ldap_phone_book)
+    phone_book.login(args.ldap_user, args.ldap_password)
+    phone_book.create()
+    phone_book.apply_diff(ContactDiff(deleted=list(phone_book.get_entries())))
+    return phone_book
+
+
+def stream_sync(address_book: AddressBook, phone_book: PhoneBook) -> StreamingDiff:
+    """Stream all contacts from the address book into the phone book, like a sync does."""
+    stream: StreamingDiff = StreamingDiff(phone_book.get_entries())
+    with address_book.stream_contacts() as contacts:
+        phone_book.apply_stream(stream, contacts)
+    return stream
+
+
+def benchmark_convert(bench: Benchmark, size: int, cards: List[CardData]) -> None:
+    """Run the conversion of already parsed vCards into contacts on its own."""
+    vcards: List[Any] = [read_vcard(card.vcard) for card in cards]
+    bench.run(size, "convert vCards", len, lambda: list(VCARD_CONVERTER.convert_many(vcards)))
+
+
+def benchmark_directory(bench: Benchmark, size: int, contacts: List[Contact]) -> None:
+    """Publish contacts to the in-memory LDAP backend and look them up by phone number."""
+    directory: Directory = Directory()
+    bench.run(
+        size,
+        "memory publish",
+        lambda _: len(contacts),
+        lambda: directory.publish(PHONE_BOOK, contacts),
+    )
+    lookups: List[Filter] = [
+        EqualityFilter("mobile", normalize("mobile", format_phone_number(c.phone_mobile)))
+        for c in contacts
+        if c.phone_mobile
+    ]
+    bench.run(
+        size,
+        "memory phone lookups",
+        len,
+        lambda: [directory.search(PHONE_BOOK, WHOLE_SUBTREE, f) for f in lookups],
+    )
+    suffix_lookups: List[Filter] = [
+        SubstringFilter("mobile", "", (), normalize("mobile", c.phone_mobile)[-7:])
+        for c in contacts
+        if c.phone_mobile
+    ]
+    bench.run(
+        size,
+        "memory phone suffix lookups",
+        len,
+        lambda: [directory.search(PHONE_BOOK, WHOLE_SUBTREE, f) for f in suffix_lookups],
+    )
+
+
+def benchmark_parse_pool(bench: Benchmark, size: int, cards: List[CardData], workers: int) -> None:
+    """Run the parse stage on a pool of worker processes."""
+    pool: ParsePool = ParsePool(workers)
+    try:
+        list(pool.parse(card.vcard for card in cards[: 2 * workers]))  # Start all workers
+        bench.run(
+            size,
+            f"parse ({workers} processes)",
+            len,
+            lambda: list(pool.parse(card.vcard for card in cards)),
+        )
+    finally:
+        pool.close()
+
+
+def benchmark_size(bench: Benchmark, size: int, args: Namespace) -> None:
+    """Run all stages for an address book of a specific size."""
+    files: Dict[str, str] = generate_address_book(size, args.seed)
+    path: str = f"/remote.php/dav/addressbooks/users/{USER}/{USER}"
+
+    with CardDavServer(path, files) as server:
+        address_book: AddressBook = AddressBook(
+            server.url, USER, USER, "", batch_size=args.batch_size, workers=args.workers
+        )
+        hrefs: List[str] = bench.run(
+            size, "WebDAV listing", len, lambda: list(address_book.get_vcf_files())
+        )
+        cards: List[CardData] = bench.run(
+            size, "WebDAV multiget", len, lambda: list(address_book.get_vcards_bulk(hrefs))
+        )
+        if args.single_files:
+            bench.run(
+                size, "WebDAV single files", len, lambda: list(address_book.get_vcards(hrefs))
+            )
+        bench.run(size, "AddressBook.get_contacts", len, address_book.get_contacts)
+        streamed: PhoneBook = slapd_phone_book(args) if args.ldap_host else mock_phone_book()
+        bench.run(
+            size,
+            "streamed sync",
+            lambda stream: len(stream.seen),
+            lambda: stream_sync(address_book, streamed),
+        )
+
+    contacts: List[Contact] = bench.run(
+        size,
+        "parse (fast parser)",
+        len,
+        lambda: list(VCARD_CONVERTER.convert_many(read_vcard(card.vcard) for card in cards)),
+    )
+    benchmark_convert(bench, size, cards)
+    if args.parse_workers > 1:
+        benchmark_parse_pool(bench, size, cards, args.parse_workers)
+    if args.vobject:
+        bench.run(
+            size,
+            "parse (vobject)",
+            len,
+            lambda: list(VCARD_CONVERTER.convert_many(readOne(card.vcard) for card in cards)),
+        )
+    bench.run(
+        size, "contact_to_ldap_dict", len, lambda: [contact_to_ldap_dict(c) for c in contacts]
+    )
+
+    phone_book: PhoneBook = slapd_phone_book(args) if args.ldap_host else mock_phone_book()
+    bench.run(
+        size,
+        "LDAP initial write",
+        lambda _: len(contacts),
+        lambda: phone_book.apply_diff(diff_contacts([], contacts), args.window),
+    )
+    bench.run(size, "PhoneBook.get_contacts", len, lambda: list(phone_book.get_contacts()))
+    entries: List[PhoneBookEntry] = bench.run(
+        size, "PhoneBook.get_entries", len, lambda: list(phone_book.get_entries())
+    )
+
+    # Change every 20th contact to get a realistic amount of updates
+    changed: List[Contact] = [
+        replace(c, email=f"changed-{i}@example.com") if i % 20 == 0 else c
+        for i, c in enumerate(contacts)
+    ]
+    diff: ContactDiff = bench.run(
+        size, "diff", lambda _: len(changed), lambda: diff_contacts(entries, changed)
+    )
+    bench.run(
+        size,
+        "LDAP update write",
+        lambda _: len(diff.updated),
+        lambda: phone_book.apply_diff(diff, args.window),
+    )
+    benchmark_directory(bench, size, contacts)
+
+
+def parse_args() -> Namespace:
+    """Parse command line arguments."""
+    parser: ArgumentParser = ArgumentParser(prog="python -m nc2ldap.benchmark", description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-size", type=int, default=250)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--window", type=int, default=64)
+    parser.add_argument("--single-files", action="store_true", help="also time single GETs")
+    parser.add_argument("--parse-workers", type=int, default=0, help="also parse in processes")
+    parser.add_argument("--vobject", action="store_true", help="also time parsing with vobject")
+    parser.add_argument("--no-memory", action="store_true", help="skip peak memory tracing")
+    parser.add_argument("--json", help="write all results to a JSON file for comparison")
+    parser.add_argument("--ldap-host", help="use a local slapd instead of an in-memory mock")
+    parser.add_argument("--ldap-user", default="cn=admin,dc=mytld,dc=com")
+    parser.add_argument("--ldap-password", default="admin")
+    parser.add_argument("--ldap-phone-book", default="ou=benchmark,dc=mytld,dc=com")
+    return parser.parse_args()
+
+
+def main() -> None:
+    """Run the benchmark suite."""
+    args: Namespace = parse_args()
+    bench: Benchmark = Benchmark(memory=not args.no_memory)
+    if bench.memory:
+        tracemalloc.start()
+
+    print(HEADER)
+    print("-" * len(HEADER))
+    for size in args.sizes:
+        benchmark_size(bench, size, args)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as handle:
+            data: List[Dict[str, Any]] = [asdict(result) for result in bench.results]
+            json.dump(data, handle, indent=2)
+
+
+if __name__ == "__main__":
+    main()
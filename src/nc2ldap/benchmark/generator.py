@@ -0,0 +1,111 @@
+"""Module to generate deterministic, realistic address books for benchmarking."""
+
+from random import Random
+from typing import Dict, List, Tuple
+
+FIRST_NAMES: Tuple[str, ...] = (
+    "Joey",
+    "Anna",
+    "Jürgen",
+    "Zoë",
+    "Łukasz",
+    "Søren",
+    "Ana María",
+    "François",
+    "Ümit",
+    "Chloé",
+    "Hiroshi",
+    "Olga",
+)
+LAST_NAMES: Tuple[str, ...] = (
+    "Doe",
+    "Müller",
+    "Schmidt",
+    "O'Neill",
+    "García Pérez",
+    "Nowak",
+    "Øster",
+    "Dvořák",
+    "Yılmaz",
+    "Tanaka",
+    "Smith-Jones",
+    "van der Berg",
+)
+TITLES: Tuple[str, ...] = ("Dr.", "Prof.", "Dipl.-Ing.")
+COMPANIES: Tuple[str, ...] = (
+    "Black Cat & Paws Inc.",
+    "Catnip GmbH",
+    "Kitten Logistics AG",
+    "Café Mäusefalle",
+    "Whisker Works Ltd.",
+)
+STREETS: Tuple[str, ...] = ("Catstreet", "Hauptstraße", "Rue de la Paix", "Mühlenweg")
+CITIES: Tuple[Tuple[str, str], ...] = (
+    ("12345", "Kittentown"),
+    ("10115", "Berlin"),
+    ("80331", "München"),
+    ("50667", "Köln"),
+)
+AREA_CODES: Tuple[str, ...] = ("30", "40", "89", "221", "5555", "151", "160", "170")
+PHONE_TYPES: Tuple[str, ...] = (
+    "type=HOME;type=VOICE",
+    "type=CELL;type=VOICE",
+    "type=WORK;type=VOICE",
+    "type=HOME;type=FAX",
+    "type=VOICE",
+)
+
+
+def escape(value: str) -> str:
+    """Escape a vCard text value."""
+    return value.replace("\\", "\\\\").replace(",", "\\,").replace(";", "\\;")
+
+
+def phone_number(rnd: Random) -> str:
+    """Generate a random German phone number in international format."""
+    return f"+49 {rnd.choice(AREA_CODES)} {rnd.randint(100000, 9999999)}"
+
+
+def generate_vcard(index: int, rnd: Random) -> str:
+    """Generate a single vCard, which may be a person or a company-only card."""
+    uid: str = f"bench-{index:06d}"
+    company: str = rnd.choice(COMPANIES)
+    lines: List[str] = ["BEGIN:VCARD", "VERSION:3.0", f"UID:{uid}"]
+
+    if rnd.random() < 0.1:
+        # Company-only card with a shared switchboard number
+        lines += [
+            "N:;;;;",
+            f"FN:{escape(company)} {index}",
+            f"ORG:{escape(company)} {index};",
+            f"TEL;type=WORK;type=VOICE:+49 5555 {COMPANIES.index(company)}",
+        ]
+    else:
+        first: str = rnd.choice(FIRST_NAMES)
+        last: str = f"{rnd.choice(LAST_NAMES)} {index}"
+        title: str = rnd.choice(TITLES) if rnd.random() < 0.1 else ""
+        lines += [
+            f"N:{escape(last)};{escape(first)};;{title};",
+            f"FN:{title} {first} {last}".strip(),
+        ]
+        if rnd.random() < 0.5:
+            lines.append(f"ORG:{escape(company)};")
+        for phone_type in rnd.sample(PHONE_TYPES, rnd.randint(1, 4)):
+            lines.append(f"TEL;{phone_type}:{phone_number(rnd)}")
+        for email_type in rnd.sample(("HOME", "WORK"), rnd.randint(0, 2)):
+            user: str = f"{first}.{last}".lower().replace(" ", "")
+            lines.append(f"EMAIL;type=INTERNET;type={email_type}:{user}@example.com")
+
+    for adr_type in rnd.sample(("HOME", "WORK"), rnd.randint(0, 2)):
+        code, city = rnd.choice(CITIES)
+        street: str = f"{rnd.choice(STREETS)} {rnd.randint(1, 200)}"
+        lines.append(f"ADR;type={adr_type}:;;{escape(street)};{escape(city)};;{code};Deutschland")
+
+    lines.append("END:VCARD")
+    return "\r\n".join(lines) + "\r\n"
+
+
+def generate_address_book(size: int, seed: int = 42) -> Dict[str, str]:
+    """Generate a deterministic address book, mapping file names to vCard data."""
+    rnd: Random = Random(seed)
+    return {f"bench-{index:06d}.vcf": generate_vcard(index, rnd) for index in range(size)}
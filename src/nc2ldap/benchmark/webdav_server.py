@@ -0,0 +1,150 @@
+"""Module for a minimal local CardDAV server serving a generated address book."""
+
+import logging
+from hashlib import md5
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from time import sleep
+from typing import Dict, Iterable, List, Optional, Tuple
+from xml.etree.ElementTree import Element, fromstring
+from xml.sax.saxutils import escape
+
+from nc2ldap.constants import LOG_LEVEL
+from nc2ldap.nextcloud.carddav import NS_CALENDARSERVER, NS_CARDDAV, NS_DAV
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+SYNC_TOKEN: str = "http://sabre.io/ns/sync/1"
+
+
+class CardDavHandler(BaseHTTPRequestHandler):
+    """Answer PROPFIND, REPORT and GET requests for a single address book."""
+
+    protocol_version = "HTTP/1.1"
+    server: "CardDavServer"
+
+    def log_message(self, format: str, *args: object) -> None:  # pylint: disable=W0622
+        """Log requests only when debugging."""
+        logger.debug(format, *args)
+
+    def send_xml(self, body: str) -> None:
+        """Send a multistatus response."""
+        data: bytes = f'<?xml version="1.0" encoding="utf-8"?>{body}'.encode()
+        self.send_response(HTTPStatus.MULTI_STATUS)
+        self.send_header("Content-Type", "application/xml; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_body(self) -> bytes:
+        """Read the request body, if any."""
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def build_responses(self, hrefs: Iterable[str], address_data: bool) -> str:
+        """Build response elements for a number of vCard files."""
+        result: List[str] = []
+        for href in hrefs:
+            etag, vcard = self.server.cards[href]
+            data: str = f"<c:address-data>{escape(vcard)}</c:address-data>" if address_data else ""
+            result.append(
+                f"<d:response><d:href>{escape(href)}</d:href><d:propstat><d:prop>"
+                f"<d:getetag>{escape(etag)}</d:getetag><d:resourcetype/>{data}"
+                "</d:prop><d:status>HTTP/1.1 200 OK</d:status></d:propstat></d:response>"
+            )
+        return "".join(result)
+
+    def do_PROPFIND(self) -> None:  # pylint: disable=invalid-name
+        """List the address book collection, or get its sync token and CTag only."""
+        self.read_body()
+        if self.headers.get("Depth") == "0":
+            self.send_xml(
+                f'<d:multistatus xmlns:d="{NS_DAV}" xmlns:cs="{NS_CALENDARSERVER}">'
+                f"<d:response><d:href>{self.server.path}/</d:href><d:propstat><d:prop>"
+                f"<d:sync-token>{SYNC_TOKEN}</d:sync-token><cs:getctag>1</cs:getctag></d:prop>"
+                "<d:status>HTTP/1.1 200 OK</d:status></d:propstat></d:response></d:multistatus>"
+            )
+            return
+        collection: str = (
+            f"<d:response><d:href>{self.server.path}/</d:href><d:propstat><d:prop>"
+            "<d:resourcetype><d:collection/></d:resourcetype></d:prop>"
+            "<d:status>HTTP/1.1 200 OK</d:status></d:propstat></d:response>"
+        )
+        self.send_xml(
+            f'<d:multistatus xmlns:d="{NS_DAV}">'
+            f"{collection}{self.build_responses(self.server.cards, False)}</d:multistatus>"
+        )
+
+    def do_REPORT(self) -> None:  # pylint: disable=invalid-name
+        """Answer addressbook-multiget and sync-collection reports."""
+        request: Element = fromstring(self.read_body())
+        body: str
+        if request.tag == f"{{{NS_CARDDAV}}}addressbook-multiget":
+            hrefs: List[str] = [h.text or "" for h in request.iter(f"{{{NS_DAV}}}href")]
+            body = self.build_responses(hrefs, True)
+        else:
+            token: str = request.findtext(f"{{{NS_DAV}}}sync-token", "")
+            changed = [] if token == SYNC_TOKEN else self.server.cards
+            body = (
+                f"{self.build_responses(changed, False)}<d:sync-token>{SYNC_TOKEN}</d:sync-token>"
+            )
+        self.send_xml(
+            f'<d:multistatus xmlns:d="{NS_DAV}" xmlns:c="{NS_CARDDAV}">{body}</d:multistatus>'
+        )
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        """Download a single vCard file."""
+        with self.server.lock:
+            failures: List[int] = self.server.failures.get(self.path, [])
+            status: Optional[int] = failures.pop(0) if failures else None
+        sleep(self.server.delays.get(self.path, 0))
+        if status is not None:
+            self.send_error(status)
+            return
+        if self.path not in self.server.cards:
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+        etag, vcard = self.server.cards[self.path]
+        data: bytes = vcard.encode()
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "text/vcard; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class CardDavServer(ThreadingHTTPServer):
+    """A local CardDAV server stand-in, serving the address book of a single user."""
+
+    daemon_threads = True
+
+    def __init__(self, path: str, files: Dict[str, str]) -> None:
+        """Bind to a free local port and prepare all vCards for serving."""
+        super().__init__(("127.0.0.1", 0), CardDavHandler)
+        self.path: str = path
+        self.cards: Dict[str, Tuple[str, str]] = {
+            f"{path}/{name}": (f'"{md5(vcard.encode()).hexdigest()}"', vcard)
+            for name, vcard in files.items()
+        }
+        self.thread: Thread = Thread(target=self.serve_forever, daemon=True)
+
+        # Status codes to answer downloads of single files with before serving them, and delays
+        self.failures: Dict[str, List[int]] = {}
+        self.delays: Dict[str, float] = {}
+        self.lock: Lock = Lock()
+
+    @property
+    def url(self) -> str:
+        """Get the base URL of this server."""
+        host, port = self.server_address[:2]
+        return f"http://{host!s}:{port}"
+
+    def __enter__(self) -> "CardDavServer":
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.shutdown()
+        self.server_close()
@@ -12,10 +12,43 @@ NEXTCLOUD_HOST: str = environ.get("NEXTCLOUD_HOST", "")
 NEXTCLOUD_ADDRESS_BOOK: str = environ.get("NEXTCLOUD_ADDRESS_BOOK", "")
 NEXTCLOUD_USER: str = environ.get("NEXTCLOUD_USER", "")
 NEXTCLOUD_APP_TOKEN: str = environ.get("NEXTCLOUD_APP_TOKEN", "")
+NEXTCLOUD_BATCH_SIZE: int = int(environ.get("NEXTCLOUD_BATCH_SIZE", "250"))
+NEXTCLOUD_WORKERS: int = int(environ.get("NEXTCLOUD_WORKERS", "8"))
+NEXTCLOUD_TIMEOUT: float = float(environ.get("NEXTCLOUD_TIMEOUT", "30"))
+NEXTCLOUD_RETRIES: int = int(environ.get("NEXTCLOUD_RETRIES", "3"))
+NEXTCLOUD_LATENCY_TARGET: float = float(environ.get("NEXTCLOUD_LATENCY_TARGET", "3"))
+NEXTCLOUD_SYNC_STATE_FILE: str = environ.get("NEXTCLOUD_SYNC_STATE_FILE", "")
+NEXTCLOUD_PARSE_WORKERS: int = int(environ.get("NEXTCLOUD_PARSE_WORKERS", "0"))
+NEXTCLOUD_PARSE_CHUNK_SIZE: int = int(environ.get("NEXTCLOUD_PARSE_CHUNK_SIZE", "200"))
+NEXTCLOUD_POLL_INTERVAL: int = int(environ.get("NEXTCLOUD_POLL_INTERVAL", "0"))
+NEXTCLOUD_POLL_DEBOUNCE: float = float(environ.get("NEXTCLOUD_POLL_DEBOUNCE", "5"))
+
+TENANTS_FILE: str = environ.get("TENANTS_FILE", "")
+SYNC_CONCURRENCY: int = int(environ.get("SYNC_CONCURRENCY", "4"))
+SYNC_QUEUE_SIZE: int = int(environ.get("SYNC_QUEUE_SIZE", "256"))
+SYNC_MAX_DELAY: float = float(environ.get("SYNC_MAX_DELAY", "60"))
 
 LDAP_HOST: str = environ.get("LDAP_HOST", "ldap://localhost:389")
 LDAP_ADMIN_USER: str = environ.get("LDAP_ADMIN_USER", "cn=admin,dc=mytld,dc=com")
 LDAP_ADMIN_PASSWORD: str = environ.get("LDAP_ADMIN_PASSWORD", "admin")
 LDAP_PHONE_BOOK: str = environ.get("LDAP_PHONE_BOOK", "ou=phonebook,dc=mytld,dc=com")
+LDAP_PAGE_SIZE: int = int(environ.get("LDAP_PAGE_SIZE", "250"))
+LDAP_WRITE_WINDOW: int = int(environ.get("LDAP_WRITE_WINDOW", "64"))
+LDAP_PHONE_KEYS_ATTRIBUTE: str = environ.get("LDAP_PHONE_KEYS_ATTRIBUTE", "")
+LDAP_PHONE_KEYS_SUFFIX_DIGITS: int = int(environ.get("LDAP_PHONE_KEYS_SUFFIX_DIGITS", "0"))
+LDAP_SNAPSHOT_FILE: str = environ.get("LDAP_SNAPSHOT_FILE", "")
+LDAP_SNAPSHOT_MAX_AGE: int = int(environ.get("LDAP_SNAPSHOT_MAX_AGE", "86400"))
+LDAP_BULK_LOAD_MIN: int = int(environ.get("LDAP_BULK_LOAD_MIN", "1000"))
+LDAP_CONFIG_HOST: str = environ.get("LDAP_CONFIG_HOST", "")
+LDAP_BACKEND: str = environ.get("LDAP_BACKEND", "slapd")
+LDAP_SERVER_PORT: int = int(environ.get("LDAP_SERVER_PORT", "389"))
+LDAP_SERVER_ANONYMOUS: bool = bool(environ.get("LDAP_SERVER_ANONYMOUS"))
 
 DEFAULT_REGION: str = environ.get("DEFAULT_REGION", "")
+PHONE_CACHE_SIZE: int = int(environ.get("PHONE_CACHE_SIZE", "16384"))
+
+METRICS_PORT: int = int(environ.get("METRICS_PORT", "0"))
+
+WEBHOOK_PORT: int = int(environ.get("WEBHOOK_PORT", "0"))
+WEBHOOK_TOKEN: str = environ.get("WEBHOOK_TOKEN", "")
+WEBHOOK_DEBOUNCE: float = float(environ.get("WEBHOOK_DEBOUNCE", "2"))
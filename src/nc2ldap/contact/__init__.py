@@ -1,11 +1,36 @@
 """Main module for contact management."""
 
 from .contact import Contact
-from .converters import contact_from_ldap_dict, contact_from_vcard, contact_to_ldap_dict
+from .converters import (
+    LDAP_CONTACT_ATTRIBUTES,
+    LDAP_HASH_ATTRIBUTE,
+    VCARD_CONVERTER,
+    LdapRecord,
+    VCardConverter,
+    contact_from_ldap_dict,
+    contact_from_vcard,
+    contact_hash,
+    contact_to_ldap_dict,
+    contact_to_ldap_record,
+    get_phone_cache_info,
+)
+from .parallel import ParsePool, get_parse_pool
+from .vcard import read_vcard
 
 __ALL__ = (
+    LDAP_CONTACT_ATTRIBUTES,
+    LDAP_HASH_ATTRIBUTE,
+    VCARD_CONVERTER,
     Contact,
+    LdapRecord,
+    ParsePool,
+    VCardConverter,
     contact_from_ldap_dict,
     contact_to_ldap_dict,
+    contact_to_ldap_record,
     contact_from_vcard,
+    contact_hash,
+    get_parse_pool,
+    get_phone_cache_info,
+    read_vcard,
 )
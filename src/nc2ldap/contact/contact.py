@@ -1,11 +1,12 @@
 """Module for system-independent contact management."""
 
 import logging
-from dataclasses import dataclass
-from typing import List, Optional, Tuple
-from uuid import uuid4
-
-from phonenumbers import FrozenPhoneNumber
+from dataclasses import dataclass, field, fields
+from functools import partial
+from operator import attrgetter
+from sys import intern
+from typing import Any, Callable, List, Optional, Tuple
+from uuid import NAMESPACE_OID, uuid5
 
 from nc2ldap.constants import LOG_LEVEL
 
@@ -13,9 +14,13 @@ logger = logging.getLogger(__name__)
 logger.setLevel(LOG_LEVEL)
 
 
-@dataclass(frozen=True, eq=True)
+@dataclass(frozen=True, eq=True, slots=True)
 class Contact:
-    """Contact structure for an independent and comparable base."""
+    """Contact structure for an independent and comparable base.
+
+    Phone numbers are stored in compact E.164 form, followed by `;ext=` and the extension if
+    there is one. CN, key and hash are computed once, as contacts are immutable.
+    """
 
     first_name: Optional[str] = None
     last_name: str = ""
@@ -23,22 +28,71 @@ class Contact:
     email: Optional[str] = None
     company: Optional[str] = None
     title: Optional[str] = None
-    phone_private: Optional[FrozenPhoneNumber] = None
-    phone_mobile: Optional[FrozenPhoneNumber] = None
-    phone_business1: Optional[FrozenPhoneNumber] = None
-    phone_business2: Optional[FrozenPhoneNumber] = None
+    phone_private: Optional[str] = None
+    phone_mobile: Optional[str] = None
+    phone_business1: Optional[str] = None
+    phone_business2: Optional[str] = None
+    uid: Optional[str] = None
 
-    def get_cn(self) -> str:
-        """Build a CN based on this contact's data (full name or company)."""
-        fields: List[Optional[str]] = [
+    _cn: str = field(init=False, repr=False, compare=False)
+    _key: str = field(init=False, repr=False, compare=False)
+    _hash: int = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        """Share recurring strings between contacts, and compute CN, key and hash."""
+        set_value: Callable[[str, Any], None] = partial(object.__setattr__, self)
+        for name in ("first_name", "company", "title"):
+            value: Any = getattr(self, name)
+            if isinstance(value, str):
+                set_value(name, intern(value))
+        if isinstance(self.address[1], str):
+            set_value("address", (self.address[0], intern(self.address[1])))
+
+        set_value("_hash", hash(self.get_values()))
+        name_parts: List[Optional[str]] = [
             self.title,
             self.first_name,
             self.last_name,
             f"({self.company})" if self.company else None,
         ]
-        result: str = " ".join(v for v in fields if v).strip()
-        return result or str(uuid4())  # Always return a non-empty string!
+        cn: str = " ".join(v for v in name_parts if v).strip()
+        set_value("_cn", cn or self.uid or self.get_fingerprint())  # Never an empty string!
+        set_value("_key", self.uid or self._cn)
+
+    def get_values(self) -> Tuple[Any, ...]:
+        """Get all of this contact's data in field order."""
+        return get_contact_values(self)
+
+    def get_cn(self) -> str:
+        """Get a CN based on this contact's data (full name or company)."""
+        return self._cn
+
+    def get_fingerprint(self) -> str:
+        """Derive a deterministic UUID from all of this contact's data."""
+        data: str = "|".join(str(value) for value in self.get_values())
+        return str(uuid5(NAMESPACE_OID, data))
+
+    def get_key(self) -> str:
+        """Get a stable key to identify this contact across syncs (vCard UID or CN)."""
+        return self._key
+
+    def __eq__(self, other: object) -> bool:
+        """Compare all data of two contacts, unless their hashes already differ."""
+        if not isinstance(other, Contact):
+            return NotImplemented
+        return self is other or (
+            self._hash == other._hash and get_contact_values(self) == get_contact_values(other)
+        )
+
+    def __hash__(self) -> int:
+        """Get the hash computed when this contact was created."""
+        return self._hash
 
     def __repr__(self) -> str:
         """Generate a serialized representation for nice log output."""
-        return f"{self.__class__.__name__}({self.get_cn()})"
+        return f"{self.__class__.__name__}({self._cn})"
+
+
+# Names of all data fields, excluding the values computed from them
+CONTACT_FIELDS: Tuple[str, ...] = tuple(f.name for f in fields(Contact) if f.init)
+get_contact_values: Callable[[Contact], Tuple[Any, ...]] = attrgetter(*CONTACT_FIELDS)
@@ -1,57 +1,213 @@
 """Module contact conversion functions."""
 
+import json
 import logging
-from dataclasses import dataclass
-from typing import Any, Dict, List, Optional, Tuple, Type, Union
-
-from phonenumbers import FrozenPhoneNumber, PhoneNumberFormat, format_number, parse
+from functools import lru_cache
+from hashlib import blake2b
+from sys import intern
+from typing import (
+    Any,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from phonenumbers import (
+    FrozenPhoneNumber,
+    PhoneNumber,
+    PhoneNumberFormat,
+    format_number,
+    format_out_of_country_calling_number,
+    national_significant_number,
+    parse,
+)
 from phonenumbers.phonenumberutil import NumberParseException
 from vobject.base import Component
-from vobject.vcard import Address
 
-from nc2ldap.constants import DEFAULT_REGION, LOG_LEVEL
+from nc2ldap.constants import (
+    DEFAULT_REGION,
+    LDAP_PHONE_KEYS_ATTRIBUTE,
+    LDAP_PHONE_KEYS_SUFFIX_DIGITS,
+    LOG_LEVEL,
+    PHONE_CACHE_SIZE,
+)
 
 from .contact import Contact
+from .vcard import VCard
 
 logger = logging.getLogger(__name__)
 logger.setLevel(LOG_LEVEL)
 
+# All LDAP attributes which are written and read by our converters
+LDAP_CONTACT_ATTRIBUTES: Tuple[str, ...] = (
+    "givenName",
+    "sn",
+    "telephoneNumber",
+    "facsimileTelephoneNumber",
+    "mobile",
+    "homePhone",
+    "o",
+    "street",
+    "l",
+    "title",
+    "mail",
+    "uid",
+)
+
+# LDAP attribute holding a fingerprint of all of the above, used to skip unchanged entries
+LDAP_HASH_ATTRIBUTE: str = "description"
+
+if LDAP_PHONE_KEYS_ATTRIBUTE in (*LDAP_CONTACT_ATTRIBUTES, LDAP_HASH_ATTRIBUTE):
+    raise ValueError(f"Cannot store phone number match keys in {LDAP_PHONE_KEYS_ATTRIBUTE}.")
+
+# A record as written to LDAP, which may contain multi-valued attributes
+LdapRecord = Dict[str, Union[str, List[str]]]
+
+# Compact form of a contact to pass between processes
+ContactTuple = Tuple[Any, ...]
+
+
+@lru_cache(maxsize=PHONE_CACHE_SIZE)
+def parse_phone_number(number: str, region: Optional[str] = None) -> str:
+    """Parse a phone number into the compact form stored in contacts.
+
+    That's E.164, followed by the extension as in RFC 3966. Results are cached, as many numbers
+    recur on every sync.
+    """
+    parsed: PhoneNumber = parse(number, region)
+    e164: str = format_number(parsed, PhoneNumberFormat.E164)
+    return intern(f"{e164};ext={parsed.extension}" if parsed.extension else e164)
+
+
+@lru_cache(maxsize=PHONE_CACHE_SIZE)
+def load_phone_number(number: str) -> FrozenPhoneNumber:
+    """Restore a phone number from its compact form, e.g. to format it."""
+    return FrozenPhoneNumber(parse(number))
+
+
+@lru_cache(maxsize=PHONE_CACHE_SIZE)
+def format_phone_number(number: str) -> str:
+    """Format a phone number in international format; results are cached as well."""
+    return format_number(load_phone_number(number), PhoneNumberFormat.INTERNATIONAL)
+
+
+@lru_cache(maxsize=PHONE_CACHE_SIZE)
+def get_phone_match_keys(number: str) -> Tuple[str, ...]:
+    """Get all forms a phone might look up a number in: E.164, national and digit suffixes.
+
+    Digit suffixes are only added if enabled, as short ones may match several numbers.
+    """
+    parsed: FrozenPhoneNumber = load_phone_number(number)
+    e164: str = format_number(parsed, PhoneNumberFormat.E164)
+    keys: List[str] = [e164, e164.lstrip("+")]
+    if DEFAULT_REGION:
+        keys.append(
+            "".join(
+                c
+                for c in format_out_of_country_calling_number(parsed, DEFAULT_REGION)
+                if c.isdigit()
+            )
+        )
+    national: str = national_significant_number(parsed)
+    if LDAP_PHONE_KEYS_SUFFIX_DIGITS:
+        keys += [
+            national[-length:] for length in range(LDAP_PHONE_KEYS_SUFFIX_DIGITS, len(national) + 1)
+        ]
+    return tuple(dict.fromkeys(keys))
+
+
+def get_phone_cache_info() -> Dict[str, Dict[str, int]]:
+    """Get hit and miss statistics of the phone number caches."""
+    return {
+        "parse": parse_phone_number.cache_info()._asdict(),
+        "load": load_phone_number.cache_info()._asdict(),
+        "format": format_phone_number.cache_info()._asdict(),
+        "match_keys": get_phone_match_keys.cache_info()._asdict(),
+    }
+
 
 def contact_to_ldap_dict(contact: Contact) -> Dict[str, str]:
     """Create a data record an LDAP server can handle."""
 
-    def set_value(result: Dict[str, str], key: str, value: Optional[Any]) -> None:
-        """Add all set values to the result dictionary and format them."""
+    def set_value(result: Dict[str, str], key: str, value: Optional[str]) -> None:
+        """Add all set values to the result dictionary."""
         if value is not None:
-            parsed: str
-            if isinstance(value, FrozenPhoneNumber):
-                parsed = format_number(value, PhoneNumberFormat.INTERNATIONAL)
-            else:
-                parsed = value
-            result.update({key: parsed})
+            result.update({key: value})
+
+    def set_phone(result: Dict[str, str], key: str, value: Optional[str]) -> None:
+        """Add set phone numbers to the result dictionary in international format."""
+        if value is not None:
+            result.update({key: format_phone_number(value)})
 
     result: Dict[str, str] = {}
     set_value(result, "givenName", contact.first_name)
     set_value(result, "sn", contact.last_name)
-    set_value(result, "telephoneNumber", contact.phone_business1)
-    set_value(result, "facsimileTelephoneNumber", contact.phone_business2)
-    set_value(result, "mobile", contact.phone_mobile)
-    set_value(result, "homePhone", contact.phone_private)
+    set_phone(result, "telephoneNumber", contact.phone_business1)
+    set_phone(result, "facsimileTelephoneNumber", contact.phone_business2)
+    set_phone(result, "mobile", contact.phone_mobile)
+    set_phone(result, "homePhone", contact.phone_private)
     set_value(result, "o", contact.company)
     set_value(result, "street", contact.address[0])
     set_value(result, "l", contact.address[1])
     set_value(result, "title", contact.title)
     set_value(result, "mail", contact.email)
+    set_value(result, "uid", contact.uid)
     return result
 
 
+def ldap_dict_hash(data: Mapping[str, Any]) -> str:
+    """Build a stable fingerprint of an LDAP data record."""
+    canonical: str = json.dumps(data, ensure_ascii=False, separators=(",", ":"), sort_keys=True)
+    return blake2b(canonical.encode(), digest_size=16).hexdigest()
+
+
+def contact_hash(contact: Contact) -> str:
+    """Build a stable fingerprint of a contact's canonical LDAP data."""
+    return str(contact_to_ldap_record(contact)[LDAP_HASH_ATTRIBUTE])
+
+
+def contact_to_ldap_record(contact: Contact) -> LdapRecord:
+    """Create an LDAP data record including phone number match keys and a fingerprint."""
+    result: LdapRecord = dict(contact_to_ldap_dict(contact))
+    if LDAP_PHONE_KEYS_ATTRIBUTE:
+        keys: Dict[str, None] = {}
+        for number in (
+            contact.phone_private,
+            contact.phone_mobile,
+            contact.phone_business1,
+            contact.phone_business2,
+        ):
+            if number is not None:
+                keys.update(dict.fromkeys(get_phone_match_keys(number)))
+        if keys:
+            result[LDAP_PHONE_KEYS_ATTRIBUTE] = list(keys)
+    result[LDAP_HASH_ATTRIBUTE] = ldap_dict_hash(result)
+    return result
+
+
+def contact_to_tuple(contact: Contact) -> ContactTuple:
+    """Serialize a contact into a compact tuple of strings."""
+    return contact.get_values()
+
+
+def contact_from_tuple(data: ContactTuple) -> Contact:
+    """Restore a contact serialized by `contact_to_tuple`."""
+    return Contact(*data)
+
+
 def contact_from_ldap_dict(data: Dict[str, Any]) -> Contact:
     """Create a contact based on data from an LDAP server."""
 
-    def get_field(attr: Dict[str, Any], key: str, value_type: Type[Any] = str) -> Optional[Any]:
+    def get_field(attr: Dict[str, Any], key: str, is_phone: bool = False) -> Optional[str]:
         """Fetch/cast an LDAP attribute, which might be wrapped in a list."""
         wrapper_or_value: Optional[Union[List[str], str]] = attr.get(key)
-        if wrapper_or_value is None:
+        if wrapper_or_value is None or wrapper_or_value == []:
             return None
 
         # Extract value if wrapped in a list
@@ -67,9 +223,9 @@ def contact_from_ldap_dict(data: Dict[str, Any]) -> Contact:
             value = wrapper_or_value
         value = value.strip()
 
-        if value_type == FrozenPhoneNumber:
+        if is_phone:
             try:
-                return FrozenPhoneNumber(parse(value))
+                return parse_phone_number(value)
             except NumberParseException:
                 return None
         return value
@@ -81,151 +237,181 @@ def contact_from_ldap_dict(data: Dict[str, Any]) -> Contact:
         email=get_field(data, "mail"),
         company=get_field(data, "o"),
         title=get_field(data, "title"),
-        phone_private=get_field(data, "homePhone", FrozenPhoneNumber),
-        phone_mobile=get_field(data, "mobile", FrozenPhoneNumber),
-        phone_business1=get_field(data, "telephoneNumber", FrozenPhoneNumber),
-        phone_business2=get_field(data, "facsimileTelephoneNumber", FrozenPhoneNumber),
+        phone_private=get_field(data, "homePhone", is_phone=True),
+        phone_mobile=get_field(data, "mobile", is_phone=True),
+        phone_business1=get_field(data, "telephoneNumber", is_phone=True),
+        phone_business2=get_field(data, "facsimileTelephoneNumber", is_phone=True),
+        uid=get_field(data, "uid"),
     )
 
 
-def contact_from_vcard(vcard: Component) -> Contact:
-    """Fetch contact data from a vCard data structure."""
-    # pylint: disable=too-many-locals
+class TypedValue:
+    """A property value along with its lowercase TYPE parameters."""
+
+    __slots__ = ("types", "value")
+
+    def __init__(self, types: FrozenSet[str], value: Any) -> None:
+        self.types: FrozenSet[str] = types
+        self.value: Any = value
 
-    @dataclass(frozen=True)
-    class ValueAttrList:
-        """Class for easy handling of values with specific attributes."""
+    def __repr__(self) -> str:
+        """Show the value and its types for log output."""
+        return f"{self.value!r} ({', '.join(sorted(self.types))})"
 
-        attr_list: List[str]
-        value: Any
 
-        def has_attr(self, type_str: str) -> bool:
-            """Check whether this field has a specific attribute."""
-            return type_str.lower() in (t.lower() for t in self.attr_list)
+# Sets of lowercase TYPE parameters are shared by all properties using the same ones
+NO_TYPES: FrozenSet[str] = frozenset()
 
-    def get_fields(vcard: Component, key: str) -> List[ValueAttrList]:
-        """Get field list for a specific key with associated attributes."""
+
+class VCardConverter:
+    """Convert vCards into contacts, classifying their properties by type in a single pass.
+
+    Of several properties of the same kind, the last matching one wins.
+    """
+
+    def __init__(self, region: Optional[str] = DEFAULT_REGION) -> None:
+        """Set up a converter parsing phone numbers in a default region."""
+        self.region: Optional[str] = region
+        self.type_sets: Dict[Tuple[str, ...], FrozenSet[str]] = {}
+
+    def get_types(self, item: Any) -> FrozenSet[str]:
+        """Get the lowercase TYPE parameters of a property, computed once per distinct list."""
+        if not item.params:
+            return NO_TYPES
+        params: Tuple[str, ...] = tuple(item.type_paramlist)
+        types: Optional[FrozenSet[str]] = self.type_sets.get(params)
+        if types is None:
+            types = self.type_sets[params] = frozenset(t.lower() for t in params)
+        return types
+
+    def get_values(self, vcard: Union[Component, VCard], key: str) -> List[TypedValue]:
+        """Get all properties of a kind with their types."""
         return [
-            ValueAttrList(
-                [] if not item.params else item.type_paramlist,  # type: ignore
-                item.value,  # type: ignore
-            )
+            TypedValue(self.get_types(item), item.value)  # type: ignore
             for item in vcard.contents.get(key, [])
         ]
 
-    def take_field_with_attr(
-        fields: List[ValueAttrList], attr: str
-    ) -> Tuple[Any, List[ValueAttrList]]:
-        """Assign a specific value with attribute matching criteria."""
-        filtered: List[ValueAttrList] = list(filter(lambda x: x.has_attr(attr), fields))
-        if not filtered:
-            return (None, fields)
-
-        target: Any = filtered.pop()
-        if filtered:
-            logger.warning(
-                "Found multiple '%s' attributes in vCard for %s: %s",
-                attr,
-                vcard.fn.value,
-                filtered,
-            )
-        fields.remove(target)
-        return (target.value, fields)
-
-    def take_first_field(
-        fields: List[ValueAttrList],
-    ) -> Tuple[Any, List[ValueAttrList]]:
-        """Assign the first available attribute."""
-        if not fields:
-            return (None, fields)
-
-        target = fields.pop()
-        if fields:
-            logger.warning(
-                "Found multiple uncategorized attributes in vCard for %s: %s",
-                vcard.fn.value,
-                fields,
-            )
-        return (target.value, fields)
-
-    # Match name and title (Note: The 'sn' attribute is not optional)
-    first_name: Optional[str] = vcard.n.value.given or None
-    last_name: str = (
-        vcard.n.value.family
-        if not isinstance(vcard.n.value.family, list)
-        else ", ".join(str(n).strip() for n in vcard.n.value.family)
-    )
-    title: Optional[str] = vcard.n.value.prefix or None
-
-    # Match address field(s)
-    address: Optional[Address] = None
-    all_addresses: List[ValueAttrList] = get_fields(vcard, "adr")
-    if all_addresses:
-        # If multiple values, take correct one; fall back to uncategorized
-        address, all_addresses = take_field_with_attr(all_addresses, "home")
-        if not address:
-            address, all_addresses = take_first_field(all_addresses)
-
-    # Match organization
-    org: Optional[str] = None
-    all_orgs: List[ValueAttrList] = get_fields(vcard, "org")
-    if all_orgs:
-        one_org: Union[str, List[str]]
-        one_org, all_orgs = take_first_field(all_orgs)
-        org = one_org if isinstance(one_org, str) else one_org.pop()
-
-    # Edge case:
-    # If we've got a company, but no name at all, switch both before import
-    if not any((first_name, last_name)) and org:
-        last_name = org
-        org = None
-
-    # Match mail addresses
-    mail: Optional[str] = None
-    all_mails: List[ValueAttrList] = get_fields(vcard, "email")
-    if all_mails:
-        # If multiple values, take correct one; fall back to uncategorized
-        mail, all_mails = take_field_with_attr(all_mails, "home")
-        if not mail:
-            mail, all_mails = take_first_field(all_mails)
-
-    # Match phone numbers
-    phone_home: Optional[str] = None
-    phone_cell: Optional[str] = None
-    phone_work: Optional[str] = None
-    all_phones: List[ValueAttrList] = list(
-        filter(lambda p: p.has_attr("voice"), get_fields(vcard, "tel"))
-    )
-    if all_phones:
-        # If multiple phone numbers are present, try to find the right ones
-        phone_home, all_phones = take_field_with_attr(all_phones, "home")
-        phone_cell, all_phones = take_field_with_attr(all_phones, "cell")
-        phone_work, all_phones = take_field_with_attr(all_phones, "work")
-
-        # Fall back to any uncategorized phone numbers (home only)
-        if not phone_home:
-            phone_home, all_phones = take_first_field(all_phones)
+    @staticmethod
+    def join_values(value: Union[str, List[str]]) -> str:
+        """Join the values of a name component holding more than one, e.g. several last names."""
+        return value if not isinstance(value, list) else ", ".join(str(v).strip() for v in value)
+
+    @staticmethod
+    def classify(values: List[TypedValue], types: Tuple[str, ...], name: str) -> List[Any]:
+        """Assign the last value of each type, in order of priority, in a single pass.
+
+        Each value is assigned once; if the first type is missing, the last unassigned value
+        is taken instead. Values whose types are all assigned already are reported.
+        """
+        result: List[Any] = [None] * len(types)
+        found: List[bool] = [False] * len(types)
+        skipped: List[List[TypedValue]] = [[] for _ in types]
+        unassigned: List[TypedValue] = []
+        for value in reversed(values):
+            for slot, type_str in enumerate(types):
+                if type_str not in value.types:
+                    continue
+                if not found[slot]:
+                    result[slot] = value.value
+                    found[slot] = True
+                    break
+                skipped[slot].append(value)
+            else:
+                unassigned.append(value)
+
+        for type_str, duplicates in zip(types, skipped):
+            if duplicates:
+                logger.warning(
+                    "Found multiple '%s' attributes in vCard for %s: %s",
+                    type_str,
+                    name,
+                    duplicates[::-1],
+                )
 
-    # Build an actual contact object using all information
-    return Contact(
-        first_name=first_name,
-        last_name=last_name,
-        address=(
-            (None, None)
-            if address is None
-            else (str(address.street), f"{address.code} {address.city}")
-        ),
-        email=mail,
-        company=org,
-        title=title,
-        phone_private=(
-            None if phone_home is None else FrozenPhoneNumber(parse(phone_home, DEFAULT_REGION))
-        ),
-        phone_mobile=(
-            None if phone_cell is None else FrozenPhoneNumber(parse(phone_cell, DEFAULT_REGION))
-        ),
-        phone_business1=(
-            None if phone_work is None else FrozenPhoneNumber(parse(phone_work, DEFAULT_REGION))
-        ),
-        phone_business2=None,
-    )
+        if not result[0]:
+            result[0] = unassigned.pop(0).value if unassigned else None
+            if unassigned:
+                logger.warning(
+                    "Found multiple uncategorized attributes in vCard for %s: %s", name, unassigned
+                )
+        return result
+
+    def convert(self, vcard: Union[Component, VCard]) -> Contact:
+        """Fetch contact data from a vCard data structure."""
+        # pylint: disable=too-many-locals
+        name: Any = vcard.n.value
+        display_name: str = vcard.fn.value if "fn" in vcard.contents else "?"
+
+        # Match name and title (Note: The 'sn' attribute is not optional)
+        first_name: Optional[str] = self.join_values(name.given) or None
+        last_name: str = self.join_values(name.family)
+        title: Optional[str] = self.join_values(name.prefix) or None
+
+        # Match unique identifier, which is used to track contacts across syncs
+        uid: Optional[str] = None
+        if "uid" in vcard.contents:
+            uid = str(vcard.uid.value).strip() or None
+
+        # Match address, mail, organization and phone numbers, preferring home ones
+        (address,) = self.classify(self.get_values(vcard, "adr"), ("home",), display_name)
+        (mail,) = self.classify(self.get_values(vcard, "email"), ("home",), display_name)
+        phone_home, phone_cell, phone_work = self.classify(
+            [p for p in self.get_values(vcard, "tel") if "voice" in p.types],
+            ("home", "cell", "work"),
+            display_name,
+        )
+
+        org: Optional[str] = None
+        all_orgs: List[Any] = vcard.contents.get("org", [])
+        if all_orgs:
+            if len(all_orgs) > 1:
+                logger.warning(
+                    "Found multiple uncategorized attributes in vCard for %s: %s",
+                    display_name,
+                    [o.value for o in all_orgs[:-1]],
+                )
+            one_org: Union[str, List[str]] = all_orgs[-1].value
+            org = one_org if isinstance(one_org, str) else one_org[-1]
+
+        # Edge case:
+        # If we've got a company, but no name at all, switch both before import
+        if not any((first_name, last_name)) and org:
+            last_name = org
+            org = None
+
+        # Build an actual contact object using all information
+        return Contact(
+            first_name=first_name,
+            last_name=last_name,
+            address=(
+                (None, None)
+                if address is None
+                else (str(address.street), f"{address.code} {address.city}")
+            ),
+            email=mail,
+            company=org,
+            title=title,
+            phone_private=(
+                None if phone_home is None else parse_phone_number(phone_home, self.region)
+            ),
+            phone_mobile=(
+                None if phone_cell is None else parse_phone_number(phone_cell, self.region)
+            ),
+            phone_business1=(
+                None if phone_work is None else parse_phone_number(phone_work, self.region)
+            ),
+            phone_business2=None,
+            uid=uid,
+        )
+
+    def convert_many(self, vcards: Iterable[Union[Component, VCard]]) -> Iterator[Contact]:
+        """Convert many vCards, e.g. all of an address book, one after another."""
+        return map(self.convert, vcards)
+
+
+VCARD_CONVERTER: VCardConverter = VCardConverter()
+
+
+def contact_from_vcard(vcard: Union[Component, VCard]) -> Contact:
+    """Fetch contact data from a vCard data structure."""
+    return VCARD_CONVERTER.convert(vcard)
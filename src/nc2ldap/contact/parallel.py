@@ -0,0 +1,73 @@
+"""Module to parse many vCards in parallel on all CPU cores."""
+
+import logging
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import islice
+from multiprocessing import get_context
+from multiprocessing.context import BaseContext
+from threading import Lock
+from typing import Deque, Generator, Iterable, Iterator, List, Optional
+
+from nc2ldap.constants import LOG_LEVEL, NEXTCLOUD_PARSE_CHUNK_SIZE, NEXTCLOUD_PARSE_WORKERS
+
+from .contact import Contact
+from .converters import VCARD_CONVERTER, ContactTuple, contact_from_tuple, contact_to_tuple
+from .vcard import read_vcard
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+
+def parse_chunk(vcards: List[str]) -> List[ContactTuple]:
+    """Parse a chunk of raw vCards in a worker process, returning compact tuples."""
+    return [
+        contact_to_tuple(contact)
+        for contact in VCARD_CONVERTER.convert_many(read_vcard(vcard) for vcard in vcards)
+    ]
+
+
+class ParsePool:
+    """A pool of worker processes parsing raw vCards in chunks, keeping their order."""
+
+    def __init__(self, workers: int, chunk_size: int = NEXTCLOUD_PARSE_CHUNK_SIZE) -> None:
+        """Start the workers from a fork server, which is safe with threads running."""
+        context: BaseContext = get_context("forkserver")
+        context.set_forkserver_preload(["nc2ldap.contact"])
+        self.workers: int = max(1, workers)
+        self.chunk_size: int = max(1, chunk_size)
+        self.executor: ProcessPoolExecutor = ProcessPoolExecutor(self.workers, mp_context=context)
+        logger.info("Parsing vCards with %i worker processes.", self.workers)
+
+    def parse(self, vcards: Iterable[str]) -> Generator[Contact, None, None]:
+        """Parse raw vCards in the order given, with a bounded number of chunks in flight."""
+        remaining: Iterator[str] = iter(vcards)
+        pending: Deque[Future[List[ContactTuple]]] = deque()
+        while True:
+            while len(pending) < 2 * self.workers and (
+                chunk := list(islice(remaining, self.chunk_size))
+            ):
+                pending.append(self.executor.submit(parse_chunk, chunk))
+            if not pending:
+                return
+            for data in pending.popleft().result():
+                yield contact_from_tuple(data)
+
+    def close(self) -> None:
+        """Stop all worker processes."""
+        self.executor.shutdown(cancel_futures=True)
+
+
+PARSE_POOL: Optional[ParsePool] = None
+PARSE_POOL_LOCK: Lock = Lock()
+
+
+def get_parse_pool() -> Optional[ParsePool]:
+    """Get the shared pool of parser processes, if parsing in parallel is enabled."""
+    global PARSE_POOL  # pylint: disable=global-statement
+    if NEXTCLOUD_PARSE_WORKERS < 2:
+        return None
+    with PARSE_POOL_LOCK:
+        if PARSE_POOL is None:
+            PARSE_POOL = ParsePool(NEXTCLOUD_PARSE_WORKERS)
+        return PARSE_POOL
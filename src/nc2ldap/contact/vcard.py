@@ -0,0 +1,143 @@
+"""Module for a fast, lightweight vCard parser with fallback to vobject."""
+
+import logging
+import re
+from typing import Any, Dict, List, Optional, Union
+
+from vobject.base import Component, readOne
+from vobject.vcard import stringToTextValues  # type: ignore[attr-defined]
+from vobject.vcard import ADDRESS_ORDER, NAME_ORDER, Address, Name, splitFields
+
+from nc2ldap.constants import LOG_LEVEL
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+# Properties read by our converters; all others are skipped without being decoded
+RELEVANT_PROPERTIES = frozenset(("n", "fn", "uid", "org", "adr", "email", "tel"))
+SUPPORTED_VERSIONS = frozenset(("3.0", "4.0"))
+UNSUPPORTED_PARAMS = frozenset(("ENCODING", "CHARSET"))
+
+FOLDING_RE = re.compile(r"(?:\r\n|\r|\n)[\t ]")
+QUOTED_PRINTABLE_RE = re.compile("quoted-printable", re.IGNORECASE)
+
+
+class VCardLine:
+    """A single vCard property, compatible with the parts of vobject's ContentLine we use."""
+
+    __slots__ = ("value", "params")
+
+    def __init__(self, value: Any, params: Dict[str, List[str]]) -> None:
+        self.value: Any = value
+        self.params: Dict[str, List[str]] = params
+
+    @property
+    def type_paramlist(self) -> List[str]:
+        """Get all values of the TYPE parameter."""
+        return self.params.get("TYPE", [])
+
+
+class VCard:
+    """A parsed vCard, compatible with the parts of vobject's Component we use."""
+
+    __slots__ = ("contents",)
+
+    def __init__(self, contents: Dict[str, List[VCardLine]]) -> None:
+        self.contents: Dict[str, List[VCardLine]] = contents
+
+    def __getattr__(self, name: str) -> VCardLine:
+        """Get the first property with a given name, just like vobject does."""
+        try:
+            return self.contents[name][0]
+        except KeyError:
+            raise AttributeError(name) from None
+
+
+def _split(value: str, separator: str) -> List[str]:
+    """Split an unescaped value the same way vobject does, dropping a trailing empty item."""
+    parts: List[str] = value.split(separator)
+    return parts[:-1] if len(parts) > 1 and not parts[-1] else parts
+
+
+def _split_fields(value: str) -> List[Union[str, List[str]]]:
+    """Split a structured value into fields of strings or lists of strings."""
+    if "\\" in value:
+        return splitFields(value)
+    result: List[Union[str, List[str]]] = []
+    for field in _split(value, ";"):
+        items: List[str] = _split(field, ",")
+        result.append(items[0] if len(items) == 1 else items)
+    return result
+
+
+def _decode(name: str, value: str) -> Any:
+    """Decode a property value into the same native type vobject would use."""
+    if name == "n":
+        return Name(**dict(zip(NAME_ORDER, _split_fields(value))))
+    if name == "adr":
+        return Address(**dict(zip(ADDRESS_ORDER, _split_fields(value))))
+    if name == "org":
+        return _split_fields(value)
+    if "\\" in value:
+        return stringToTextValues(value)[0]
+    return value.split(",", 1)[0]
+
+
+def parse_vcard(text: str) -> Optional[VCard]:
+    """Parse a single vCard quickly, or return None if it needs a full-fledged parser."""
+    # pylint: disable=too-many-return-statements,too-many-branches
+    if QUOTED_PRINTABLE_RE.search(text):
+        return None
+
+    contents: Dict[str, List[VCardLine]] = {}
+    nesting: int = 0
+    finished: bool = False
+    for line in FOLDING_RE.sub("", text).splitlines():
+        if not line.strip():
+            continue
+        if finished:
+            return None  # Trailing data or multiple vCards
+
+        head, colon, value = line.partition(":")
+        if not colon:
+            return None
+        head_parts: List[str] = head.split(";")
+        name: str = head_parts[0].rpartition(".")[2].lower()
+
+        if nesting == 0 and name != "begin":
+            return None
+        if name == "begin":
+            nesting += 1
+            if nesting > 1 or value.lower() != "vcard":
+                return None
+        elif name == "end":
+            finished = True
+        elif name == "version":
+            if value.strip() not in SUPPORTED_VERSIONS:
+                return None
+        elif name in RELEVANT_PROPERTIES:
+            if '"' in head or value.endswith("\\"):
+                return None
+            params: Dict[str, List[str]] = {}
+            for param in head_parts[1:]:
+                key, equals, param_value = param.partition("=")
+                if not equals:
+                    continue  # Singleton parameters are not exposed by vobject either
+                key = key.upper()
+                if key in UNSUPPORTED_PARAMS:
+                    return None
+                params.setdefault(key, []).extend(param_value.split(","))
+            contents.setdefault(name, []).append(VCardLine(_decode(name, value), params))
+
+    if not finished or "n" not in contents or "fn" not in contents:
+        return None
+    return VCard(contents)
+
+
+def read_vcard(text: str) -> Union[VCard, Component]:
+    """Parse a single vCard, using the fast parser where possible and vobject otherwise."""
+    vcard: Optional[VCard] = parse_vcard(text)
+    if vcard is not None:
+        return vcard
+    logger.debug("Falling back to vobject for parsing a vCard.")
+    return readOne(text)
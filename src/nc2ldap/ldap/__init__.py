@@ -1,5 +1,23 @@
 """Module for LDAP server related operations and interfaces."""
 
+from .batch_writer import WriteFailure
+from .diff import ContactDiff, PhoneBookEntry, StreamingDiff, diff_contacts
+from .indexes import setup_indexes
+from .ldif import load_ldif, write_ldif
 from .phone_book import PhoneBook
+from .pool import ConnectionPool
+from .snapshot import Snapshot
 
-__ALL__ = (PhoneBook,)
+__ALL__ = (
+    ConnectionPool,
+    ContactDiff,
+    PhoneBook,
+    PhoneBookEntry,
+    Snapshot,
+    StreamingDiff,
+    WriteFailure,
+    diff_contacts,
+    load_ldif,
+    setup_indexes,
+    write_ldif,
+)
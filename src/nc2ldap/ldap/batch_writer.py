@@ -0,0 +1,64 @@
+"""Module to pipeline many LDAP write operations over an asynchronous connection."""
+
+import logging
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, List, Tuple
+
+from ldap3 import Connection
+from ldap3.core.exceptions import LDAPException
+
+from nc2ldap.constants import LOG_LEVEL
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+
+@dataclass(frozen=True)
+class WriteFailure:
+    """A write operation which has been rejected by the LDAP server."""
+
+    operation: str
+    dn: str
+    description: str
+
+
+class BatchWriter:
+    """Keep a window of write operations in flight and collect their results afterwards."""
+
+    def __init__(self, connection: Connection, window: int) -> None:
+        """Set up a writer for a connection using an asynchronous client strategy."""
+        self.connection: Connection = connection
+        self.window: int = max(1, window)
+        self.in_flight: Deque[Tuple[int, str, str]] = deque()
+        self.failures: List[WriteFailure] = []
+        self.count: int = 0
+
+    def submit(self, dn: str, operation: Callable[..., Any], *args: Any, **kwargs: Any) -> None:
+        """Send an operation (e.g. `connection.add`) without waiting for its result."""
+        if len(self.in_flight) >= self.window:
+            self.collect()
+        message_id: int = operation(dn, *args, **kwargs)
+        self.in_flight.append((message_id, operation.__name__, dn))
+        self.count += 1
+
+    def collect(self) -> None:
+        """Wait for the result of the oldest operation in flight."""
+        message_id, operation, dn = self.in_flight.popleft()
+        try:
+            _response, result = self.connection.get_response(message_id)
+            if result["result"] != 0:
+                self.fail(operation, dn, f"{result['description']} {result['message']}".strip())
+        except LDAPException as err:
+            self.fail(operation, dn, str(err))
+
+    def flush(self) -> None:
+        """Wait for all operations in flight, e.g. before sending dependent ones."""
+        while self.in_flight:
+            self.collect()
+
+    def fail(self, operation: str, dn: str, description: str) -> None:
+        """Record and report a failed operation."""
+        failure: WriteFailure = WriteFailure(operation, dn, description)
+        self.failures.append(failure)
+        logger.error("LDAP %s of %s failed: %s", operation, dn, description)
@@ -0,0 +1,214 @@
+"""Module to compute minimal changes between the phone book and a set of contacts."""
+
+import logging
+from dataclasses import dataclass, field
+from hashlib import blake2b
+from typing import Any, Dict, Generator, Iterable, List, Mapping, Optional, Set, Tuple, Union
+
+from ldap3 import MODIFY_REPLACE
+
+from nc2ldap.constants import LDAP_PHONE_KEYS_ATTRIBUTE, LOG_LEVEL
+from nc2ldap.contact import (
+    LDAP_CONTACT_ATTRIBUTES,
+    LDAP_HASH_ATTRIBUTE,
+    Contact,
+    LdapRecord,
+    contact_hash,
+)
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+AttributeChanges = Dict[str, List[Tuple[str, List[str]]]]
+
+# All attributes of an entry which are written by a sync
+MANAGED_ATTRIBUTES: Tuple[str, ...] = (
+    *LDAP_CONTACT_ATTRIBUTES,
+    LDAP_HASH_ATTRIBUTE,
+    "cn",
+    *((LDAP_PHONE_KEYS_ATTRIBUTE,) if LDAP_PHONE_KEYS_ATTRIBUTE else ()),
+)
+
+
+def hash_attributes(attributes: Mapping[str, Any]) -> str:
+    """Build short fingerprints of all managed attributes of an entry, e.g. "sn=0123...,..."."""
+    values: Dict[str, Any] = {name.lower(): value for name, value in attributes.items()}
+    parts: List[str] = []
+    for name in sorted(n.lower() for n in MANAGED_ATTRIBUTES):
+        value: Any = values.get(name)
+        if value:
+            items: List[str] = sorted(
+                str(v) for v in (value if isinstance(value, list) else [value])
+            )
+            digest: str = blake2b("\0".join(items).encode(), digest_size=8).hexdigest()
+            parts.append(f"{name}={digest}")
+    return ",".join(parts)
+
+
+def make_key(uid: Optional[str], cn: str, content_hash: Optional[str]) -> str:
+    """Build the key matching contacts with entries: the vCard UID, or the CN and content hash.
+
+    Without UID, only their content tells apart contacts sharing a name; changing it makes
+    the contact a new one.
+    """
+    return uid or f"{cn}\0{content_hash or ''}"
+
+
+def get_contact_key(contact: Contact) -> str:
+    """Get the key matching a contact with its phone book entry, see `make_key`."""
+    return make_key(contact.uid, contact.get_cn(), None if contact.uid else contact_hash(contact))
+
+
+@dataclass(frozen=True)
+class PhoneBookEntry:
+    """An existing phone book entry, reduced to what is needed to detect changes.
+
+    The CN is the stored contact's own, without the suffix its DN may have. Attribute hashes,
+    see `hash_attributes`, tell which attributes an update needs to replace.
+    """
+
+    dn: str
+    cn: str
+    uid: Optional[str] = None
+    content_hash: Optional[str] = None
+    attribute_hashes: Optional[str] = None
+
+    @classmethod
+    def written(cls, dn: str, contact: Contact, record: LdapRecord) -> "PhoneBookEntry":
+        """Get the entry of a contact as written to the phone book."""
+        return cls(
+            dn,
+            contact.get_cn(),
+            contact.uid,
+            str(record[LDAP_HASH_ATTRIBUTE]),
+            hash_attributes(record),
+        )
+
+    def get_key(self) -> str:
+        """Get the stable key of the stored contact, see `make_key`."""
+        return make_key(self.uid, self.cn, self.content_hash)
+
+
+# An entry to update with a contact, or None to add the contact
+Change = Tuple[Optional[PhoneBookEntry], Contact]
+
+
+@dataclass
+class ContactDiff:
+    """Contacts to add, entries to delete and entries to update with new contacts."""
+
+    added: List[Contact] = field(default_factory=list)
+    deleted: List[PhoneBookEntry] = field(default_factory=list)
+    updated: List[Tuple[PhoneBookEntry, Contact]] = field(default_factory=list)
+
+
+class StreamingDiff:
+    """Match contacts against the phone book one by one, while they are still arriving.
+
+    Only the entries of the phone book and the keys of contacts seen so far are kept.
+    """
+
+    def __init__(self, current: Iterable[PhoneBookEntry]) -> None:
+        """Index the current entries of the phone book by their stable key."""
+        self.existing: Dict[str, PhoneBookEntry] = {}
+        self.duplicates: List[PhoneBookEntry] = []
+        self.seen: Set[str] = set()
+        self.added: int = 0
+        self.updated: int = 0
+        for entry in current:
+            key: str = entry.get_key()
+            if key in self.existing:
+                logger.warning("Found duplicate entry %s in phone book.", entry.dn)
+                self.duplicates.append(entry)
+            else:
+                self.existing[key] = entry
+
+    def match(self, contact: Contact) -> Optional[Change]:
+        """Get the entry to update with a contact (None to add it), or None if up to date."""
+        new_hash: str = contact_hash(contact)
+        key: str = make_key(contact.uid, contact.get_cn(), new_hash)
+        if key in self.seen:
+            logger.warning("Ignoring duplicate upstream contact %s.", contact)
+            return None
+        self.seen.add(key)
+
+        old: Optional[PhoneBookEntry] = self.existing.pop(key, None)
+        if old is None:
+            self.added += 1
+            return None, contact
+        if old.content_hash != new_hash:
+            self.updated += 1
+            return old, contact
+        return None
+
+    def match_all(self, target: Iterable[Contact]) -> Generator[Change, None, None]:
+        """Match contacts one by one, passing on those which need to be written."""
+        for contact in target:
+            change: Optional[Change] = self.match(contact)
+            if change is not None:
+                yield change
+
+    def get_deleted(self) -> List[PhoneBookEntry]:
+        """Get all entries to delete, once all contacts have been matched."""
+        return self.duplicates + list(self.existing.values())
+
+    @property
+    def changes(self) -> int:
+        """Get the number of entries to add, update or delete."""
+        return self.added + self.updated + len(self.duplicates) + len(self.existing)
+
+
+def unique_contacts(contacts: Iterable[Contact]) -> Generator[Contact, None, None]:
+    """Pass on contacts, skipping those with the key of an earlier one like `StreamingDiff`."""
+    seen: Set[str] = set()
+    for contact in contacts:
+        key: str = get_contact_key(contact)
+        if key in seen:
+            logger.warning("Ignoring duplicate upstream contact %s.", contact)
+            continue
+        seen.add(key)
+        yield contact
+
+
+def diff_contacts(current: Iterable[PhoneBookEntry], target: Iterable[Contact]) -> ContactDiff:
+    """Match contacts on their stable key and compare only their content hashes."""
+    result: ContactDiff = ContactDiff()
+    stream: StreamingDiff = StreamingDiff(current)
+    for old, new in stream.match_all(target):
+        if old is None:
+            result.added.append(new)
+        else:
+            result.updated.append((old, new))
+    result.deleted = stream.get_deleted()
+    return result
+
+
+def replace_attributes(
+    record: LdapRecord, old: Optional[PhoneBookEntry] = None
+) -> AttributeChanges:
+    """Build LDAP modify changes replacing the contact attributes of an entry with a record.
+
+    Only attributes differing from the old entry are replaced, if its attribute hashes are known;
+    those not set in the record are removed. CNs are replaced only if the record has any, see
+    `get_naming_values`.
+    """
+    old_hashes: Optional[Dict[str, str]] = None
+    new_hashes: Dict[str, str] = {}
+    if old is not None and old.attribute_hashes is not None:
+        old_hashes = parse_attribute_hashes(old.attribute_hashes)
+        new_hashes = parse_attribute_hashes(hash_attributes(record))
+
+    changes: AttributeChanges = {}
+    for key in MANAGED_ATTRIBUTES:
+        if key == "cn" and key not in record:
+            continue
+        if old_hashes is not None and old_hashes.get(key.lower()) == new_hashes.get(key.lower()):
+            continue
+        value: Union[str, List[str]] = record.get(key, [])
+        changes[key] = [(MODIFY_REPLACE, value if isinstance(value, list) else [value])]
+    return changes
+
+
+def parse_attribute_hashes(attribute_hashes: str) -> Dict[str, str]:
+    """Get the fingerprints of all attributes by lowercase name, see `hash_attributes`."""
+    return dict(part.split("=", 1) for part in attribute_hashes.split(",") if part)
@@ -0,0 +1,139 @@
+"""Module to allocate deterministic, collision-free DNs for phone book entries."""
+
+import logging
+import re
+from typing import Dict, Iterable, List, Optional
+
+from ldap3.utils.dn import escape_rdn
+
+from nc2ldap.constants import LOG_LEVEL
+from nc2ldap.contact import Contact
+
+from .diff import get_contact_key
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+ESCAPED_CHAR: re.Pattern = re.compile(rb"\\(?:([0-9a-fA-F]{2})|(.))", re.DOTALL)
+FIRST_RDN_VALUE: re.Pattern = re.compile(r"[^=]*=((?:\\.|[^,\\])*)", re.DOTALL)
+
+
+def unescape_rdn(value: str) -> str:
+    """Revert the escaping of special characters and UTF-8 bytes in an RDN value."""
+    return ESCAPED_CHAR.sub(
+        lambda m: bytes.fromhex(m[1].decode()) if m[1] else m[2], value.encode()
+    ).decode(errors="replace")
+
+
+def get_rdn(dn: str) -> str:
+    """Get the first RDN of a DN, e.g. "cn=Joey Doe"."""
+    match: Optional[re.Match] = FIRST_RDN_VALUE.match(dn)
+    return match[0] if match else dn
+
+
+def get_rdn_value(dn: str) -> str:
+    """Get the unescaped value of the first RDN of a DN, e.g. the CN of a contact."""
+    match: Optional[re.Match] = FIRST_RDN_VALUE.match(dn)
+    return unescape_rdn(match[1]) if match else dn
+
+
+def get_naming_values(dn: str, contact: Contact) -> List[str]:
+    """Get the CNs to store in an entry: that of its DN, and the contact's own if it differs.
+
+    The contact's own CN tells which contact an entry holds, if its DN needed a suffix.
+    """
+    rdn_value: str = get_rdn_value(dn)
+    cn: str = contact.get_cn()
+    return [rdn_value] if rdn_value.lower() == cn.lower() else [rdn_value, cn]
+
+
+def get_contact_cn(dn: str, values: Optional[Iterable[str]]) -> str:
+    """Get the contact's own CN from the CNs stored in an entry, see `get_naming_values`."""
+    rdn_value: str = get_rdn_value(dn)
+    others: List[str] = [v for v in values or () if v.lower() != rdn_value.lower()]
+    return others[0] if others else rdn_value
+
+
+class DnIndex:
+    """Index of all DNs in the phone book and the keys of the contacts stored there."""
+
+    def __init__(self, base: str) -> None:
+        """Start with an empty phone book below a base DN."""
+        self.base: str = base
+        self.keys: Dict[str, str] = {}  # DN -> contact key
+        self.dns: Dict[str, str] = {}  # contact key -> DN
+        self.owners: Dict[str, str] = {}  # CN (case-insensitive) -> contact key
+
+    def __len__(self) -> int:
+        """Get the number of indexed entries."""
+        return len(self.keys)
+
+    def clear(self) -> None:
+        """Forget all entries, e.g. before reading the phone book again."""
+        self.keys.clear()
+        self.dns.clear()
+        self.owners.clear()
+
+    def add(self, dn: str, key: str) -> None:
+        """Register an existing entry."""
+        self.keys[dn] = key
+        self.dns.setdefault(key, dn)
+        self.owners.setdefault(get_rdn_value(dn).lower(), key)
+
+    def remove(self, dn: str) -> None:
+        """Unregister a deleted or renamed entry, releasing its CN."""
+        key: Optional[str] = self.keys.pop(dn, None)
+        if key is None:
+            return
+        if self.dns.get(key) == dn:
+            del self.dns[key]
+        cn: str = get_rdn_value(dn).lower()
+        if self.owners.get(cn) == key:
+            del self.owners[cn]
+
+    def get_key(self, dn: str) -> Optional[str]:
+        """Get the key of the contact stored at a DN."""
+        return self.keys.get(dn)
+
+    def get_dn(self, key: str) -> Optional[str]:
+        """Get the DN of the entry storing a contact."""
+        return self.dns.get(key)
+
+    def is_taken(self, cn: str) -> bool:
+        """Check whether an entry uses a CN already."""
+        return cn.lower() in self.owners
+
+    def get_current(self, contact: Contact) -> Optional[str]:
+        """Get the current DN of a contact, if it still matches its name."""
+        current: Optional[str] = self.dns.get(get_contact_key(contact))
+        if current is not None:
+            cn: str = contact.get_cn()
+            if re.fullmatch(rf"{re.escape(cn)}( \(\d+\))?", get_rdn_value(current), re.I):
+                return current
+        return None
+
+    def allocate(self, contact: Contact) -> str:
+        """Get the DN for a contact, keeping its current one if it still matches its name.
+
+        Contacts with the same CN are told apart by a numeric suffix, e.g. "Joey Doe (2)".
+        Suffixes are stable, as entries keep their DN as long as their CN does not change.
+        A former DN of the contact stays reserved until it is removed after renaming.
+        """
+        current: Optional[str] = self.get_current(contact)
+        if current is not None:
+            return current
+
+        key: str = get_contact_key(contact)
+        cn: str = contact.get_cn()
+        candidate: str = cn
+        suffix: int = 1
+        while self.owners.get(candidate.lower(), key) != key:
+            suffix += 1
+            candidate = f"{cn} ({suffix})"
+        if suffix > 1:
+            logger.info("Found %i contacts named %s, using CN %s.", suffix, cn, candidate)
+
+        dn: str = f"cn={escape_rdn(candidate)},{self.base}"
+        self.add(dn, key)
+        self.dns[key] = dn
+        return dn
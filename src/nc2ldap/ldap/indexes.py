@@ -0,0 +1,124 @@
+"""Module to manage the slapd indexes needed for fast phone book lookups."""
+
+import logging
+from typing import Any, Dict, List, Optional, Set
+
+from ldap3 import EXTERNAL, MODIFY_REPLACE, SASL, Connection, Server
+from ldap3.core.exceptions import LDAPException
+
+from nc2ldap.constants import LDAP_PHONE_KEYS_ATTRIBUTE, LOG_LEVEL
+from nc2ldap.contact import LDAP_CONTACT_ATTRIBUTES
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+CONFIG_BASE: str = "cn=config"
+
+# Phones look up callers by number and contacts by (parts of) their name
+SUBSTRING_ATTRIBUTES: Set[str] = {
+    "cn",
+    "sn",
+    "givenName",
+    "o",
+    "mail",
+    "telephoneNumber",
+    "facsimileTelephoneNumber",
+    "mobile",
+    "homePhone",
+}
+
+# Index types of all attributes we write, along with the ones every search filters on
+WANTED_INDEXES: Dict[str, Set[str]] = {
+    "objectClass": {"eq"},
+    "cn": {"eq", "sub"},
+    **{
+        attribute: {"eq", "sub"} if attribute in SUBSTRING_ATTRIBUTES else {"eq"}
+        for attribute in LDAP_CONTACT_ATTRIBUTES
+    },
+    **({LDAP_PHONE_KEYS_ATTRIBUTE: {"eq"}} if LDAP_PHONE_KEYS_ATTRIBUTE else {}),
+}
+
+
+def parse_db_index(values: List[str]) -> Dict[str, Set[str]]:
+    """Parse olcDbIndex values like "cn,uid eq,sub" into index types per attribute."""
+    result: Dict[str, Set[str]] = {}
+    for value in values:
+        attributes, _, types = value.strip().partition(" ")
+        for attribute in attributes.split(","):
+            result.setdefault(attribute.strip(), set()).update(
+                t.strip() for t in types.split(",") if t.strip()
+            )
+    return result
+
+
+def format_db_index(indexes: Dict[str, Set[str]]) -> List[str]:
+    """Format index types per attribute as olcDbIndex values, one per attribute."""
+    return [
+        f"{attribute} {','.join(sorted(types))}" if types else attribute
+        for attribute, types in indexes.items()
+    ]
+
+
+def find_database(connection: Connection, base: str) -> Optional[Dict[str, Any]]:
+    """Find the configuration entry of the database holding a DN (the longest suffix)."""
+    result: Optional[Dict[str, Any]] = None
+    length: int = -1
+    for entry in connection.extend.standard.paged_search(
+        CONFIG_BASE,
+        "(olcSuffix=*)",
+        attributes=["olcSuffix", "olcDbIndex"],
+        generator=False,
+    ):
+        for suffix in entry["attributes"].get("olcSuffix", []):
+            if base.lower().endswith(suffix.lower()) and len(suffix) > length:
+                result, length = entry, len(suffix)
+    return result
+
+
+def ensure_indexes(
+    connection: Connection, base: str, wanted: Optional[Dict[str, Set[str]]] = None
+) -> Dict[str, Set[str]]:
+    """Add missing indexes to the database holding a phone book and return all of them."""
+    database: Optional[Dict[str, Any]] = find_database(connection, base)
+    if database is None:
+        raise LookupError(f"Found no database configuration for {base}.")
+
+    current: Dict[str, Set[str]] = parse_db_index(database["attributes"].get("olcDbIndex", []))
+    indexes: Dict[str, Set[str]] = {key: set(value) for key, value in current.items()}
+    for attribute, types in (wanted or WANTED_INDEXES).items():
+        indexes.setdefault(attribute, set()).update(types)
+
+    if indexes != current:
+        missing: List[str] = format_db_index(
+            {
+                key: value - current.get(key, set())
+                for key, value in indexes.items()
+                if value - current.get(key, set())
+            }
+        )
+        result: Any = connection.modify(
+            database["dn"], {"olcDbIndex": [(MODIFY_REPLACE, format_db_index(indexes))]}
+        )
+        # Thread-safe connections return a (status, result, response, request) tuple
+        if not (result[0] if isinstance(result, tuple) else result):
+            raise LDAPException(f"Could not update indexes of {database['dn']}: {result}")
+        logger.info("Added indexes to %s: %s.", database["dn"], "; ".join(missing))
+    return indexes
+
+
+def setup_indexes(config_host: str, base: str) -> None:
+    """Ensure all indexes via cn=config (as local root, using SASL EXTERNAL) and log them."""
+    try:
+        connection: Connection = Connection(
+            Server(config_host),
+            authentication=SASL,
+            sasl_mechanism=EXTERNAL,
+            client_strategy="SAFE_SYNC",
+            auto_bind=True,
+        )
+        indexes: Dict[str, Set[str]] = ensure_indexes(connection, base)
+        connection.unbind()
+    except (LDAPException, LookupError) as err:
+        logger.warning("Could not check LDAP indexes for %s, lookups may be slow: %s", base, err)
+        return
+    logger.info("LDAP indexes for %s: %s.", base, "; ".join(format_db_index(indexes)))
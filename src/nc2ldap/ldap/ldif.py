@@ -0,0 +1,88 @@
+"""Module to export phone books as LDIF and bulk load them with ldapadd."""
+
+import logging
+import re
+import subprocess
+from base64 import b64encode
+from tempfile import NamedTemporaryFile
+from typing import IO, Iterable, List, Union
+
+from nc2ldap.constants import LOG_LEVEL
+from nc2ldap.contact import Contact, LdapRecord, contact_to_ldap_record
+
+from .diff import PhoneBookEntry, get_contact_key, unique_contacts
+from .dn_index import DnIndex, get_naming_values, get_rdn, get_rdn_value
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+# Values that may be written as they are, see SAFE-STRING in RFC 2849
+SAFE_INIT_CHAR: str = r"[\x01-\x09\x0b\x0c\x0e-\x1f\x21-\x39\x3b\x3d-\x7f]"
+SAFE_CHAR: str = r"[\x01-\x09\x0b\x0c\x0e-\x7f]"
+SAFE_STRING: re.Pattern = re.compile(f"(?:{SAFE_INIT_CHAR}{SAFE_CHAR}*)?")
+
+LDAPADD: str = "ldapadd"
+
+
+def format_attribute(name: str, value: str) -> str:
+    """Format a single attribute value, base64 encoding it if it's not a safe string."""
+    if SAFE_STRING.fullmatch(value) and not value.endswith(" "):
+        return f"{name}: {value}\n"
+    return f"{name}:: {b64encode(value.encode()).decode()}\n"
+
+
+def format_entry(dn: str, object_classes: Iterable[str], record: LdapRecord) -> str:
+    """Format a single entry as LDIF content record."""
+    lines: List[str] = [format_attribute("dn", dn)]
+    lines += [format_attribute("objectClass", object_class) for object_class in object_classes]
+    for name, value in record.items():
+        values: Union[str, List[str]] = value
+        for item in values if isinstance(values, list) else [values]:
+            lines.append(format_attribute(name, item))
+    return "".join(lines) + "\n"
+
+
+def write_ldif(
+    handle: IO[str],
+    phone_book: str,
+    phone_book_ou: str,
+    contact_ou: str,
+    contacts: Iterable[Contact],
+) -> List[PhoneBookEntry]:
+    """Write a phone book and all its contacts as LDIF, returning the entries written.
+
+    DNs are allocated in the same order as an incremental sync would add the contacts, and
+    duplicates are skipped the same way.
+    """
+    naming_attribute: str = get_rdn(phone_book).split("=", 1)[0]
+    handle.write(
+        format_entry(
+            phone_book, ["top", phone_book_ou], {naming_attribute: get_rdn_value(phone_book)}
+        )
+    )
+
+    index: DnIndex = DnIndex(phone_book)
+    entries: List[PhoneBookEntry] = []
+    for contact in sorted(unique_contacts(contacts), key=get_contact_key):
+        dn: str = index.allocate(contact)
+        record: LdapRecord = contact_to_ldap_record(contact)
+        record["cn"] = get_naming_values(dn, contact)
+        handle.write(format_entry(dn, [contact_ou], record))
+        entries.append(PhoneBookEntry.written(dn, contact, record))
+    logger.info("Wrote %i contacts of phone book %s as LDIF.", len(entries), phone_book)
+    return entries
+
+
+def load_ldif(host: str, user: str, password: str, path: str) -> None:
+    """Add all entries of an LDIF file in a single ldapadd run."""
+    with NamedTemporaryFile("w", encoding="utf-8", suffix=".pw") as password_file:
+        # Don't reveal the password in the process list; ldapadd reads the whole file
+        password_file.write(password)
+        password_file.flush()
+        subprocess.run(
+            [LDAPADD, "-x", "-H", host, "-D", user, "-y", password_file.name, "-f", path],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    logger.info("Loaded LDIF file %s into %s.", path, host)
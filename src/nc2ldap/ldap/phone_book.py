@@ -1,29 +1,71 @@
 """Module to encapsulate the logic and functions of our LDAP phone book."""
 
 import logging
-from typing import Any, Dict, Set
+from dataclasses import replace
+from tempfile import NamedTemporaryFile
+from typing import Any, Callable, Dict, Generator, Iterable, List, Optional, Tuple, Union
 
-from ldap3 import ALL, ALL_ATTRIBUTES, Connection, Server
+from ldap3 import ALL, BASE, Connection, Server
+from ldap3.core.exceptions import LDAPException
+from ldap3.utils.dn import escape_rdn
 
-from nc2ldap.constants import LOG_LEVEL
-from nc2ldap.contact import Contact, contact_from_ldap_dict, contact_to_ldap_dict
+from nc2ldap.constants import LDAP_PAGE_SIZE, LDAP_WRITE_WINDOW, LOG_LEVEL
+from nc2ldap.contact import (
+    LDAP_CONTACT_ATTRIBUTES,
+    LDAP_HASH_ATTRIBUTE,
+    Contact,
+    LdapRecord,
+    contact_from_ldap_dict,
+    contact_to_ldap_record,
+)
+
+from .batch_writer import BatchWriter, WriteFailure
+from .diff import (
+    MANAGED_ATTRIBUTES,
+    ContactDiff,
+    PhoneBookEntry,
+    StreamingDiff,
+    get_contact_key,
+    hash_attributes,
+    replace_attributes,
+)
+from .dn_index import DnIndex, get_contact_cn, get_naming_values, get_rdn, get_rdn_value
+from .ldif import write_ldif
 
 logger = logging.getLogger(__name__)
 logger.setLevel(LOG_LEVEL)
 
 
+def first_value(value: Any) -> Optional[str]:
+    """Get the first value of an LDAP attribute, which might be wrapped in a list."""
+    if isinstance(value, list):
+        return str(value[0]) if value else None
+    return None if value is None else str(value)
+
+
+def succeeded(result: Any) -> bool:
+    """Check the result of a synchronous LDAP operation."""
+    # Thread-safe connections return a (status, result, response, request) tuple
+    return bool(result[0] if isinstance(result, tuple) else result)
+
+
 class PhoneBook:
     """Our LDAP phone book."""
 
     phone_book_ou: str = "organizationalUnit"
     contact_ou: str = "inetOrgPerson"
 
-    def __init__(self, ldap_server: str, phone_book: str) -> None:
-        """Create an LDAP server instance and connect to it."""
+    def __init__(self, ldap_server: Union[str, Server], phone_book: str) -> None:
+        """Create an LDAP server instance, unless given one, and connect to it."""
         self.phone_book: str = phone_book
-        self.server: Server = Server(ldap_server, get_info=ALL)
+        self.server: Server = (
+            Server(ldap_server, get_info=ALL) if isinstance(ldap_server, str) else ldap_server
+        )
         self.ldap: Connection
-        logger.info("Connected to LDAP server %s.", ldap_server)
+        self.ldap_async: Connection
+        self.index: DnIndex = DnIndex(phone_book)
+        self.entries: Dict[str, PhoneBookEntry] = {}
+        logger.info("Connected to LDAP server %s.", self.server.host)
 
     def login(self, user: str, password: str) -> None:
         """Log in as a specific user in order to read and manipulate data."""
@@ -34,52 +76,271 @@ class PhoneBook:
             client_strategy="SAFE_SYNC",
             auto_bind="NO_TLS",
         )
+        self.ldap_async = Connection(
+            self.server,
+            user,
+            password,
+            client_strategy="ASYNC",
+            auto_bind="NO_TLS",
+        )
         logger.info("Authorized as user %s", user)
 
     def create(self) -> None:
         """Create our phone book as organizational unit if not existent yet."""
-        # pylint: disable=unsubscriptable-object
-        status, _result, response, _request = self.ldap.search(
-            self.phone_book, f"(objectclass={self.phone_book_ou})"
-        )
-        if status:
-            logger.info("Phone book %s is already present.", response[0]["dn"])
+        if self.exists():
+            logger.info("Phone book %s is already present.", self.phone_book)
         else:
             self.ldap.add(self.phone_book, ["top", self.phone_book_ou])
             logger.info("Created new phone book %s.", self.phone_book)
 
-    def get_contacts(self) -> Set[Contact]:
-        """Read all contacts from the phone book."""
-        _status, _result, response, _request = self.ldap.search(
+    def exists(self) -> bool:
+        """Check whether our phone book is present."""
+        return succeeded(
+            self.ldap.search(
+                self.phone_book, f"(objectclass={self.phone_book_ou})", search_scope=BASE
+            )
+        )
+
+    def sibling(self, phone_book: str) -> "PhoneBook":
+        """Get another phone book on the same server, sharing our connections."""
+        result: PhoneBook = PhoneBook(self.server, phone_book)
+        result.ldap, result.ldap_async = self.ldap, self.ldap_async
+        return result
+
+    def drop(self) -> None:
+        """Delete all contacts and the phone book itself."""
+        failures: List[WriteFailure] = self.apply_diff(
+            ContactDiff(deleted=list(self.get_entries()))
+        )
+        result: Any = self.ldap.delete(self.phone_book)
+        if failures or not succeeded(result):
+            raise LDAPException(f"Could not delete phone book {self.phone_book}: {result}")
+        logger.info("Deleted phone book %s.", self.phone_book)
+
+    def rename(self, phone_book: str) -> None:
+        """Move our phone book including all contacts to a DN with the same parent."""
+        result: Any = self.ldap.modify_dn(self.phone_book, get_rdn(phone_book))
+        if not succeeded(result):
+            raise LDAPException(f"Could not rename {self.phone_book} to {phone_book}: {result}")
+        logger.info("Renamed phone book %s to %s.", self.phone_book, phone_book)
+        self.phone_book = phone_book
+
+    def rebuild(self, contacts: Iterable[Contact], loader: Callable[[str], None]) -> None:
+        """Replace the whole phone book by bulk loading it as LDIF and swapping it in.
+
+        Contacts are loaded into a staging phone book next to ours first, so that clients
+        never see a partially written phone book; the loader adds all entries of an LDIF file.
+        """
+        rdn: str = get_rdn(self.phone_book)
+        parent: str = self.phone_book.removeprefix(rdn)
+        attribute: str = rdn.split("=", 1)[0]
+        name: str = get_rdn_value(self.phone_book)
+        staging_dn: str = f"{attribute}={escape_rdn(f'{name}-rebuild')}{parent}"
+        staging: PhoneBook = self.sibling(staging_dn)
+        retired: PhoneBook = self.sibling(f"{attribute}={escape_rdn(f'{name}-old')}{parent}")
+        for leftover in (staging, retired):
+            if leftover.exists():
+                leftover.drop()
+
+        with NamedTemporaryFile("w", encoding="utf-8", suffix=".ldif") as handle:
+            entries: List[PhoneBookEntry] = write_ldif(
+                handle, staging.phone_book, self.phone_book_ou, self.contact_ou, contacts
+            )
+            handle.flush()
+            loader(handle.name)
+
+        # Clients briefly find no phone book between both renames; if swapping in the new one
+        # fails, the old one is put back
+        live: Optional[PhoneBook] = None
+        if self.exists():
+            live = self.sibling(self.phone_book)
+            live.rename(retired.phone_book)
+        try:
+            staging.rename(self.phone_book)
+        except LDAPException:
+            if live is not None:
+                live.rename(self.phone_book)
+            raise
+        if retired.exists():
+            retired.drop()
+
+        self.use_entries(
+            replace(entry, dn=entry.dn[: -len(staging_dn)] + self.phone_book) for entry in entries
+        )
+
+    def get_contacts(self, page_size: int = LDAP_PAGE_SIZE) -> Generator[Contact, None, None]:
+        """Read all contacts from the phone book page by page, indexing their DNs."""
+        count: int = 0
+        self.index.clear()
+        for item in self.ldap.extend.standard.paged_search(
             self.phone_book,
             f"(objectclass={self.contact_ou})",
-            attributes=[ALL_ATTRIBUTES],
-        )
-        result: Set[Contact] = set()
-        for item in response:
+            attributes=list(LDAP_CONTACT_ATTRIBUTES),
+            paged_size=page_size,
+            generator=True,
+        ):
+            if item.get("type") != "searchResEntry":
+                continue
             attributes: Dict[str, Any] = item.get("attributes", {})
             try:
                 contact: Contact = contact_from_ldap_dict(attributes)
-                result.add(contact)
+                self.index.add(item["dn"], get_contact_key(contact))
+                count += 1
                 logger.debug("Successfully parsed LDAP contact %s.", contact)
+                yield contact
             except TypeError:
                 logger.error(
                     "Could not parse LDAP contact %s.",
                     item.get("dn", "<?>"),
                     exc_info=True,
                 )
-        return result
+        logger.info("Read a total of %i LDAP contacts.", count)
+
+    def get_entries(self, page_size: int = LDAP_PAGE_SIZE) -> Generator[PhoneBookEntry, None, None]:
+        """Read the DN, key and hashes of all contacts, indexing their DNs.
+
+        All attributes are read to hash them, but only the hashes are kept.
+        """
+        count: int = 0
+        self.index.clear()
+        self.entries.clear()
+        for item in self.ldap.extend.standard.paged_search(
+            self.phone_book,
+            f"(objectclass={self.contact_ou})",
+            attributes=list(MANAGED_ATTRIBUTES),
+            paged_size=page_size,
+            generator=True,
+        ):
+            if item.get("type") != "searchResEntry":
+                continue
+            attributes: Dict[str, Any] = item.get("attributes", {})
+            entry: PhoneBookEntry = PhoneBookEntry(
+                item["dn"],
+                get_contact_cn(item["dn"], attributes.get("cn")),
+                first_value(attributes.get("uid")),
+                first_value(attributes.get(LDAP_HASH_ATTRIBUTE)),
+                hash_attributes(attributes),
+            )
+            self.index.add(entry.dn, entry.get_key())
+            self.entries[entry.dn] = entry
+            count += 1
+            yield entry
+        logger.info("Read a total of %i LDAP entries.", count)
+
+    def use_entries(self, entries: Iterable[PhoneBookEntry]) -> None:
+        """Take the entries of the phone book as known, e.g. from a snapshot, instead of reading."""
+        self.index.clear()
+        self.entries.clear()
+        for entry in entries:
+            self.index.add(entry.dn, entry.get_key())
+            self.entries[entry.dn] = entry
+
+    def remember(self, dn: str, contact: Contact, record: LdapRecord) -> LdapRecord:
+        """Keep track of an entry written to the phone book, adding its CNs to the record."""
+        record["cn"] = get_naming_values(dn, contact)
+        self.entries[dn] = PhoneBookEntry.written(dn, contact, record)
+        return record
 
     def add_contact(self, contact: Contact) -> None:
         """Add a single contact to the phone book."""
+        dn: str = self.index.allocate(contact)
         self.ldap.add(
-            f"cn={contact.get_cn()},{self.phone_book}",
+            dn,
             [self.contact_ou],
-            contact_to_ldap_dict(contact),
+            self.remember(dn, contact, contact_to_ldap_record(contact)),
         )
         logger.info("Added %s to phone book.", contact)
 
-    def delete_contact(self, contact: Contact) -> None:
-        """Remove a single contact from the phone book."""
-        self.ldap.delete(f"cn={contact.get_cn()},{self.phone_book}")
-        logger.info("Deleted %s from phone book.", contact)
+    def delete_contact(self, entry: PhoneBookEntry) -> None:
+        """Remove a single entry from the phone book."""
+        self.ldap.delete(entry.dn)
+        self.index.remove(entry.dn)
+        self.entries.pop(entry.dn, None)
+        logger.info("Deleted %s from phone book.", entry.dn)
+
+    def update_contact(self, entry: PhoneBookEntry, new: Contact) -> None:
+        """Rename an entry if required, and replace its changed contact attributes."""
+        dn: str = self.index.allocate(new)
+        if dn != entry.dn:
+            self.ldap.modify_dn(entry.dn, get_rdn(dn), delete_old_dn=True)
+            self.index.remove(entry.dn)
+            self.entries.pop(entry.dn, None)
+            logger.info("Renamed %s to %s in phone book.", entry.dn, dn)
+
+        self.ldap.modify(
+            dn, replace_attributes(self.remember(dn, new, contact_to_ldap_record(new)), entry)
+        )
+        logger.info("Updated %s in phone book.", new)
+
+    def apply_diff(self, diff: ContactDiff, window: int = LDAP_WRITE_WINDOW) -> List[WriteFailure]:
+        """Write all changes to the phone book, keeping many operations in flight at once."""
+        writer: BatchWriter = BatchWriter(self.ldap_async, window)
+
+        # Operations of one phase must not depend on each other, as the server may process
+        # them in any order; deletions and renames free the CNs needed by later phases.
+        for entry in diff.deleted:
+            writer.submit(entry.dn, self.ldap_async.delete)
+            self.index.remove(entry.dn)
+            self.entries.pop(entry.dn, None)
+        writer.flush()
+
+        # Allocate DNs in a stable order, so that suffixes of equal CNs never depend on the
+        # order of upstream contacts
+        targets: List[Tuple[str, PhoneBookEntry, Contact]] = []
+        renamed: List[str] = []
+        for entry, new in sorted(diff.updated, key=lambda update: get_contact_key(update[1])):
+            dn: str = self.index.allocate(new)
+            if dn != entry.dn:
+                writer.submit(entry.dn, self.ldap_async.modify_dn, get_rdn(dn), delete_old_dn=True)
+                renamed.append(entry.dn)
+            targets.append((dn, entry, new))
+        for old_dn in renamed:
+            self.index.remove(old_dn)
+            self.entries.pop(old_dn, None)
+        writer.flush()
+
+        for dn, entry, new in targets:
+            record: LdapRecord = self.remember(dn, new, contact_to_ldap_record(new))
+            writer.submit(dn, self.ldap_async.modify, replace_attributes(record, entry))
+        for contact in sorted(diff.added, key=get_contact_key):
+            dn = self.index.allocate(contact)
+            writer.submit(
+                dn,
+                self.ldap_async.add,
+                [self.contact_ou],
+                self.remember(dn, contact, contact_to_ldap_record(contact)),
+            )
+        writer.flush()
+
+        logger.info(
+            "Sent %i write operations to phone book, %i failed.",
+            writer.count,
+            len(writer.failures),
+        )
+        return writer.failures
+
+    def apply_stream(
+        self, stream: StreamingDiff, target: Iterable[Contact], window: int = LDAP_WRITE_WINDOW
+    ) -> List[WriteFailure]:
+        """Diff contacts while they arrive, writing changes which don't affect others at once.
+
+        Updates keeping their DN are sent right away. Additions, renames and deletions are
+        applied by `apply_diff` once all contacts have been matched: they depend on CNs being
+        freed, and additions need DNs allocated in a stable order, as any later contact may
+        have the same CN.
+        """
+        writer: BatchWriter = BatchWriter(self.ldap_async, window)
+        deferred: ContactDiff = ContactDiff()
+        for old, new in stream.match_all(target):
+            if old is None:
+                deferred.added.append(new)
+            elif self.index.get_current(new) != old.dn:
+                deferred.updated.append((old, new))
+            else:
+                record: LdapRecord = self.remember(old.dn, new, contact_to_ldap_record(new))
+                writer.submit(old.dn, self.ldap_async.modify, replace_attributes(record, old))
+        writer.flush()
+        logger.info("Streamed %i write operations to phone book.", writer.count)
+
+        deferred.deleted = stream.get_deleted()
+        return writer.failures + self.apply_diff(deferred, window)
@@ -0,0 +1,69 @@
+"""Module to share authorized LDAP connections between phone books."""
+
+import logging
+from contextlib import contextmanager
+from queue import Empty, LifoQueue
+from typing import Generator, Tuple
+
+from ldap3 import ALL, Connection, Server
+
+from nc2ldap.constants import LOG_LEVEL
+
+from .phone_book import PhoneBook
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+ConnectionPair = Tuple[Connection, Connection]
+
+
+class ConnectionPool:
+    """A pool of authorized LDAP connections, reused by the phone books of all tenants.
+
+    The pool holds as many connections as phone books were used at the same time.
+    """
+
+    def __init__(self, ldap_server: str, user: str, password: str) -> None:
+        """Prepare the pool; connections are opened on demand."""
+        self.server: Server = Server(ldap_server, get_info=ALL)
+        self.user: str = user
+        self.password: str = password
+        self.idle: LifoQueue[ConnectionPair] = LifoQueue()
+
+    def connect(self) -> ConnectionPair:
+        """Open and bind a new pair of synchronous and asynchronous connections."""
+        logger.debug("Opening new LDAP connections as user %s.", self.user)
+        return (
+            Connection(
+                self.server,
+                self.user,
+                self.password,
+                client_strategy="SAFE_SYNC",
+                auto_bind="NO_TLS",
+            ),
+            Connection(
+                self.server,
+                self.user,
+                self.password,
+                client_strategy="ASYNC",
+                auto_bind="NO_TLS",
+            ),
+        )
+
+    @contextmanager
+    def phone_book(self, phone_book: str) -> Generator[PhoneBook, None, None]:
+        """Borrow connections for a phone book; they are closed instead of reused on errors."""
+        try:
+            connections: ConnectionPair = self.idle.get_nowait()
+        except Empty:
+            connections = self.connect()
+
+        result: PhoneBook = PhoneBook(self.server, phone_book)
+        result.ldap, result.ldap_async = connections
+        try:
+            yield result
+        except BaseException:
+            for connection in connections:
+                connection.unbind()
+            raise
+        self.idle.put(connections)
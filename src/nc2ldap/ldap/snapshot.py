@@ -0,0 +1,97 @@
+"""Module to persist the phone book entries written by the last successful sync."""
+
+import logging
+import os
+import sqlite3
+from contextlib import closing
+from dataclasses import dataclass
+from hashlib import blake2b
+from typing import Iterable, List, Optional
+
+from nc2ldap.constants import LOG_LEVEL
+
+from .diff import PhoneBookEntry
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+SCHEMA: str = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE entries (
+    dn TEXT PRIMARY KEY, cn TEXT NOT NULL, uid TEXT, content_hash TEXT, attribute_hashes TEXT
+);
+"""
+
+
+def checksum(entries: Iterable[PhoneBookEntry]) -> str:
+    """Compute an order-independent checksum over the DN, CN, UID and hashes of all entries."""
+    digest = blake2b(digest_size=16)
+    for values in sorted(
+        (e.dn, e.cn, e.uid or "", e.content_hash or "", e.attribute_hashes or "") for e in entries
+    ):
+        digest.update(("\0".join(values) + "\n").encode())
+    return digest.hexdigest()
+
+
+@dataclass
+class Snapshot:
+    """Entries of a phone book as left by the last sync, and when they were last read from LDAP."""
+
+    phone_book: str
+    entries: List[PhoneBookEntry]
+    verified: float
+
+    @classmethod
+    def load(cls, path: str, phone_book: str) -> Optional["Snapshot"]:
+        """Read a previously saved snapshot of a phone book, if there's a valid one."""
+        if not os.path.exists(path):
+            logger.info("No phone book snapshot found at %s.", path)
+            return None
+        try:
+            with closing(sqlite3.connect(path)) as database:
+                meta = dict(database.execute("SELECT key, value FROM meta").fetchall())
+                entries: List[PhoneBookEntry] = [
+                    PhoneBookEntry(*row)
+                    for row in database.execute(
+                        "SELECT dn, cn, uid, content_hash, attribute_hashes FROM entries"
+                    )
+                ]
+            if meta["phone_book"] != phone_book:
+                logger.warning("Ignoring snapshot at %s of another phone book.", path)
+            elif meta["checksum"] != checksum(entries):
+                logger.warning("Ignoring snapshot at %s with checksum mismatch.", path)
+            else:
+                return cls(phone_book, entries, float(meta["verified"]))
+        except (sqlite3.Error, KeyError, ValueError):
+            logger.warning("Ignoring invalid phone book snapshot at %s.", path, exc_info=True)
+        return None
+
+    def save(self, path: str) -> None:
+        """Write this snapshot to disk atomically."""
+        temp_path: str = f"{path}.tmp"
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        with closing(sqlite3.connect(temp_path)) as database:
+            database.executescript(SCHEMA)
+            database.executemany(
+                "INSERT INTO meta VALUES (?, ?)",
+                [
+                    ("phone_book", self.phone_book),
+                    ("checksum", checksum(self.entries)),
+                    ("verified", repr(self.verified)),
+                ],
+            )
+            database.executemany(
+                "INSERT INTO entries VALUES (?, ?, ?, ?, ?)",
+                [(e.dn, e.cn, e.uid, e.content_hash, e.attribute_hashes) for e in self.entries],
+            )
+            database.commit()
+        os.replace(temp_path, path)
+        logger.debug("Saved snapshot with %i entries to %s.", len(self.entries), path)
+
+    @staticmethod
+    def remove(path: str) -> None:
+        """Discard a snapshot, so the next sync reads the phone book from LDAP again."""
+        if os.path.exists(path):
+            os.remove(path)
+            logger.debug("Discarded phone book snapshot at %s.", path)
@@ -1,76 +1,260 @@
 """Main app for Nextcloud to LDAP contact exporter."""
 
 import logging
-from time import sleep
-from typing import Set
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from subprocess import CalledProcessError
+from threading import BoundedSemaphore
+from time import sleep, time
+from typing import Dict, Iterator, List, Optional, Tuple
 
+from httpx import TransportError
+from ldap3.core.exceptions import LDAPException
 from schedule import every, repeat, run_pending
+from webdav4.client import HTTPError
 
 from nc2ldap.constants import (
     LDAP_ADMIN_PASSWORD,
     LDAP_ADMIN_USER,
-    LDAP_HOST,
-    LDAP_PHONE_BOOK,
+    LDAP_BACKEND,
+    LDAP_BULK_LOAD_MIN,
+    LDAP_CONFIG_HOST,
+    LDAP_SERVER_ANONYMOUS,
+    LDAP_SERVER_PORT,
+    LDAP_SNAPSHOT_MAX_AGE,
     LOG_LEVEL,
-    NEXTCLOUD_ADDRESS_BOOK,
-    NEXTCLOUD_APP_TOKEN,
-    NEXTCLOUD_HOST,
+    METRICS_PORT,
+    NEXTCLOUD_POLL_DEBOUNCE,
+    NEXTCLOUD_POLL_INTERVAL,
     NEXTCLOUD_SYNC_TIME,
-    NEXTCLOUD_USER,
+    SYNC_CONCURRENCY,
+    SYNC_MAX_DELAY,
+    TENANTS_FILE,
     VERSION,
+    WEBHOOK_DEBOUNCE,
+    WEBHOOK_PORT,
+    WEBHOOK_TOKEN,
 )
-from nc2ldap.contact import Contact
-from nc2ldap.ldap import PhoneBook
+from nc2ldap.contact import Contact, get_phone_cache_info
+from nc2ldap.ldap import (
+    PhoneBook,
+    PhoneBookEntry,
+    Snapshot,
+    StreamingDiff,
+    WriteFailure,
+    diff_contacts,
+    setup_indexes,
+)
+from nc2ldap.metrics import METRICS, start_metrics_server
 from nc2ldap.nextcloud import AddressBook
+from nc2ldap.pipeline import ThreadedStage
+from nc2ldap.server import DIRECTORY, LdapServer
+from nc2ldap.sync import (
+    LDAP_POOL,
+    MEMORY_BACKEND,
+    create_address_book,
+    load_phone_book,
+    save_snapshot,
+)
+from nc2ldap.tenants import Tenant, default_tenant, load_tenants
+from nc2ldap.webhook import start_webhook_server
+from nc2ldap.worker import SyncWorker
 
 logging.basicConfig(level=logging.WARNING)
 logger = logging.getLogger(__name__)
 logger.setLevel(LOG_LEVEL)
 
+# Limit the number of tenants synced at the same time; they share all LDAP connections
+SYNC_LIMIT: BoundedSemaphore = BoundedSemaphore(SYNC_CONCURRENCY)
+SYNC_WORKERS: Dict[str, SyncWorker] = {}
+
 
 def main():
     """Run main entry point."""
     logger.info("Starting nc2ldap v%s.", VERSION)
     logger.info("Setting up task scheduler to run every day at %s.", NEXTCLOUD_SYNC_TIME)
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT)
+
+    tenants: List[Tenant] = load_tenants(TENANTS_FILE) if TENANTS_FILE else [default_tenant()]
+    for tenant in tenants:
+        SYNC_WORKERS[tenant.name] = SyncWorker(
+            partial(sync_tenant, tenant), NEXTCLOUD_POLL_DEBOUNCE, SYNC_MAX_DELAY
+        )
+    if WEBHOOK_PORT:
+        start_webhook_server(WEBHOOK_PORT, SYNC_WORKERS, WEBHOOK_TOKEN, WEBHOOK_DEBOUNCE)
 
-    # Perform an import once after start-up
-    do_import()
+    # Make sure that the phone's lookups by name and number are served from indexes
+    if LDAP_BACKEND == MEMORY_BACKEND:
+        LdapServer(
+            LDAP_SERVER_PORT,
+            LDAP_ADMIN_USER,
+            LDAP_ADMIN_PASSWORD,
+            anonymous=LDAP_SERVER_ANONYMOUS,
+        )
+    elif LDAP_CONFIG_HOST:
+        for phone_book in sorted({tenant.phone_book for tenant in tenants}):
+            setup_indexes(LDAP_CONFIG_HOST, phone_book)
+    else:
+        logger.info("Not checking LDAP indexes, as LDAP_CONFIG_HOST is not set.")
+
+    # Remember the state of the address books before the initial import, then poll them
+    if NEXTCLOUD_POLL_INTERVAL:
+        logger.info("Polling address books for changes every %i s.", NEXTCLOUD_POLL_INTERVAL)
+        for tenant in tenants:
+            poll_address_book: AddressBook = create_address_book(tenant)
+            poll_address_book.has_changed()
+            every(NEXTCLOUD_POLL_INTERVAL).seconds.do(poll_changes, tenant, poll_address_book)
+
+    # Perform an import once after start-up, later ones run in the background
+    do_import(tenants)
+    for worker in SYNC_WORKERS.values():
+        worker.start()
     while True:
         run_pending()
         sleep(1)
 
 
 @repeat(every().day.at(NEXTCLOUD_SYNC_TIME))
-def do_import():
-    """Import and update all Nextcloud contacts to the local LDAP server."""
-    logger.info("Importing Nextcloud address book.")
-    nc_address_book: AddressBook = AddressBook(
-        NEXTCLOUD_HOST,
-        NEXTCLOUD_ADDRESS_BOOK,
-        NEXTCLOUD_USER,
-        NEXTCLOUD_APP_TOKEN,
+def schedule_import():
+    """Request the daily import of all tenants."""
+    for worker in SYNC_WORKERS.values():
+        worker.trigger("daily sync")
+
+
+def poll_changes(tenant: Tenant, address_book: AddressBook):
+    """Request an import if a tenant's address book has changed since the last poll."""
+    with METRICS.tenant(tenant.name):
+        try:
+            if address_book.has_changed():
+                SYNC_WORKERS[tenant.name].trigger(f"address book of {tenant.name} changed")
+        except (HTTPError, TransportError) as err:
+            METRICS.add_error("poll")
+            logger.warning("Could not poll address book of %s for changes: %s", tenant.name, err)
+
+
+def do_import(tenants: List[Tenant]):
+    """Import and update the Nextcloud contacts of all tenants concurrently."""
+    with ThreadPoolExecutor(SYNC_CONCURRENCY, thread_name_prefix="sync") as pool:
+        futures: Dict[str, Future[None]] = {
+            tenant.name: pool.submit(sync_tenant, tenant) for tenant in tenants
+        }
+    failed: List[str] = [name for name, future in futures.items() if future.exception()]
+    for name in failed:
+        logger.error("Sync of %s failed.", name, exc_info=futures[name].exception())
+    if failed:
+        raise RuntimeError(f"Sync failed for {len(failed)} of {len(tenants)} tenants.")
+
+
+def sync_tenant(tenant: Tenant):
+    """Import and update all Nextcloud contacts of a tenant to its LDAP phone book."""
+    with SYNC_LIMIT, METRICS.tenant(tenant.name):
+        with METRICS.stage("sync"):
+            sync_contacts(tenant)
+        METRICS.mark_success()
+
+
+def sync_contacts(tenant: Tenant):
+    """Stream a Nextcloud address book into its LDAP phone book, writing changes as found."""
+    logger.info("Importing Nextcloud address book of %s.", tenant.name)
+    nc_address_book: AddressBook = create_address_book(tenant)
+    if LDAP_BACKEND == MEMORY_BACKEND:
+        publish_contacts(tenant, nc_address_book)
+        return
+
+    # Contacts are downloaded and parsed in the background while the phone book is read
+    with (
+        stream_contacts(tenant, nc_address_book) as nc_contacts,
+        LDAP_POOL.phone_book(tenant.phone_book) as ldap_phone_book,
+    ):
+        logger.info("Gathering data from local LDAP phone book %s.", tenant.phone_book)
+        ldap_phone_book.create()
+        ldap_entries, verified = read_entries(tenant, ldap_phone_book)
+
+        # Until the writes are known to be complete, the snapshot can't be trusted anymore
+        if tenant.snapshot_file:
+            Snapshot.remove(tenant.snapshot_file)
+        failures: List[WriteFailure] = write_contacts(ldap_phone_book, ldap_entries, nc_contacts)
+        if tenant.snapshot_file and not failures:
+            save_snapshot(tenant, ldap_phone_book, verified)
+    logger.debug("Phone number cache statistics: %s", get_phone_cache_info())
+
+
+def stream_contacts(tenant: Tenant, address_book: AddressBook) -> ThreadedStage[Contact]:
+    """Download and parse all contacts of an address book in the background."""
+    if tenant.sync_state_file:
+        return address_book.stream_contacts_incremental(tenant.sync_state_file)
+    return address_book.stream_contacts()
+
+
+def publish_contacts(tenant: Tenant, address_book: AddressBook):
+    """Replace the phone book served from memory with all contacts of an address book."""
+    with stream_contacts(tenant, address_book) as nc_contacts:
+        contacts: List[Contact] = diff_contacts([], nc_contacts).added
+    with METRICS.stage("publish") as stage:
+        stage.items = DIRECTORY.publish(tenant.phone_book, contacts)
+
+
+def read_entries(tenant: Tenant, phone_book: PhoneBook) -> Tuple[List[PhoneBookEntry], float]:
+    """Get the entries of a phone book and the time they were last read from LDAP."""
+    snapshot: Optional[Snapshot] = (
+        Snapshot.load(tenant.snapshot_file, tenant.phone_book) if tenant.snapshot_file else None
     )
-    nc_contacts: Set[Contact] = nc_address_book.get_contacts()
-    logger.info("Found %i upstream contacts.", len(nc_contacts))
-
-    logger.info("Gathering data from local LDAP phone book.")
-    ldap_phone_book: PhoneBook = PhoneBook(LDAP_HOST, LDAP_PHONE_BOOK)
-    ldap_phone_book.login(LDAP_ADMIN_USER, LDAP_ADMIN_PASSWORD)
-    ldap_phone_book.create()
-    ldap_contacts: Set[Contact] = ldap_phone_book.get_contacts()
-    logger.info("Found %i local contacts.", len(ldap_contacts))
-
-    # Find out which contacts to add/delete by comparing them
-    contacts_to_delete: Set[Contact] = ldap_contacts - nc_contacts
-    contacts_to_add: Set[Contact] = nc_contacts - ldap_contacts
-
-    logger.info("Deleting a total of %i contacts.", len(contacts_to_delete))
-    for contact in contacts_to_delete:
-        ldap_phone_book.delete_contact(contact)
-
-    logger.info("Adding a total of %i contacts.", len(contacts_to_add))
-    for contact in contacts_to_add:
-        ldap_phone_book.add_contact(contact)
+    if snapshot and time() - snapshot.verified < LDAP_SNAPSHOT_MAX_AGE:
+        # Trust the entries written by the last sync instead of reading the whole phone book
+        with METRICS.stage("snapshot_read") as stage:
+            phone_book.use_entries(snapshot.entries)
+            stage.items = len(snapshot.entries)
+        return snapshot.entries, snapshot.verified
+
+    with METRICS.stage("ldap_read") as stage:
+        verified: float = time()
+        entries: List[PhoneBookEntry] = list(phone_book.get_entries())
+        stage.items = len(entries)
+    return entries, verified
+
+
+def write_contacts(
+    phone_book: PhoneBook, entries: List[PhoneBookEntry], contacts: Iterator[Contact]
+) -> List[WriteFailure]:
+    """Match contacts against the phone book as they arrive, and write all changes."""
+    if LDAP_BULK_LOAD_MIN and not entries:
+        # An empty phone book may be loaded at once, but that needs all contacts beforehand
+        added: List[Contact] = diff_contacts([], contacts).added
+        if len(added) >= LDAP_BULK_LOAD_MIN and bulk_load(phone_book, added):
+            return []
+        contacts = iter(added)
+
+    stream: StreamingDiff = StreamingDiff(entries)
+    with METRICS.stage("ldap_write") as stage:
+        failures: List[WriteFailure] = phone_book.apply_stream(stream, contacts)
+        stage.items = stream.changes
+    METRICS.add_error("ldap_write", len(failures))
+    logger.info(
+        "Found %i upstream contacts; added %i, updated %i and deleted %i entries.",
+        len(stream.seen),
+        stream.added,
+        stream.updated,
+        len(stream.get_deleted()),
+    )
+    return failures
+
+
+def bulk_load(phone_book: PhoneBook, contacts: List[Contact]) -> bool:
+    """Load all contacts into an empty phone book at once, if ldapadd is available."""
+    try:
+        with METRICS.stage("ldap_bulk_load") as stage:
+            phone_book.rebuild(contacts, load_phone_book)
+            stage.items = len(contacts)
+        return True
+    except (OSError, CalledProcessError, LDAPException) as err:
+        logger.warning(
+            "Could not bulk load phone book %s, adding contacts one by one instead: %s %s",
+            phone_book.phone_book,
+            err,
+            getattr(err, "stderr", ""),
+        )
+        return False
 
 
 if __name__ == "__main__":
@@ -0,0 +1,199 @@
+"""Module to record sync metrics and serve them in the Prometheus text format."""
+
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from time import monotonic, time
+from typing import Dict, Generator, List, Mapping, Tuple
+
+from nc2ldap.constants import LOG_LEVEL
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+CONTENT_TYPE: str = "text/plain; version=0.0.4; charset=utf-8"
+
+# Tenant whose sync is running in the current thread, added as label to all stage metrics
+TENANT: ContextVar[str] = ContextVar("tenant", default="")
+
+# Stage metrics are labeled with the tenant and stage name
+StageKey = Tuple[str, str]
+
+
+@dataclass
+class StageRun:
+    """A single, currently running sync stage, counting the items it processes."""
+
+    name: str
+    items: int = 0
+
+
+class SyncMetrics:
+    """Thread-safe metrics of all sync stages."""
+
+    def __init__(self) -> None:
+        """Start with empty metrics."""
+        self.lock: Lock = Lock()
+        self.durations: Dict[StageKey, float] = {}
+        self.items: Dict[StageKey, int] = {}
+        self.runs: Dict[StageKey, int] = {}
+        self.errors: Dict[StageKey, int] = {}
+        self.bytes_downloaded: int = 0
+        self.last_success: Dict[str, float] = {}
+        self.concurrency_limits: Dict[str, float] = {}
+
+    @contextmanager
+    def tenant(self, name: str) -> Generator[None, None, None]:
+        """Label all metrics recorded by the current thread with a tenant."""
+        token = TENANT.set(name)
+        try:
+            yield
+        finally:
+            TENANT.reset(token)
+
+    @contextmanager
+    def stage(self, name: str) -> Generator[StageRun, None, None]:
+        """Measure the duration of a stage; an exception counts as error of that stage.
+
+        Stages may also wrap generators, which measures the time until they are exhausted.
+        """
+        run: StageRun = StageRun(name)
+        key: StageKey = (TENANT.get(), name)
+        start: float = monotonic()
+        try:
+            yield run
+        except Exception:
+            self.add_error(name)
+            raise
+        finally:
+            with self.lock:
+                self.durations[key] = monotonic() - start
+                self.items[key] = run.items
+                self.runs[key] = self.runs.get(key, 0) + 1
+
+    def add_error(self, stage: str, count: int = 1) -> None:
+        """Count failed operations of a stage."""
+        key: StageKey = (TENANT.get(), stage)
+        with self.lock:
+            self.errors[key] = self.errors.get(key, 0) + count
+
+    def add_bytes(self, count: int) -> None:
+        """Count bytes downloaded from Nextcloud."""
+        with self.lock:
+            self.bytes_downloaded += count
+
+    def set_concurrency_limit(self, host: str, limit: float) -> None:
+        """Remember the current limit of concurrent requests to a Nextcloud server."""
+        with self.lock:
+            self.concurrency_limits[host] = limit
+
+    def mark_success(self) -> None:
+        """Remember the time of the last successful sync."""
+        with self.lock:
+            self.last_success[TENANT.get()] = time()
+
+    def render(self) -> str:
+        """Format all metrics in the Prometheus text exposition format."""
+        lines: List[str] = []
+
+        def add(name: str, kind: str, text: str, values: List[Tuple[str, float]]) -> None:
+            lines.append(f"# HELP nc2ldap_{name} {text}")
+            lines.append(f"# TYPE nc2ldap_{name} {kind}")
+            for labels, value in values:
+                lines.append(f"nc2ldap_{name}{labels} {value:g}")
+
+        def quote(value: str) -> str:
+            return value.replace("\\", "\\\\").replace('"', '\\"')
+
+        def label(tenant: str, stage: str = "") -> str:
+            labels: List[str] = [f'tenant="{quote(tenant)}"'] if tenant else []
+            labels += [f'stage="{stage}"'] if stage else []
+            return f"{{{','.join(labels)}}}" if labels else ""
+
+        def by_stage(values: Mapping[StageKey, float]) -> List[Tuple[str, float]]:
+            return [(label(*key), value) for key, value in sorted(values.items())]
+
+        with self.lock:
+            add(
+                "stage_duration_seconds",
+                "gauge",
+                "Duration of the last run of each sync stage.",
+                by_stage(self.durations),
+            )
+            add(
+                "stage_items",
+                "gauge",
+                "Number of items processed by the last run of each sync stage.",
+                by_stage(self.items),
+            )
+            add(
+                "stage_runs_total",
+                "counter",
+                "Number of runs of each sync stage.",
+                by_stage(self.runs),
+            )
+            add(
+                "stage_errors_total",
+                "counter",
+                "Number of errors and failed operations of each sync stage.",
+                by_stage(self.errors),
+            )
+            add(
+                "downloaded_bytes_total",
+                "counter",
+                "Bytes of vCard data downloaded from Nextcloud.",
+                [("", self.bytes_downloaded)],
+            )
+            add(
+                "last_success_timestamp_seconds",
+                "gauge",
+                "Unix time of the last successful sync, or 0 if there was none yet.",
+                [(label(tenant), value) for tenant, value in sorted(self.last_success.items())]
+                or [("", 0)],
+            )
+            add(
+                "nextcloud_concurrency_limit",
+                "gauge",
+                "Current limit of concurrent requests to each Nextcloud server.",
+                [
+                    (f'{{host="{quote(host)}"}}', value)
+                    for host, value in sorted(self.concurrency_limits.items())
+                ],
+            )
+        return "\n".join(lines) + "\n"
+
+
+METRICS: SyncMetrics = SyncMetrics()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Serve the global sync metrics."""
+
+    def log_message(self, format: str, *args: object) -> None:  # pylint: disable=W0622
+        """Log requests only when debugging."""
+        logger.debug(format, *args)
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        """Answer scrapes of the metrics endpoint."""
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+        data: bytes = METRICS.render().encode()
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def start_metrics_server(port: int, host: str = "") -> ThreadingHTTPServer:
+    """Serve the metrics endpoint from a background thread."""
+    server: ThreadingHTTPServer = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logger.info("Serving metrics on port %i.", server.server_address[1])
+    return server
@@ -1,13 +1,38 @@
 """Module to manage the Nextcloud client side."""
 
 import logging
-from typing import Generator, Set
+from contextlib import contextmanager
+from http import HTTPStatus
+from itertools import islice
+from typing import Callable, Generator, Iterable, Iterator, List, Optional, Set
 
-from vobject.base import Component, readOne
-from webdav4.client import Client
+from httpx import HTTPTransport, Limits, Response
+from webdav4.client import Client, HTTPError
 
-from nc2ldap.constants import LOG_LEVEL
-from nc2ldap.contact import Contact, contact_from_vcard
+from nc2ldap.constants import (
+    LOG_LEVEL,
+    NEXTCLOUD_BATCH_SIZE,
+    NEXTCLOUD_RETRIES,
+    NEXTCLOUD_TIMEOUT,
+    NEXTCLOUD_WORKERS,
+)
+from nc2ldap.contact import VCARD_CONVERTER, Contact, ParsePool, get_parse_pool, read_vcard
+from nc2ldap.metrics import METRICS
+from nc2ldap.pipeline import ThreadedStage
+
+from .carddav import (
+    CardData,
+    SyncChanges,
+    build_ctag_request,
+    build_multiget_request,
+    build_sync_collection_request,
+    parse_ctag,
+    parse_multistatus,
+    parse_sync_collection,
+)
+from .fetcher import VCardFetcher
+from .limiter import AdaptiveLimiter, LimitedTransport, get_limiter
+from .sync_state import SyncState
 
 logger = logging.getLogger(__name__)
 logger.setLevel(LOG_LEVEL)
@@ -16,28 +41,222 @@ logger.setLevel(LOG_LEVEL)
 class AddressBook:
     """A WebDAV client to read our Nextcloud address book."""
 
-    def __init__(self, host: str, address_book: str, username: str, app_token: str):
-        """Create a WebDAV client and connect to the Nextcloud instance."""
-        self.client: Client = Client(host, auth=(username.lower(), app_token))
+    def __init__(
+        self,
+        host: str,
+        address_book: str,
+        username: str,
+        app_token: str,
+        *,
+        batch_size: int = NEXTCLOUD_BATCH_SIZE,
+        workers: int = NEXTCLOUD_WORKERS,
+    ):
+        """Create a WebDAV client and connect to the Nextcloud instance.
+
+        Requests are limited to as many in flight as the server can handle, up to `workers`.
+        """
+        self.limiter: AdaptiveLimiter = get_limiter(host, workers)
+        self.client: Client = Client(
+            host,
+            auth=(username.lower(), app_token),
+            timeout=NEXTCLOUD_TIMEOUT,
+            transport=LimitedTransport(
+                HTTPTransport(
+                    limits=Limits(max_connections=workers, max_keepalive_connections=workers)
+                ),
+                self.limiter,
+            ),
+        )
         self.webdav_path: str = (
             "/remote.php/dav/addressbooks/users/" f"{username}/{address_book.lower()}"
         )
+        self.batch_size: int = batch_size
+        self.ctag: Optional[str] = None
+        self.fetcher: VCardFetcher = VCardFetcher(
+            self.client.http, workers, NEXTCLOUD_TIMEOUT, NEXTCLOUD_RETRIES
+        )
         logger.info("Connected WebDAV client to Nextcloud instance %s.", host)
 
     def get_vcf_files(self) -> Generator[str, None, None]:
         """Fetch a list of  vfc files representing this address book."""
         return (file["href"] for file in self.client.ls(self.webdav_path))
 
+    def get_vcards(self, files: Iterable[str]) -> Generator[CardData, None, None]:
+        """Download single vCard files concurrently."""
+        return self.fetcher.fetch_all(files)
+
+    @contextmanager
+    def report(self, body: str, depth: str = "1") -> Generator[Response, None, None]:
+        """Send a REPORT request to the address book and stream its multistatus response."""
+        with self.client.http.stream(
+            "REPORT",
+            self.client.join_url(self.webdav_path),
+            content=body,
+            headers={"Depth": depth, "Content-Type": "application/xml; charset=utf-8"},
+        ) as response:
+            if response.status_code != HTTPStatus.MULTI_STATUS:
+                response.read()
+                raise HTTPError(response)
+            try:
+                yield response
+            finally:
+                METRICS.add_bytes(response.num_bytes_downloaded)
+
+    def get_vcards_bulk(self, files: Iterable[str]) -> Generator[CardData, None, None]:
+        """Download vCard files in batches using addressbook-multiget REPORTs."""
+        remaining: Iterator[str] = iter(files)
+        while batch := list(islice(remaining, self.batch_size)):
+            logger.debug("Requesting a batch of %i vcf contact files.", len(batch))
+            with self.report(build_multiget_request(batch)) as response:
+                yield from parse_multistatus(response.iter_bytes())
+
+    def fetch_vcards(self, files: List[str]) -> Generator[CardData, None, None]:
+        """Download vCard files in bulk if possible, or one by one otherwise."""
+        done: Set[str] = set()
+        if self.batch_size > 0:
+            try:
+                for card in self.get_vcards_bulk(files):
+                    done.add(card.href)
+                    yield card
+                return
+            except HTTPError as err:
+                METRICS.add_error("webdav_fetch")
+                logger.warning(
+                    "Server rejected bulk download (%s), falling back to single files.", err
+                )
+        yield from self.get_vcards(file for file in files if file not in done)
+
+    def get_ctag(self) -> Optional[str]:
+        """Fetch a value which changes whenever the address book does (sync token or CTag)."""
+        response: Response = self.client.http.request(
+            "PROPFIND",
+            self.client.join_url(self.webdav_path),
+            content=build_ctag_request(),
+            headers={"Depth": "0", "Content-Type": "application/xml; charset=utf-8"},
+        )
+        if response.status_code != HTTPStatus.MULTI_STATUS:
+            raise HTTPError(response)
+        return parse_ctag(response.content)
+
+    def has_changed(self) -> bool:
+        """Poll the address book with a single small request and check if it has changed."""
+        ctag: Optional[str] = self.get_ctag()
+        if ctag is None:
+            logger.warning("Address book provides neither a sync token nor a CTag to poll.")
+            return False
+        changed: bool = ctag != self.ctag
+        if changed:
+            logger.debug("Address book changed from %s to %s.", self.ctag, ctag)
+        self.ctag = ctag
+        return changed
+
+    def get_changes(self, token: Optional[str]) -> SyncChanges:
+        """Fetch the hrefs changed or removed since a sync token (or all, if none)."""
+        with self.report(build_sync_collection_request(token), depth="0") as response:
+            return parse_sync_collection(response.read())
+
+    def sync(self, state: SyncState) -> SyncChanges:
+        """Bring a sync state up to date and return what changed since the last sync."""
+        with METRICS.stage("webdav_sync") as stage:
+            try:
+                changes: SyncChanges = self.get_changes(state.token)
+            except HTTPError as err:
+                if not state.token:
+                    raise
+                logger.warning("Sync token expired (%s), falling back to a full sync.", err)
+                state.token = None
+                changes = self.get_changes(None)
+            stage.items = len(changes.changed) + len(changes.removed)
+
+        # A full sync lists all existing vCards, so anything else must be gone
+        if not state.token:
+            changes.removed.update(set(state.cards) - set(changes.changed))
+
+        outdated: List[str] = [
+            href
+            for href, etag in changes.changed.items()
+            if etag is None or href not in state.cards or state.cards[href][0] != etag
+        ]
+        with METRICS.stage("webdav_fetch") as stage:
+            for card in self.fetch_vcards(outdated):
+                state.cards[card.href] = (card.etag or changes.changed.get(card.href), card.vcard)
+                stage.items += 1
+        for href in changes.removed:
+            state.cards.pop(href, None)
+        state.token = changes.token
+
+        logger.info(
+            "Found %i changed and %i removed Nextcloud vCards since last sync.",
+            len(outdated),
+            len(changes.removed),
+        )
+        return changes
+
     def get_contacts(self) -> Set[Contact]:
         """Fetch all Nextcloud contacts as vCards."""
-        result: Set[Contact] = set()
-        for file in self.get_vcf_files():
-            logger.debug("Reading vcf contact file %s.", file)
-
-            with self.client.open(file) as handle:
-                contact: Component = readOne(handle)
-                logger.debug("Reading Nextcloud contact %s.", contact.fn.value)
-                result.add(contact_from_vcard(contact))
+        with self.stream_contacts() as contacts:
+            result: Set[Contact] = set(contacts)
+        logger.info("Read a total of %i Nextcloud contacts.", len(result))
+        return result
 
+    def get_contacts_incremental(self, state_file: str) -> Set[Contact]:
+        """Fetch all Nextcloud contacts, downloading only vCards changed since the last run."""
+        with self.stream_contacts_incremental(state_file) as contacts:
+            result: Set[Contact] = set(contacts)
         logger.info("Read a total of %i Nextcloud contacts.", len(result))
         return result
+
+    def stream_contacts(self) -> ThreadedStage[Contact]:
+        """Start downloading and parsing all vCards in the background, passing on contacts."""
+        with METRICS.stage("webdav_listing") as stage:
+            files: List[str] = list(self.get_vcf_files())
+            stage.items = len(files)
+        cards: ThreadedStage[CardData] = ThreadedStage(self.stream_vcards(files), "webdav-fetch")
+        return ThreadedStage(self.parse_vcards(cards), "parse")
+
+    def stream_contacts_incremental(self, state_file: str) -> ThreadedStage[Contact]:
+        """Download vCards changed since the last run, then parse all in the background."""
+        state: SyncState = SyncState.load(state_file)
+        try:
+            self.sync(state)
+        except HTTPError as err:
+            logger.warning("Incremental sync is not supported (%s), reading all vCards.", err)
+            return self.stream_contacts()
+
+        state.save(state_file)
+        return ThreadedStage(
+            self.parse_vcards(
+                CardData(href, etag, vcard) for href, (etag, vcard) in state.cards.items()
+            ),
+            "parse",
+        )
+
+    def stream_vcards(self, files: List[str]) -> Generator[CardData, None, None]:
+        """Download vCard files, measuring the download stage."""
+        with METRICS.stage("webdav_fetch") as stage:
+            for card in self.fetch_vcards(files):
+                stage.items += 1
+                yield card
+
+    @staticmethod
+    def parse_vcards(cards: Iterable[CardData]) -> Generator[Contact, None, None]:
+        """Parse raw vCard data into contacts as they arrive, on all cores if enabled.
+
+        The cards are closed when parsing ends, fails or is stopped, e.g. to stop their download.
+        """
+        try:
+            pool: Optional[ParsePool] = get_parse_pool()
+            contacts: Iterable[Contact] = (
+                pool.parse(card.vcard for card in cards)
+                if pool
+                else VCARD_CONVERTER.convert_many(read_vcard(card.vcard) for card in cards)
+            )
+            with METRICS.stage("parse") as stage:
+                for contact in contacts:
+                    logger.debug("Read Nextcloud contact %s.", contact)
+                    stage.items += 1
+                    yield contact
+        finally:
+            close: Optional[Callable[[], None]] = getattr(cards, "close", None)
+            if close:
+                close()
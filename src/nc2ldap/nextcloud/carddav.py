@@ -0,0 +1,125 @@
+"""Module for CardDAV specific requests and multistatus responses."""
+
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, Generator, Iterable, Iterator, Optional, Set, Tuple, cast
+from xml.etree.ElementTree import Element, XMLPullParser, fromstring
+from xml.sax.saxutils import escape
+
+from nc2ldap.constants import LOG_LEVEL
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+NS_DAV: str = "DAV:"
+NS_CARDDAV: str = "urn:ietf:params:xml:ns:carddav"
+NS_CALENDARSERVER: str = "http://calendarserver.org/ns/"
+
+
+@dataclass(frozen=True)
+class CardData:
+    """Raw vCard data of a single address book resource."""
+
+    href: str
+    etag: Optional[str]
+    vcard: str
+
+
+@dataclass
+class SyncChanges:
+    """Changes of an address book since a given sync token."""
+
+    token: str
+    changed: Dict[str, Optional[str]] = field(default_factory=dict)
+    removed: Set[str] = field(default_factory=set)
+
+
+def build_multiget_request(hrefs: Iterable[str]) -> str:
+    """Build an addressbook-multiget REPORT body for a batch of vCard files."""
+    href_list: str = "".join(f"<d:href>{escape(href)}</d:href>" for href in hrefs)
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>'
+        f'<card:addressbook-multiget xmlns:d="{NS_DAV}" xmlns:card="{NS_CARDDAV}">'
+        "<d:prop><d:getetag/><card:address-data/></d:prop>"
+        f"{href_list}"
+        "</card:addressbook-multiget>"
+    )
+
+
+def build_sync_collection_request(token: Optional[str]) -> str:
+    """Build a sync-collection REPORT body, returning ETags of changed vCards only."""
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>'
+        f'<d:sync-collection xmlns:d="{NS_DAV}">'
+        f"<d:sync-token>{escape(token or '')}</d:sync-token>"
+        "<d:sync-level>1</d:sync-level>"
+        "<d:prop><d:getetag/></d:prop>"
+        "</d:sync-collection>"
+    )
+
+
+def build_ctag_request() -> str:
+    """Build a PROPFIND body asking for the collection's sync token and CTag only."""
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>'
+        f'<d:propfind xmlns:d="{NS_DAV}" xmlns:cs="{NS_CALENDARSERVER}">'
+        "<d:prop><d:sync-token/><cs:getctag/></d:prop>"
+        "</d:propfind>"
+    )
+
+
+def parse_ctag(content: bytes) -> Optional[str]:
+    """Extract the sync token, or the CTag if there is none, from a PROPFIND response."""
+    root: Element = fromstring(content)
+    for tag in (f"{{{NS_DAV}}}sync-token", f"{{{NS_CALENDARSERVER}}}getctag"):
+        for element in root.iter(tag):
+            if element.text and element.text.strip():
+                return element.text.strip()
+    return None
+
+
+def parse_sync_collection(content: bytes) -> SyncChanges:
+    """Parse a sync-collection multistatus response into changed and removed hrefs."""
+    root: Element = fromstring(content)
+    result: SyncChanges = SyncChanges(root.findtext(f"{{{NS_DAV}}}sync-token", "").strip())
+    for element in root.iterfind(f"{{{NS_DAV}}}response"):
+        href: str = element.findtext(f"{{{NS_DAV}}}href", "").strip()
+        if " 404 " in element.findtext(f"{{{NS_DAV}}}status", ""):
+            result.removed.add(href)
+        elif not href.endswith("/"):
+            result.changed[href] = element.findtext(
+                f"{{{NS_DAV}}}propstat/{{{NS_DAV}}}prop/{{{NS_DAV}}}getetag"
+            )
+    return result
+
+
+def parse_multistatus(chunks: Iterable[bytes]) -> Generator[CardData, None, None]:
+    """Incrementally parse a multistatus response and yield all vCards within."""
+    parser: XMLPullParser = XMLPullParser(events=("end",))
+    for chunk in chunks:
+        parser.feed(chunk)
+        for _event, element in cast(Iterator[Tuple[str, Element]], parser.read_events()):
+            if element.tag == f"{{{NS_DAV}}}response":
+                card: Optional[CardData] = _parse_response(element)
+                element.clear()  # Keep memory usage flat for large books
+                if card:
+                    yield card
+    parser.close()
+
+
+def _parse_response(element: Element) -> Optional[CardData]:
+    """Extract vCard data from a single response element, if successful."""
+    href: str = element.findtext(f"{{{NS_DAV}}}href", "").strip()
+    for propstat in element.iterfind(f"{{{NS_DAV}}}propstat"):
+        status: str = propstat.findtext(f"{{{NS_DAV}}}status", "")
+        if " 200 " not in status:
+            continue
+        vcard: Optional[str] = propstat.findtext(f"{{{NS_DAV}}}prop/{{{NS_CARDDAV}}}address-data")
+        if vcard:
+            return CardData(
+                href,
+                propstat.findtext(f"{{{NS_DAV}}}prop/{{{NS_DAV}}}getetag"),
+                vcard,
+            )
+    logger.warning("Received no vCard data for %s.", href)
+    return None
@@ -0,0 +1,127 @@
+"""Module for concurrent downloads of single vCard files."""
+
+import logging
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from http import HTTPStatus
+from threading import Lock
+from time import monotonic, sleep
+from typing import Generator, Iterable, List, Set
+
+from httpx import Client, Response, TransportError
+from webdav4.client import HTTPError
+
+from nc2ldap.constants import LOG_LEVEL
+from nc2ldap.metrics import METRICS
+
+from .carddav import CardData
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+RETRY_STATUS_CODES: Set[int] = {
+    HTTPStatus.TOO_MANY_REQUESTS,
+    HTTPStatus.INTERNAL_SERVER_ERROR,
+    HTTPStatus.BAD_GATEWAY,
+    HTTPStatus.SERVICE_UNAVAILABLE,
+    HTTPStatus.GATEWAY_TIMEOUT,
+}
+
+
+@dataclass
+class LatencyStats:
+    """Thread-safe latency statistics of single requests."""
+
+    samples: List[float] = field(default_factory=list)
+    retries: int = 0
+    lock: Lock = field(default_factory=Lock, repr=False)
+
+    def add(self, seconds: float) -> None:
+        """Record the duration of a successful request."""
+        with self.lock:
+            self.samples.append(seconds)
+
+    def add_retry(self) -> None:
+        """Record a failed attempt which is about to be retried."""
+        with self.lock:
+            self.retries += 1
+
+    def percentile(self, percent: float) -> float:
+        """Get a latency percentile in seconds."""
+        with self.lock:
+            ordered: List[float] = sorted(self.samples)
+        if not ordered:
+            return 0.0
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+    def __str__(self) -> str:
+        """Summarize the statistics for log output."""
+        return (
+            f"{len(self.samples)} requests, {self.retries} retries, "
+            f"p50 {self.percentile(50) * 1000:.0f} ms, "
+            f"p95 {self.percentile(95) * 1000:.0f} ms, "
+            f"max {self.percentile(100) * 1000:.0f} ms"
+        )
+
+
+class VCardFetcher:
+    """A bounded pool of workers downloading vCard files over a shared HTTP client."""
+
+    def __init__(
+        self,
+        http: Client,
+        workers: int,
+        timeout: float,
+        retries: int,
+        backoff: float = 0.5,
+    ) -> None:
+        """Set up the fetcher; all workers share the connection pool of the given client."""
+        self.http: Client = http
+        self.workers: int = max(1, workers)
+        self.timeout: float = timeout
+        self.retries: int = retries
+        self.backoff: float = backoff
+        self.stats: LatencyStats = LatencyStats()
+
+    def fetch(self, href: str) -> CardData:
+        """Download a single vCard file, retrying transient errors with backoff."""
+        attempt: int = 0
+        while True:
+            start: float = monotonic()
+            try:
+                response: Response = self.http.get(href, timeout=self.timeout)
+            except TransportError as err:
+                if attempt >= self.retries:
+                    raise
+                logger.debug("Retrying %s due to %r.", href, err)
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= self.retries:
+                    if response.is_error:
+                        raise HTTPError(response)
+                    self.stats.add(monotonic() - start)
+                    METRICS.add_bytes(response.num_bytes_downloaded)
+                    return CardData(href, response.headers.get("ETag"), response.text)
+                logger.debug("Retrying %s due to HTTP %i.", href, response.status_code)
+
+            self.stats.add_retry()
+            sleep(self.backoff * 2**attempt)
+            attempt += 1
+
+    def fetch_all(self, hrefs: Iterable[str]) -> Generator[CardData, None, None]:
+        """Download many vCard files concurrently and yield them in completion order."""
+        remaining = iter(hrefs)
+        with ThreadPoolExecutor(self.workers, thread_name_prefix="vcard-fetch") as pool:
+            pending: Set[Future[CardData]] = set()
+            while True:
+                # Keep a bounded number of downloads in flight at any time
+                for href in remaining:
+                    pending.add(pool.submit(self.fetch, href))
+                    if len(pending) >= 2 * self.workers:
+                        break
+                if not pending:
+                    break
+
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        logger.info("Downloaded single vCard files: %s.", self.stats)
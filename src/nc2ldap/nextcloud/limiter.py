@@ -0,0 +1,195 @@
+"""Module to adapt the number of concurrent requests to the load of the Nextcloud server."""
+
+import logging
+from email.utils import parsedate_to_datetime
+from http import HTTPStatus
+from threading import Condition, Lock
+from time import monotonic, time
+from typing import Callable, Dict, Iterator, List, Optional, Set
+from urllib.parse import urlsplit
+
+from httpx import (
+    BaseTransport,
+    PoolTimeout,
+    Request,
+    Response,
+    SyncByteStream,
+    TimeoutException,
+)
+
+from nc2ldap.constants import LOG_LEVEL, NEXTCLOUD_LATENCY_TARGET, NEXTCLOUD_WORKERS
+from nc2ldap.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+# Responses telling that the server or its PHP workers are busy
+OVERLOAD_STATUS_CODES: Set[int] = {
+    HTTPStatus.TOO_MANY_REQUESTS,
+    HTTPStatus.BAD_GATEWAY,
+    HTTPStatus.SERVICE_UNAVAILABLE,
+    HTTPStatus.GATEWAY_TIMEOUT,
+}
+
+# Upper limit for waiting as requested by the server, in seconds
+MAX_RETRY_AFTER: float = 300
+
+
+def parse_retry_after(value: Optional[str]) -> float:
+    """Get the seconds to wait from a Retry-After header, given in seconds or as HTTP date."""
+    if not value:
+        return 0.0
+    try:
+        seconds: float = float(value)
+    except ValueError:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time()
+        except (TypeError, ValueError):
+            return 0.0
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER)
+
+
+class AdaptiveLimiter:
+    """Limit the requests in flight to a server, adapting the limit with AIMD.
+
+    Each fast and successful response raises the limit by a fraction, i.e. by one per full window
+    of requests. Slow responses, timeouts and overload errors halve it, at most once per window.
+    """
+
+    def __init__(self, name: str, max_limit: int, target_latency: float) -> None:
+        """Start with few requests in flight, which grows quickly if the server keeps up."""
+        self.name: str = name
+        self.max_limit: float = float(max(1, max_limit))
+        self.limit: float = min(2.0, self.max_limit)
+        self.target_latency: float = target_latency
+        self.in_flight: int = 0
+        self.blocked_until: float = 0.0
+        self.last_decrease: float = float("-inf")
+        self.condition: Condition = Condition()
+        METRICS.set_concurrency_limit(name, self.limit)
+
+    def acquire(self, timeout: Optional[float] = None) -> float:
+        """Wait for a free slot and until the server accepts requests again; get the time.
+
+        Raises a PoolTimeout if that takes longer than the timeout, if any.
+        """
+        deadline: Optional[float] = None if timeout is None else monotonic() + timeout
+        with self.condition:
+            while True:
+                now: float = monotonic()
+                if self.blocked_until <= now and self.in_flight < int(self.limit):
+                    break
+                if deadline is not None and now >= deadline:
+                    raise PoolTimeout(f"No free slot for requests to {self.name} in {timeout} s.")
+                # Wake up when the server accepts requests again, or at the deadline
+                wake: List[float] = [t for t in (self.blocked_until, deadline) if t and t > now]
+                self.condition.wait(min(wake) - now if wake else None)
+            self.in_flight += 1
+        return monotonic()
+
+    def release(self) -> None:
+        """Free the slot of a finished request."""
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def record(self, start: float, overloaded: bool = False, retry_after: float = 0.0) -> None:
+        """Adapt the limit to the response of a request started at the given time."""
+        with self.condition:
+            now: float = monotonic()
+            if retry_after > 0:
+                self.blocked_until = max(self.blocked_until, now + retry_after)
+            if not overloaded and now - start <= self.target_latency:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            elif start >= self.last_decrease:
+                # Requests sent before the last decrease don't reflect the new limit yet
+                self.limit = max(1.0, self.limit / 2)
+                self.last_decrease = now
+                logger.info(
+                    "Nextcloud server %s is busy, reducing concurrent requests to %i.",
+                    self.name,
+                    self.limit,
+                )
+            METRICS.set_concurrency_limit(self.name, self.limit)
+            self.condition.notify_all()
+
+
+class ReleasingStream(SyncByteStream):
+    """A response body which frees its request's slot once it is closed."""
+
+    def __init__(self, stream: SyncByteStream, release: Callable[[], None]) -> None:
+        """Wrap the body of a response."""
+        self.stream: SyncByteStream = stream
+        self.release: Optional[Callable[[], None]] = release
+
+    def __iter__(self) -> Iterator[bytes]:
+        """Pass on the body as it is received."""
+        yield from self.stream
+
+    def close(self) -> None:
+        """Close the body and free the slot, only once."""
+        try:
+            self.stream.close()
+        finally:
+            if self.release:
+                self.release()
+                self.release = None
+
+
+class LimitedTransport(BaseTransport):
+    """An HTTP transport sending requests only as fast as the server can handle them."""
+
+    def __init__(self, transport: BaseTransport, limiter: AdaptiveLimiter) -> None:
+        """Wrap a transport, e.g. with its own connection pool."""
+        self.transport: BaseTransport = transport
+        self.limiter: AdaptiveLimiter = limiter
+
+    def handle_request(self, request: Request) -> Response:
+        """Send a request once the limiter allows to; its slot is freed with the response.
+
+        Waiting for the limiter counts against the pool timeout of the request.
+        """
+        timeouts: Dict[str, Optional[float]] = request.extensions.get("timeout", {})
+        start: float = self.limiter.acquire(timeouts.get("pool"))
+        try:
+            response: Response = self.transport.handle_request(request)
+        except TimeoutException:
+            self.limiter.release()
+            self.limiter.record(start, overloaded=True)
+            raise
+        except BaseException:
+            self.limiter.release()
+            raise
+
+        # Latency is measured up to the headers, as bodies of batch downloads may be large
+        self.limiter.record(
+            start,
+            response.status_code in OVERLOAD_STATUS_CODES,
+            parse_retry_after(response.headers.get("Retry-After")),
+        )
+        if response.is_closed:
+            self.limiter.release()
+        else:
+            assert isinstance(response.stream, SyncByteStream)
+            response.stream = ReleasingStream(response.stream, self.limiter.release)
+        return response
+
+    def close(self) -> None:
+        """Close the wrapped transport."""
+        self.transport.close()
+
+
+LIMITERS: Dict[str, AdaptiveLimiter] = {}
+LIMITERS_LOCK: Lock = Lock()
+
+
+def get_limiter(host: str, max_limit: int = NEXTCLOUD_WORKERS) -> AdaptiveLimiter:
+    """Get the limiter shared by all address books on a Nextcloud server.
+
+    The first address book of a server sets the upper limit of concurrent requests.
+    """
+    name: str = urlsplit(host).netloc or host
+    with LIMITERS_LOCK:
+        if name not in LIMITERS:
+            LIMITERS[name] = AdaptiveLimiter(name, max_limit, NEXTCLOUD_LATENCY_TARGET)
+        return LIMITERS[name]
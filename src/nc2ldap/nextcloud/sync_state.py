@@ -0,0 +1,44 @@
+"""Module to persist the state of incremental address book syncs."""
+
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+
+from nc2ldap.constants import LOG_LEVEL
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+
+@dataclass
+class SyncState:
+    """Last sync token along with ETag and raw vCard data of each known href."""
+
+    token: Optional[str] = None
+    cards: Dict[str, Tuple[Optional[str], str]] = field(default_factory=dict)
+
+    @classmethod
+    def load(cls, path: str) -> "SyncState":
+        """Read a previously saved state, or start from scratch if there's none."""
+        try:
+            with open(path, encoding="utf-8") as handle:
+                data = json.load(handle)
+            return cls(
+                data["token"],
+                {href: (etag, vcard) for href, (etag, vcard) in data["cards"].items()},
+            )
+        except FileNotFoundError:
+            logger.info("No sync state found at %s, starting from scratch.", path)
+        except (ValueError, KeyError, TypeError):
+            logger.warning("Ignoring invalid sync state at %s.", path, exc_info=True)
+        return cls()
+
+    def save(self, path: str) -> None:
+        """Write this state to disk atomically."""
+        temp_path: str = f"{path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as handle:
+            json.dump({"token": self.token, "cards": self.cards}, handle)
+        os.replace(temp_path, path)
+        logger.debug("Saved sync state with %i vCards to %s.", len(self.cards), path)
@@ -0,0 +1,96 @@
+"""Module to run the stages of a sync concurrently, connected by bounded queues."""
+
+import logging
+from contextvars import Context, copy_context
+from dataclasses import dataclass
+from queue import Full, Queue
+from threading import Event, Thread
+from typing import Any, Generic, Iterable, Iterator, Optional, TypeVar, Union
+
+from nc2ldap.constants import LOG_LEVEL, SYNC_QUEUE_SIZE
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True)
+class StageEnd:
+    """Marks the end of a stage's items, and why it ended."""
+
+    error: Optional[BaseException] = None
+
+
+class ThreadedStage(Generic[T]):
+    """Produce the items of an iterable in a background thread, passing them on via a queue.
+
+    The queue is bounded, so a stage never runs far ahead of its consumer. Errors of the
+    stage are raised to the consumer. Closing a stage stops it and closes its items, which
+    stops a stage it consumes directly; generators consuming a stage need to close it themselves.
+    """
+
+    def __init__(self, items: Iterable[T], name: str, maxsize: int = SYNC_QUEUE_SIZE) -> None:
+        """Start producing items right away, in the context (e.g. tenant) of the caller."""
+        self.items: Iterable[T] = items
+        self.queue: Queue[Union[T, StageEnd]] = Queue(max(1, maxsize))
+        self.stopped: Event = Event()
+        self.done: bool = False
+        context: Context = copy_context()
+        self.thread: Thread = Thread(target=context.run, args=(self.produce,), name=name)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def offer(self, item: Union[T, StageEnd]) -> bool:
+        """Wait for room in the queue to add an item, unless the stage is stopped."""
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def produce(self) -> None:
+        """Pass all items on to the queue, followed by the end marker."""
+        iterator: Iterator[T] = iter(self.items)
+        try:
+            for item in iterator:
+                if not self.offer(item):
+                    return
+            self.offer(StageEnd())
+        except BaseException as err:  # pylint: disable=broad-exception-caught
+            self.offer(StageEnd(err))
+        finally:
+            close: Any = getattr(iterator, "close", None)
+            if close:
+                close()
+
+    def __iter__(self) -> "ThreadedStage[T]":
+        """Consume the items of this stage."""
+        return self
+
+    def __next__(self) -> T:
+        """Wait for the next item of this stage."""
+        if self.done:
+            raise StopIteration
+        item: Union[T, StageEnd] = self.queue.get()
+        if isinstance(item, StageEnd):
+            self.done = True
+            self.thread.join()
+            if item.error is not None:
+                raise item.error
+            raise StopIteration
+        return item
+
+    def close(self) -> None:
+        """Stop producing items, e.g. if the consumer failed, and wait for the stage to end."""
+        self.stopped.set()
+        self.done = True
+        self.thread.join()
+
+    def __enter__(self) -> "ThreadedStage[T]":
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.close()
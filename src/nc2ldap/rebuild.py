@@ -0,0 +1,75 @@
+"""Rebuild phone books from scratch in a single bulk load, or export them as LDIF files."""
+
+import logging
+from argparse import ArgumentParser, Namespace
+from time import time
+from typing import List, Set
+
+from nc2ldap.constants import LDAP_BACKEND, LOG_LEVEL, TENANTS_FILE
+from nc2ldap.contact import Contact
+from nc2ldap.ldap import PhoneBook, PhoneBookEntry, write_ldif
+from nc2ldap.sync import (
+    LDAP_POOL,
+    MEMORY_BACKEND,
+    create_address_book,
+    load_phone_book,
+    save_snapshot,
+)
+from nc2ldap.tenants import Tenant, default_tenant, get_tenant_file, load_tenants
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+
+def export_tenant(tenant: Tenant, contacts: Set[Contact], path: str) -> None:
+    """Write the phone book of a tenant to an LDIF file, e.g. for use with slapadd."""
+    with open(path, "w", encoding="utf-8") as handle:
+        entries: List[PhoneBookEntry] = write_ldif(
+            handle, tenant.phone_book, PhoneBook.phone_book_ou, PhoneBook.contact_ou, contacts
+        )
+    logger.info("Exported %i contacts of %s to %s.", len(entries), tenant.name, path)
+
+
+def rebuild_tenant(tenant: Tenant, contacts: Set[Contact]) -> None:
+    """Replace the phone book of a tenant with a freshly loaded one."""
+    with LDAP_POOL.phone_book(tenant.phone_book) as phone_book:
+        phone_book.rebuild(contacts, load_phone_book)
+        if tenant.snapshot_file:
+            save_snapshot(tenant, phone_book, time())
+    logger.info("Rebuilt phone book %s with %i contacts.", tenant.phone_book, len(contacts))
+
+
+def parse_args() -> Namespace:
+    """Parse command line arguments."""
+    parser: ArgumentParser = ArgumentParser(prog="python -m nc2ldap.rebuild", description=__doc__)
+    parser.add_argument("--tenant", action="append", help="only process tenants of this name")
+    parser.add_argument("--ldif", help="write LDIF to this file instead of loading it")
+    return parser.parse_args()
+
+
+def main() -> None:
+    """Rebuild or export the phone books of all (or the selected) tenants."""
+    args: Namespace = parse_args()
+    if LDAP_BACKEND == MEMORY_BACKEND and not args.ldif:
+        raise SystemExit("Phone books served from memory are rebuilt by every sync.")
+    tenants: List[Tenant] = load_tenants(TENANTS_FILE) if TENANTS_FILE else [default_tenant()]
+    if args.tenant:
+        unknown: Set[str] = set(args.tenant) - {tenant.name for tenant in tenants}
+        if unknown:
+            raise SystemExit(f"Unknown tenants: {', '.join(sorted(unknown))}")
+        tenants = [tenant for tenant in tenants if tenant.name in args.tenant]
+
+    for tenant in tenants:
+        contacts: Set[Contact] = create_address_book(tenant).get_contacts()
+        if args.ldif:
+            export_tenant(
+                tenant,
+                contacts,
+                get_tenant_file(args.ldif, tenant.name) if len(tenants) > 1 else args.ldif,
+            )
+        else:
+            rebuild_tenant(tenant, contacts)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,10 @@
+"""Module for serving phone books from memory via LDAP, instead of a separate server."""
+
+from .directory import DIRECTORY, Directory
+from .protocol import LdapServer
+
+__ALL__ = (
+    DIRECTORY,
+    Directory,
+    LdapServer,
+)
@@ -0,0 +1,93 @@
+"""Module to encode and decode the subset of BER used by LDAP messages."""
+
+from typing import List, Optional, Tuple, Union
+
+# Universal tags
+BOOLEAN: int = 0x01
+INTEGER: int = 0x02
+OCTET_STRING: int = 0x04
+ENUMERATED: int = 0x0A
+SEQUENCE: int = 0x30
+SET: int = 0x31
+
+# Upper limit for the size of a single message, as phones only send small requests
+MAX_MESSAGE_SIZE: int = 1 << 20
+
+# An element's tag and content
+Element = Tuple[int, bytes]
+
+
+class BerError(ValueError):
+    """Malformed or unsupported BER data."""
+
+
+def read_header(data: Union[bytes, bytearray], offset: int = 0) -> Optional[Tuple[int, int, int]]:
+    """Read the tag and length of an element, returning tag, start and end of its content.
+
+    Returns None if the header is incomplete, e.g. as more data is yet to be received.
+    """
+    if len(data) < offset + 2:
+        return None
+    tag: int = data[offset]
+    length: int = data[offset + 1]
+    start: int = offset + 2
+    if length & 0x80:
+        count: int = length & 0x7F
+        if not 0 < count <= 4:
+            raise BerError(f"Unsupported length of {count} bytes.")
+        if len(data) < start + count:
+            return None
+        length_end: int = start + count
+        length = int.from_bytes(data[start:length_end], "big")
+        start = length_end
+    if tag & 0x1F == 0x1F:
+        raise BerError("Multi-byte tags are not supported.")
+    return tag, start, start + length
+
+
+def decode(data: bytes) -> List[Element]:
+    """Split the content of a constructed element into its elements."""
+    elements: List[Element] = []
+    offset: int = 0
+    while offset < len(data):
+        header: Optional[Tuple[int, int, int]] = read_header(data, offset)
+        if header is None or header[2] > len(data):
+            raise BerError("Element exceeds its enclosing element.")
+        tag, start, end = header
+        elements.append((tag, data[start:end]))
+        offset = end
+    return elements
+
+
+def decode_int(data: bytes) -> int:
+    """Decode the content of an INTEGER or ENUMERATED element."""
+    return int.from_bytes(data, "big", signed=True)
+
+
+def decode_str(data: bytes) -> str:
+    """Decode the content of an OCTET STRING element holding UTF-8 text."""
+    return data.decode(errors="replace")
+
+
+def encode(tag: int, content: bytes) -> bytes:
+    """Encode an element from its tag and content."""
+    length: int = len(content)
+    if length < 0x80:
+        return bytes((tag, length)) + content
+    size: bytes = length.to_bytes((length.bit_length() + 7) // 8, "big")
+    return bytes((tag, 0x80 | len(size))) + size + content
+
+
+def encode_int(value: int, tag: int = INTEGER) -> bytes:
+    """Encode an INTEGER or ENUMERATED element."""
+    return encode(tag, value.to_bytes(value.bit_length() // 8 + 1, "big", signed=True))
+
+
+def encode_str(value: str, tag: int = OCTET_STRING) -> bytes:
+    """Encode an OCTET STRING element holding UTF-8 text."""
+    return encode(tag, value.encode())
+
+
+def encode_seq(*elements: bytes, tag: int = SEQUENCE) -> bytes:
+    """Encode a constructed element from already encoded elements."""
+    return encode(tag, b"".join(elements))
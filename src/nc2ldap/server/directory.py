@@ -0,0 +1,216 @@
+"""Module to hold published phone books in memory, indexed for fast searches."""
+
+import logging
+import re
+from threading import Lock
+from typing import AbstractSet, Dict, Iterable, List, Mapping, Optional, Set, Tuple
+
+from nc2ldap.constants import LOG_LEVEL
+from nc2ldap.contact import Contact, LdapRecord, contact_to_ldap_record
+from nc2ldap.ldap import PhoneBook
+from nc2ldap.ldap.diff import get_contact_key, unique_contacts
+from nc2ldap.ldap.dn_index import DnIndex, get_rdn, get_rdn_value
+
+from .ber import SET, encode_seq, encode_str
+from .filters import Filter, ValueIndex, Values, get_attribute_name, normalize
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+# Search scopes, see RFC 4511, section 4.5.1.2
+BASE_OBJECT: int = 0
+SINGLE_LEVEL: int = 1
+WHOLE_SUBTREE: int = 2
+
+SEARCH_RESULT_ENTRY: int = 0x64
+
+RDN: re.Pattern = re.compile(r"(?:\\.|[^,\\])+", re.DOTALL)
+
+CONTACT_OBJECT_CLASSES: Tuple[str, ...] = (
+    "top",
+    "person",
+    "organizationalPerson",
+    PhoneBook.contact_ou,
+)
+
+
+def normalize_dn(dn: str) -> str:
+    """Normalize a DN for comparison, ignoring case and spaces around separators."""
+    rdns: List[str] = []
+    for rdn in RDN.findall(dn):
+        name, _, value = rdn.partition("=")
+        rdns.append(f"{name.strip().lower()}={value.strip().lower()}")
+    return ",".join(rdns)
+
+
+def encode_entry(dn: str, attributes: Iterable[Tuple[str, List[str]]]) -> bytes:
+    """Encode an entry as search result."""
+    return encode_seq(
+        encode_str(dn),
+        encode_seq(
+            *(
+                encode_seq(encode_str(name), encode_seq(*map(encode_str, values), tag=SET))
+                for name, values in attributes
+            )
+        ),
+        tag=SEARCH_RESULT_ENTRY,
+    )
+
+
+class Entry:
+    """An entry of the directory with its attributes, normalized values and encoded form."""
+
+    __slots__ = ("dn", "attributes", "values", "encoded")
+
+    def __init__(self, dn: str, attributes: Dict[str, List[str]]) -> None:
+        """Prepare an entry for matching and sending it."""
+        self.dn: str = dn
+        self.attributes: Dict[str, List[str]] = attributes
+        self.values: Values = {
+            name.lower(): tuple(normalize(name.lower(), v) for v in values)
+            for name, values in attributes.items()
+        }
+        self.encoded: bytes = encode_entry(dn, attributes.items())
+
+    def encode(self, names: Optional[Set[str]], types_only: bool) -> bytes:
+        """Encode this entry as search result with all or only some of its attributes."""
+        if names is None and not types_only:
+            return self.encoded
+        return encode_entry(
+            self.dn,
+            (
+                (name, [] if types_only else values)
+                for name, values in self.attributes.items()
+                if names is None or name.lower() in names
+            ),
+        )
+
+
+class PhoneBookIndex:
+    """The entries of a single phone book, starting with the phone book itself."""
+
+    def __init__(self, phone_book: str, entries: List[Entry]) -> None:
+        """Index all attribute values of the entries."""
+        self.phone_book: str = phone_book
+        self.key: str = normalize_dn(phone_book)
+        self.entries: List[Entry] = entries
+        self.positions: Dict[str, int] = {normalize_dn(e.dn): i for i, e in enumerate(entries)}
+        positions: Dict[str, Dict[str, Set[int]]] = {}
+        for position, entry in enumerate(entries):
+            for name, values in entry.values.items():
+                by_value: Dict[str, Set[int]] = positions.setdefault(name, {})
+                for value in values:
+                    by_value.setdefault(value, set()).add(position)
+        self.index: Dict[str, ValueIndex] = {
+            name: ValueIndex(by_value) for name, by_value in positions.items()
+        }
+
+    @classmethod
+    def build(cls, phone_book: str, contacts: Iterable[Contact]) -> "PhoneBookIndex":
+        """Create the entries of a phone book, allocating DNs like a sync to LDAP would."""
+        naming_attribute: str = get_rdn(phone_book).split("=", 1)[0]
+        entries: List[Entry] = [
+            Entry(
+                phone_book,
+                {
+                    "objectClass": ["top", PhoneBook.phone_book_ou],
+                    naming_attribute: [get_rdn_value(phone_book)],
+                },
+            )
+        ]
+        index: DnIndex = DnIndex(phone_book)
+        for contact in sorted(unique_contacts(contacts), key=get_contact_key):
+            dn: str = index.allocate(contact)
+            record: LdapRecord = contact_to_ldap_record(contact)
+            attributes: Dict[str, List[str]] = {
+                "objectClass": list(CONTACT_OBJECT_CLASSES),
+                "cn": [get_rdn_value(dn)],
+            }
+            for name, value in record.items():
+                attributes[name] = value if isinstance(value, list) else [value]
+            entries.append(Entry(dn, attributes))
+        return cls(phone_book, entries)
+
+    def get_scope(self, base: str, scope: int) -> Optional[range]:
+        """Get the positions of all entries in scope of a search, or None if it's elsewhere."""
+        if base == self.key:
+            if scope == BASE_OBJECT:
+                return range(1)
+            return range(1 if scope == SINGLE_LEVEL else 0, len(self.entries))
+        if base in self.positions:
+            position: int = self.positions[base]
+            return range(position, position + (0 if scope == SINGLE_LEVEL else 1))
+        if not base or self.key.endswith(f",{base}"):
+            if scope == WHOLE_SUBTREE:
+                return range(len(self.entries))
+            parent: str = self.key.split(",", 1)[-1]
+            return range(1 if scope == SINGLE_LEVEL and parent == base else 0)
+        return None
+
+    def search(self, base: str, scope: int, search_filter: Filter) -> Optional[List[Entry]]:
+        """Find all matching entries in scope of a search, or None if it's elsewhere."""
+        positions: Optional[range] = self.get_scope(base, scope)
+        if positions is None:
+            return None
+        candidates: Iterable[int] = positions
+        if len(positions) > 1:
+            found: Optional[AbstractSet[int]] = search_filter.lookup(self.index)
+            if found is not None:
+                candidates = sorted(p for p in found if p in positions)
+        return [
+            self.entries[p] for p in candidates if search_filter.matches(self.entries[p].values)
+        ]
+
+
+class Directory:
+    """All published phone books, replaced as a whole after each sync.
+
+    Searches never wait for a sync, as they always see a complete version of each phone book.
+    """
+
+    def __init__(self) -> None:
+        """Start without any phone books."""
+        self.lock: Lock = Lock()
+        self.phone_books: Mapping[str, PhoneBookIndex] = {}
+
+    def publish(self, phone_book: str, contacts: Iterable[Contact]) -> int:
+        """Replace the contents of a phone book, returning the number of its contacts."""
+        index: PhoneBookIndex = PhoneBookIndex.build(phone_book, contacts)
+        with self.lock:
+            self.phone_books = {**self.phone_books, index.key: index}
+        logger.info("Published %i contacts in phone book %s.", len(index.entries) - 1, phone_book)
+        return len(index.entries) - 1
+
+    def get_root(self) -> Entry:
+        """Describe this server and its phone books in the root DSE."""
+        return Entry(
+            "",
+            {
+                "objectClass": ["top"],
+                "namingContexts": [p.phone_book for p in self.phone_books.values()],
+                "supportedLDAPVersion": ["3"],
+            },
+        )
+
+    def search(self, base: str, scope: int, search_filter: Filter) -> Optional[List[Entry]]:
+        """Find all matching entries in scope of a search, or None if the base doesn't exist."""
+        key: str = normalize_dn(base)
+        if not key and scope == BASE_OBJECT:
+            root: Entry = self.get_root()
+            return [root] if search_filter.matches(root.values) else []
+
+        results: Optional[List[Entry]] = None
+        for phone_book in self.phone_books.values():
+            entries: Optional[List[Entry]] = phone_book.search(key, scope, search_filter)
+            if entries is not None:
+                results = (results or []) + entries
+        return results
+
+
+def get_attribute_names(descriptions: Iterable[str]) -> Optional[Set[str]]:
+    """Get the lowercase names of requested attributes, or None for all of them."""
+    names: Set[str] = {get_attribute_name(d) for d in descriptions}
+    return None if not names or "*" in names else names
+
+
+DIRECTORY: Directory = Directory()
@@ -0,0 +1,316 @@
+"""Module to decode LDAP search filters and match them against directory entries."""
+
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from dataclasses import dataclass
+from itertools import islice
+from typing import (
+    AbstractSet,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from nc2ldap.constants import LDAP_PHONE_KEYS_ATTRIBUTE
+
+from .ber import BerError, Element, decode, decode_str
+
+# Filter choices, see RFC 4511, section 4.5.1
+AND: int = 0xA0
+OR: int = 0xA1
+NOT: int = 0xA2
+EQUALITY_MATCH: int = 0xA3
+SUBSTRINGS: int = 0xA4
+GREATER_OR_EQUAL: int = 0xA5
+LESS_OR_EQUAL: int = 0xA6
+PRESENT: int = 0x87
+APPROX_MATCH: int = 0xA8
+
+SUBSTRING_INITIAL: int = 0x80
+SUBSTRING_ANY: int = 0x81
+SUBSTRING_FINAL: int = 0x82
+
+# Phone numbers are matched like telephoneNumberMatch does, ignoring spaces and hyphens
+PHONE_ATTRIBUTES: FrozenSet[str] = frozenset(
+    ("telephonenumber", "facsimiletelephonenumber", "mobile", "homephone")
+    + ((LDAP_PHONE_KEYS_ATTRIBUTE.lower(),) if LDAP_PHONE_KEYS_ATTRIBUTE else ())
+)
+
+# Normalized values of an entry by lowercase attribute name
+Values = Mapping[str, Tuple[str, ...]]
+
+
+class ValueIndex:
+    """Positions of all entries by normalized value of an attribute.
+
+    Values are also kept sorted, forwards and backwards, to find those with a given prefix or
+    suffix, e.g. the ending of a phone number, by binary search.
+    """
+
+    __slots__ = ("positions", "present", "ordered", "reversed")
+
+    def __init__(self, positions: Dict[str, Set[int]]) -> None:
+        """Index the positions of all entries by value."""
+        self.positions: Dict[str, Set[int]] = positions
+        self.present: FrozenSet[int] = frozenset().union(*positions.values())
+        self.ordered: List[str] = sorted(positions)
+        self.reversed: List[str] = sorted(value[::-1] for value in positions)
+
+    def starting_with(self, prefix: str) -> Iterator[str]:
+        """Get all values starting with a prefix."""
+        for value in islice(self.ordered, bisect_left(self.ordered, prefix), None):
+            if not value.startswith(prefix):
+                break
+            yield value
+
+    def ending_with(self, suffix: str) -> Iterator[str]:
+        """Get all values ending with a suffix."""
+        prefix: str = suffix[::-1]
+        for value in islice(self.reversed, bisect_left(self.reversed, prefix), None):
+            if not value.startswith(prefix):
+                break
+            yield value[::-1]
+
+
+# Indexed values of all entries by lowercase attribute name
+Index = Mapping[str, ValueIndex]
+
+
+def get_attribute_name(description: str) -> str:
+    """Get the lowercase name of an attribute description, dropping options like ';lang-de'."""
+    return description.split(";", 1)[0].strip().lower()
+
+
+def normalize(attribute: str, value: str) -> str:
+    """Normalize a value for case-insensitive matching; phone numbers also lose separators."""
+    if attribute in PHONE_ATTRIBUTES:
+        return value.lower().replace(" ", "").replace("-", "")
+    return value.lower()
+
+
+class Filter(ABC):
+    """A search filter, which may narrow down candidates using the index."""
+
+    @abstractmethod
+    def matches(self, values: Values) -> bool:
+        """Check whether an entry matches this filter."""
+
+    def lookup(self, index: Index) -> Optional[AbstractSet[int]]:
+        """Get the positions of all entries possibly matching, or None to check all of them."""
+        # pylint: disable=unused-argument
+        return None
+
+
+@dataclass(frozen=True)
+class AndFilter(Filter):
+    """Match entries matching all filters."""
+
+    filters: Tuple[Filter, ...]
+
+    def matches(self, values: Values) -> bool:
+        """Check whether an entry matches all filters."""
+        return all(f.matches(values) for f in self.filters)
+
+    def lookup(self, index: Index) -> Optional[AbstractSet[int]]:
+        """Intersect the candidates of all filters using the index."""
+        found: List[AbstractSet[int]] = sorted(
+            (ids for ids in (f.lookup(index) for f in self.filters) if ids is not None), key=len
+        )
+        if not found:
+            return None
+        result: Set[int] = set(found[0])
+        for ids in found[1:]:
+            result.intersection_update(ids)
+        return result
+
+
+@dataclass(frozen=True)
+class OrFilter(Filter):
+    """Match entries matching any filter."""
+
+    filters: Tuple[Filter, ...]
+
+    def matches(self, values: Values) -> bool:
+        """Check whether an entry matches any filter."""
+        return any(f.matches(values) for f in self.filters)
+
+    def lookup(self, index: Index) -> Optional[AbstractSet[int]]:
+        """Unite the candidates of all filters, if all of them use the index."""
+        result: Set[int] = set()
+        for search_filter in self.filters:
+            ids: Optional[AbstractSet[int]] = search_filter.lookup(index)
+            if ids is None:
+                return None
+            result.update(ids)
+        return result
+
+
+@dataclass(frozen=True)
+class NotFilter(Filter):
+    """Match entries not matching a filter."""
+
+    filter: Filter
+
+    def matches(self, values: Values) -> bool:
+        """Check whether an entry doesn't match the filter."""
+        return not self.filter.matches(values)
+
+
+@dataclass(frozen=True)
+class EqualityFilter(Filter):
+    """Match entries with an attribute value equal to the given one."""
+
+    attribute: str
+    value: str
+
+    def matches(self, values: Values) -> bool:
+        """Check whether an entry has the value."""
+        return self.value in values.get(self.attribute, ())
+
+    def lookup(self, index: Index) -> Optional[AbstractSet[int]]:
+        """Get all entries with the value from the index."""
+        values: Optional[ValueIndex] = index.get(self.attribute)
+        return values.positions.get(self.value, frozenset()) if values else frozenset()
+
+
+@dataclass(frozen=True)
+class SubstringFilter(Filter):
+    """Match entries with an attribute value containing the given parts in order."""
+
+    attribute: str
+    initial: str
+    parts: Tuple[str, ...]
+    final: str
+
+    def matches(self, values: Values) -> bool:
+        """Check whether any value of an entry contains all parts."""
+        return any(self.matches_value(value) for value in values.get(self.attribute, ()))
+
+    def lookup(self, index: Index) -> Optional[AbstractSet[int]]:
+        """Get all entries with a matching value, searching values by prefix or suffix if given."""
+        values: Optional[ValueIndex] = index.get(self.attribute)
+        if values is None:
+            return frozenset()
+        candidates: Iterable[str] = values.positions
+        if self.initial or self.final:
+            candidates = (
+                values.starting_with(self.initial)
+                if len(self.initial) >= len(self.final)
+                else values.ending_with(self.final)
+            )
+        result: Set[int] = set()
+        for value in candidates:
+            if self.matches_value(value):
+                result.update(values.positions[value])
+        return result
+
+    def matches_value(self, value: str) -> bool:
+        """Check whether a single value contains all parts."""
+        if not value.startswith(self.initial):
+            return False
+        position: int = len(self.initial)
+        for part in self.parts:
+            position = value.find(part, position)
+            if position < 0:
+                return False
+            position += len(part)
+        return len(value) - len(self.final) >= position and value.endswith(self.final)
+
+
+@dataclass(frozen=True)
+class OrderingFilter(Filter):
+    """Match entries with an attribute value ordered before or after the given one."""
+
+    attribute: str
+    value: str
+    greater: bool
+
+    def matches(self, values: Values) -> bool:
+        """Compare all values of an entry to the given one."""
+        return any(
+            (v >= self.value) if self.greater else (v <= self.value)
+            for v in values.get(self.attribute, ())
+        )
+
+
+@dataclass(frozen=True)
+class PresentFilter(Filter):
+    """Match entries having an attribute."""
+
+    attribute: str
+
+    def matches(self, values: Values) -> bool:
+        """Check whether an entry has any value of the attribute."""
+        return self.attribute in values
+
+    def lookup(self, index: Index) -> Optional[AbstractSet[int]]:
+        """Get all entries having the attribute from the index."""
+        values: Optional[ValueIndex] = index.get(self.attribute)
+        return values.present if values else frozenset()
+
+
+@dataclass(frozen=True)
+class UndefinedFilter(Filter):
+    """Match no entries, e.g. for unsupported extensible matches."""
+
+    def matches(self, values: Values) -> bool:
+        """Never match."""
+        return False
+
+    def lookup(self, index: Index) -> Optional[AbstractSet[int]]:
+        """Never match."""
+        return frozenset()
+
+
+def parse_assertion(data: bytes) -> Tuple[str, str]:
+    """Decode an attribute value assertion into attribute name and normalized value."""
+    elements: List[Element] = decode(data)
+    attribute: str = get_attribute_name(decode_str(elements[0][1]))
+    return attribute, normalize(attribute, decode_str(elements[1][1]))
+
+
+def parse_substrings(data: bytes) -> SubstringFilter:
+    """Decode a substring filter."""
+    elements: List[Element] = decode(data)
+    attribute: str = get_attribute_name(decode_str(elements[0][1]))
+    initial: str = ""
+    parts: List[str] = []
+    final: str = ""
+    for tag, value in decode(elements[1][1]):
+        part: str = normalize(attribute, decode_str(value))
+        if tag == SUBSTRING_INITIAL:
+            initial = part
+        elif tag == SUBSTRING_ANY:
+            parts.append(part)
+        elif tag == SUBSTRING_FINAL:
+            final = part
+    return SubstringFilter(attribute, initial, tuple(parts), final)
+
+
+def parse_filter(element: Element) -> Filter:
+    """Decode a search filter."""
+    # pylint: disable=too-many-return-statements
+    tag, data = element
+    if tag == AND:
+        return AndFilter(tuple(parse_filter(e) for e in decode(data)))
+    if tag == OR:
+        return OrFilter(tuple(parse_filter(e) for e in decode(data)))
+    if tag == NOT:
+        return NotFilter(parse_filter(decode(data)[0]))
+    if tag in (EQUALITY_MATCH, APPROX_MATCH):
+        return EqualityFilter(*parse_assertion(data))
+    if tag == SUBSTRINGS:
+        return parse_substrings(data)
+    if tag in (GREATER_OR_EQUAL, LESS_OR_EQUAL):
+        return OrderingFilter(*parse_assertion(data), greater=tag == GREATER_OR_EQUAL)
+    if tag == PRESENT:
+        return PresentFilter(get_attribute_name(decode_str(data)))
+    if tag & 0xC0 != 0x80:
+        raise BerError(f"Invalid filter tag {tag:#x}.")
+    return UndefinedFilter()
@@ -0,0 +1,212 @@
+"""Module to answer binds and searches of LDAP clients, e.g. desk phones, from memory."""
+
+import asyncio
+import logging
+from hmac import compare_digest
+from threading import Thread
+from typing import Dict, List, Optional, Set, Tuple
+
+from nc2ldap.constants import LOG_LEVEL
+
+from .ber import (
+    BOOLEAN,
+    ENUMERATED,
+    MAX_MESSAGE_SIZE,
+    SEQUENCE,
+    BerError,
+    Element,
+    decode,
+    decode_int,
+    decode_str,
+    encode_int,
+    encode_seq,
+    encode_str,
+    read_header,
+)
+from .directory import DIRECTORY, Directory, Entry, get_attribute_names, normalize_dn
+from .filters import Filter, parse_filter
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+# Protocol operations, see RFC 4511, section 4.2 ff.
+BIND_REQUEST: int = 0x60
+BIND_RESPONSE: int = 0x61
+UNBIND_REQUEST: int = 0x42
+SEARCH_REQUEST: int = 0x63
+SEARCH_RESULT_DONE: int = 0x65
+ABANDON_REQUEST: int = 0x50
+EXTENDED_REQUEST: int = 0x77
+EXTENDED_RESPONSE: int = 0x78
+
+# Write operations and their responses, which are all refused
+WRITE_RESPONSES: Dict[int, int] = {
+    0x66: 0x67,  # Modify
+    0x68: 0x69,  # Add
+    0x4A: 0x6B,  # Delete
+    0x6C: 0x6D,  # Modify DN
+    0x6E: 0x6F,  # Compare
+}
+
+SIMPLE_AUTHENTICATION: int = 0x80
+
+# Result codes, see RFC 4511, appendix A
+SUCCESS: int = 0
+PROTOCOL_ERROR: int = 2
+SIZE_LIMIT_EXCEEDED: int = 4
+AUTH_METHOD_NOT_SUPPORTED: int = 7
+NO_SUCH_OBJECT: int = 32
+INVALID_CREDENTIALS: int = 49
+INSUFFICIENT_ACCESS_RIGHTS: int = 50
+UNWILLING_TO_PERFORM: int = 53
+
+
+def encode_result(tag: int, code: int, message: str = "") -> bytes:
+    """Encode the result of an operation."""
+    return encode_seq(encode_int(code, ENUMERATED), encode_str(""), encode_str(message), tag=tag)
+
+
+class LdapProtocol(asyncio.Protocol):
+    """A read-only LDAP v3 connection, serving the phone books of a directory."""
+
+    def __init__(self, directory: Directory, user: str, password: str, anonymous: bool) -> None:
+        """Start unauthenticated, unless anonymous searches are allowed."""
+        self.directory: Directory = directory
+        self.user: str = normalize_dn(user)
+        self.password: str = password
+        self.anonymous: bool = anonymous
+        self.bound: bool = anonymous
+        self.buffer: bytearray = bytearray()
+        self.transport: Optional[asyncio.Transport] = None
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        """Remember the connection to answer on."""
+        assert isinstance(transport, asyncio.Transport)
+        self.transport = transport
+
+    def data_received(self, data: bytes) -> None:
+        """Handle all complete messages received so far."""
+        self.buffer += data
+        while self.transport and not self.transport.is_closing():
+            try:
+                header: Optional[Tuple[int, int, int]] = read_header(self.buffer)
+                if header is None:
+                    return
+                tag, start, end = header
+                if tag != SEQUENCE or end > MAX_MESSAGE_SIZE:
+                    raise BerError(f"Invalid message with tag {tag:#x} and size {end}.")
+                if len(self.buffer) < end:
+                    return
+                message: bytes = bytes(self.buffer[start:end])
+                del self.buffer[:end]
+                self.handle(decode(message))
+            except (BerError, ValueError, IndexError) as err:
+                logger.warning("Closing LDAP connection after invalid request: %s", err)
+                self.transport.close()
+
+    def send(self, message_id: int, *operations: bytes) -> None:
+        """Answer a request with one or more messages."""
+        assert self.transport
+        self.transport.write(
+            b"".join(encode_seq(encode_int(message_id), operation) for operation in operations)
+        )
+
+    def handle(self, message: List[Element]) -> None:
+        """Handle a single request."""
+        message_id: int = decode_int(message[0][1])
+        tag, data = message[1]
+        if tag == BIND_REQUEST:
+            self.send(message_id, self.bind(decode(data)))
+        elif tag == SEARCH_REQUEST:
+            self.send(message_id, *self.search(decode(data)))
+        elif tag == UNBIND_REQUEST:
+            assert self.transport
+            self.transport.close()
+        elif tag == ABANDON_REQUEST:
+            pass  # Searches are answered at once, so there's nothing to abandon
+        elif tag == EXTENDED_REQUEST:
+            self.send(message_id, encode_result(EXTENDED_RESPONSE, PROTOCOL_ERROR))
+        elif tag in WRITE_RESPONSES:
+            self.send(
+                message_id,
+                encode_result(WRITE_RESPONSES[tag], UNWILLING_TO_PERFORM, "Read-only server."),
+            )
+        else:
+            raise BerError(f"Unknown operation {tag:#x}.")
+
+    def bind(self, request: List[Element]) -> bytes:
+        """Authenticate with a simple bind; binds without password are anonymous."""
+        (_, version), (_, name), (method, credentials) = request[:3]
+        self.bound = self.anonymous
+        if decode_int(version) not in (2, 3):
+            return encode_result(BIND_RESPONSE, PROTOCOL_ERROR, "Unsupported version.")
+        if method != SIMPLE_AUTHENTICATION:
+            return encode_result(BIND_RESPONSE, AUTH_METHOD_NOT_SUPPORTED)
+        if not credentials:
+            return encode_result(BIND_RESPONSE, SUCCESS)
+        if normalize_dn(decode_str(name)) != self.user or not compare_digest(
+            credentials, self.password.encode()
+        ):
+            return encode_result(BIND_RESPONSE, INVALID_CREDENTIALS)
+        self.bound = True
+        return encode_result(BIND_RESPONSE, SUCCESS)
+
+    def search(self, request: List[Element]) -> List[bytes]:
+        """Find all matching entries and send them, followed by the result."""
+        base, scope, _, size_limit, _, types_only, filter_element, attributes = request[:8]
+        if not self.bound:
+            return [encode_result(SEARCH_RESULT_DONE, INSUFFICIENT_ACCESS_RIGHTS)]
+        if types_only[0] != BOOLEAN:
+            raise BerError("Invalid search request.")
+
+        search_filter: Filter = parse_filter(filter_element)
+        entries: Optional[List[Entry]] = self.directory.search(
+            decode_str(base[1]), decode_int(scope[1]), search_filter
+        )
+        if entries is None:
+            return [encode_result(SEARCH_RESULT_DONE, NO_SUCH_OBJECT)]
+
+        limit: int = decode_int(size_limit[1])
+        code: int = SUCCESS
+        if 0 < limit < len(entries):
+            entries = entries[:limit]
+            code = SIZE_LIMIT_EXCEEDED
+        names: Optional[Set[str]] = get_attribute_names(
+            decode_str(value) for _, value in decode(attributes[1])
+        )
+        return [e.encode(names, types_only[1] != b"\0") for e in entries] + [
+            encode_result(SEARCH_RESULT_DONE, code)
+        ]
+
+
+class LdapServer:
+    """An LDAP server running its own event loop in a background thread."""
+
+    def __init__(
+        self,
+        port: int,
+        user: str,
+        password: str,
+        *,
+        host: str = "",
+        anonymous: bool = False,
+        directory: Directory = DIRECTORY,
+    ) -> None:
+        """Listen for connections and answer them in the background."""
+        self.loop: asyncio.AbstractEventLoop = asyncio.new_event_loop()
+        self.server: asyncio.base_events.Server = self.loop.run_until_complete(
+            self.loop.create_server(
+                lambda: LdapProtocol(directory, user, password, anonymous), host or None, port
+            )
+        )
+        self.port: int = self.server.sockets[0].getsockname()[1]
+        self.thread: Thread = Thread(target=self.loop.run_forever, name="ldap-server", daemon=True)
+        self.thread.start()
+        logger.info("Serving phone books via LDAP on port %i.", self.port)
+
+    def close(self) -> None:
+        """Stop serving and wait for the background thread to end."""
+        self.loop.call_soon_threadsafe(self.server.close)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
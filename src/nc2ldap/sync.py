@@ -0,0 +1,33 @@
+"""Resources and helpers shared by syncs and rebuilds of the phone books."""
+
+from nc2ldap.constants import LDAP_ADMIN_PASSWORD, LDAP_ADMIN_USER, LDAP_HOST
+from nc2ldap.ldap import ConnectionPool, PhoneBook, Snapshot, load_ldif
+from nc2ldap.nextcloud import AddressBook
+from nc2ldap.tenants import Tenant
+
+LDAP_POOL: ConnectionPool = ConnectionPool(LDAP_HOST, LDAP_ADMIN_USER, LDAP_ADMIN_PASSWORD)
+
+# Backend serving the phone books from memory, without a separate LDAP server
+MEMORY_BACKEND: str = "memory"
+
+
+def create_address_book(tenant: Tenant) -> AddressBook:
+    """Connect to a tenant's Nextcloud address book."""
+    return AddressBook(
+        tenant.host,
+        tenant.address_book,
+        tenant.user,
+        tenant.app_token,
+    )
+
+
+def load_phone_book(path: str):
+    """Add all entries of an LDIF file to the LDAP server with ldapadd."""
+    load_ldif(LDAP_HOST, LDAP_ADMIN_USER, LDAP_ADMIN_PASSWORD, path)
+
+
+def save_snapshot(tenant: Tenant, phone_book: PhoneBook, verified: float):
+    """Remember the entries of a phone book after a successful sync."""
+    Snapshot(tenant.phone_book, list(phone_book.entries.values()), verified).save(
+        tenant.snapshot_file
+    )
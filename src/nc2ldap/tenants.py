@@ -0,0 +1,100 @@
+"""Module to configure which address books are synced to which phone books."""
+
+import logging
+import os
+import tomllib
+from dataclasses import dataclass
+from typing import Any, Dict, List
+
+from nc2ldap.constants import (
+    LDAP_PHONE_BOOK,
+    LDAP_SNAPSHOT_FILE,
+    LOG_LEVEL,
+    NEXTCLOUD_ADDRESS_BOOK,
+    NEXTCLOUD_APP_TOKEN,
+    NEXTCLOUD_HOST,
+    NEXTCLOUD_SYNC_STATE_FILE,
+    NEXTCLOUD_USER,
+)
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+
+@dataclass(frozen=True)
+class Tenant:
+    """A Nextcloud address book and the LDAP phone book it is synced to."""
+
+    name: str
+    host: str
+    user: str
+    app_token: str
+    address_book: str
+    phone_book: str
+    sync_state_file: str = ""
+    snapshot_file: str = ""
+
+
+def default_tenant() -> Tenant:
+    """Build the single tenant configured by environment variables."""
+    return Tenant(
+        NEXTCLOUD_USER.lower(),
+        NEXTCLOUD_HOST,
+        NEXTCLOUD_USER,
+        NEXTCLOUD_APP_TOKEN,
+        NEXTCLOUD_ADDRESS_BOOK,
+        LDAP_PHONE_BOOK,
+        NEXTCLOUD_SYNC_STATE_FILE,
+        LDAP_SNAPSHOT_FILE,
+    )
+
+
+def get_tenant_file(path: str, name: str) -> str:
+    """Derive a separate file per tenant from a configured one, if any."""
+    if not path:
+        return ""
+    root, ext = os.path.splitext(path)
+    return f"{root}-{name}{ext}"
+
+
+def load_tenants(path: str) -> List[Tenant]:
+    """Read all tenants from a TOML file; missing values default to environment variables.
+
+    Each [[tenant]] table needs at least a user and a phone_book DN. Values of an optional
+    [defaults] table apply to all tenants, e.g. a common host.
+    """
+    with open(path, "rb") as handle:
+        data: Dict[str, Any] = tomllib.load(handle)
+
+    defaults: Dict[str, Any] = {
+        "host": NEXTCLOUD_HOST,
+        "address_book": NEXTCLOUD_ADDRESS_BOOK,
+        **data.get("defaults", {}),
+    }
+    result: List[Tenant] = []
+    for index, table in enumerate(data.get("tenant", [])):
+        values: Dict[str, Any] = {**defaults, **table}
+        try:
+            name: str = values.get("name") or values["user"].lower()
+            result.append(
+                Tenant(
+                    name,
+                    values["host"],
+                    values["user"],
+                    values["app_token"],
+                    values["address_book"],
+                    values["phone_book"],
+                    values.get("sync_state_file", get_tenant_file(NEXTCLOUD_SYNC_STATE_FILE, name)),
+                    values.get("snapshot_file", get_tenant_file(LDAP_SNAPSHOT_FILE, name)),
+                )
+            )
+        except KeyError as err:
+            raise ValueError(f"Tenant #{index + 1} in {path} lacks a value for {err}.") from err
+
+    names: List[str] = [tenant.name for tenant in result]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Tenant names in {path} are not unique: {', '.join(names)}")
+    if not result:
+        raise ValueError(f"No tenants configured in {path}.")
+    logger.info("Loaded %i tenants from %s.", len(result), path)
+    return result
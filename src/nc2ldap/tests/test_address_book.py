@@ -0,0 +1,48 @@
+"""Test the Nextcloud address book client against a local CardDAV server."""
+
+from threading import enumerate as enumerate_threads
+from typing import Dict
+
+import pytest
+
+from nc2ldap.benchmark.generator import generate_address_book
+from nc2ldap.benchmark.webdav_server import CardDavServer
+from nc2ldap.nextcloud import AddressBook, address_book
+
+
+def test_has_changed() -> None:
+    """Check that polling detects changes of the sync token only."""
+    with CardDavServer("/remote.php/dav/addressbooks/users/joey/contacts", {}) as server:
+        address_book: AddressBook = AddressBook(server.url, "contacts", "joey", "")
+        assert address_book.has_changed()
+        assert not address_book.has_changed()
+        address_book.ctag = "http://sabre.io/ns/sync/0"
+        assert address_book.has_changed()
+
+
+def test_get_contacts() -> None:
+    """Check that all vCards are downloaded in batches and parsed."""
+    files: Dict[str, str] = generate_address_book(25)
+    with CardDavServer("/remote.php/dav/addressbooks/users/joey/contacts", files) as server:
+        address_book: AddressBook = AddressBook(server.url, "contacts", "joey", "", batch_size=10)
+        assert {c.uid for c in address_book.get_contacts()} == {
+            name.removesuffix(".vcf") for name in files
+        }
+
+
+def test_stream_contacts_failure(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Check that a failing parser stops the download and frees its connection."""
+
+    def fail(data: str) -> None:
+        raise ValueError(f"Unparseable vCard {data[:10]}")
+
+    monkeypatch.setattr(address_book, "read_vcard", fail)
+    files: Dict[str, str] = generate_address_book(3000)
+    with CardDavServer("/remote.php/dav/addressbooks/users/joey/contacts", files) as server:
+        book: AddressBook = AddressBook(server.url, "contacts", "joey", "")
+        with pytest.raises(ValueError, match="Unparseable"):
+            with book.stream_contacts() as contacts:
+                list(contacts)
+
+    assert not [t for t in enumerate_threads() if t.name in ("webdav-fetch", "parse")]
+    assert book.limiter.in_flight == 0
@@ -0,0 +1,31 @@
+"""Test pipelined LDAP writes."""
+
+from ldap3 import MOCK_ASYNC, Connection, Server
+
+from nc2ldap.ldap.batch_writer import BatchWriter, WriteFailure
+
+
+def test_batch_writer() -> None:
+    """Check that all operations are sent and failures are collected by DN."""
+    connection: Connection = Connection(Server("mock"), client_strategy=MOCK_ASYNC)
+    connection.bind()
+    writer: BatchWriter = BatchWriter(connection, window=2)
+    writer.submit("ou=phonebook,dc=mytld,dc=com", connection.add, ["organizationalUnit"])
+    writer.flush()
+    for name in ("Joey", "Catto", "Joey"):
+        writer.submit(
+            f"cn={name},ou=phonebook,dc=mytld,dc=com",
+            connection.add,
+            ["inetOrgPerson"],
+            {"sn": name},
+        )
+    writer.submit("cn=Kitty,ou=phonebook,dc=mytld,dc=com", connection.delete)
+    writer.flush()
+
+    assert writer.count == 5
+    assert not writer.in_flight
+    assert [(f.operation, f.dn) for f in writer.failures] == [
+        ("add", "cn=Joey,ou=phonebook,dc=mytld,dc=com"),
+        ("delete", "cn=Kitty,ou=phonebook,dc=mytld,dc=com"),
+    ]
+    assert all(isinstance(f, WriteFailure) for f in writer.failures)
@@ -0,0 +1,94 @@
+"""Test CardDAV request and response functions."""
+
+from typing import List
+
+from nc2ldap.nextcloud.carddav import (
+    CardData,
+    SyncChanges,
+    build_multiget_request,
+    parse_ctag,
+    parse_multistatus,
+    parse_sync_collection,
+)
+
+MULTISTATUS: bytes = b"""<?xml version="1.0"?>
+<d:multistatus xmlns:d="DAV:" xmlns:card="urn:ietf:params:xml:ns:carddav">
+ <d:response>
+  <d:href>/remote.php/dav/addressbooks/users/joey/contacts/1.vcf</d:href>
+  <d:propstat>
+   <d:prop>
+    <d:getetag>"abc"</d:getetag>
+    <card:address-data>BEGIN:VCARD&#13;
+VERSION:3.0&#13;
+N:Doe;Joey;;;&#13;
+END:VCARD&#13;
+</card:address-data>
+   </d:prop>
+   <d:status>HTTP/1.1 200 OK</d:status>
+  </d:propstat>
+ </d:response>
+ <d:response>
+  <d:href>/remote.php/dav/addressbooks/users/joey/contacts/2.vcf</d:href>
+  <d:propstat>
+   <d:prop><d:getetag/><card:address-data/></d:prop>
+   <d:status>HTTP/1.1 404 Not Found</d:status>
+  </d:propstat>
+ </d:response>
+</d:multistatus>
+"""
+
+
+def test_build_multiget_request() -> None:
+    """Check building a multiget REPORT body with escaped hrefs."""
+    result: str = build_multiget_request(["/a.vcf", "/b&c.vcf"])
+    assert "<card:addressbook-multiget" in result
+    assert "<d:href>/a.vcf</d:href><d:href>/b&amp;c.vcf</d:href>" in result
+
+
+def test_parse_multistatus() -> None:
+    """Check incremental parsing of a chunked multistatus response."""
+    chunks: List[bytes] = [bytes([byte]) for byte in MULTISTATUS]
+    result: List[CardData] = list(parse_multistatus(chunks))
+    assert len(result) == 1
+    assert result[0].href == "/remote.php/dav/addressbooks/users/joey/contacts/1.vcf"
+    assert result[0].etag == '"abc"'
+    assert "N:Doe;Joey;;;" in result[0].vcard
+
+
+def test_parse_sync_collection() -> None:
+    """Check parsing changed and removed hrefs from a sync-collection response."""
+    result: SyncChanges = parse_sync_collection(b"""<?xml version="1.0"?>
+<d:multistatus xmlns:d="DAV:">
+ <d:response>
+  <d:href>/contacts/1.vcf</d:href>
+  <d:propstat>
+   <d:prop><d:getetag>"abc"</d:getetag></d:prop>
+   <d:status>HTTP/1.1 200 OK</d:status>
+  </d:propstat>
+ </d:response>
+ <d:response>
+  <d:href>/contacts/2.vcf</d:href>
+  <d:status>HTTP/1.1 404 Not Found</d:status>
+ </d:response>
+ <d:sync-token>http://sabre.io/ns/sync/42</d:sync-token>
+</d:multistatus>
+""")
+    assert result.token == "http://sabre.io/ns/sync/42"
+    assert result.changed == {"/contacts/1.vcf": '"abc"'}
+    assert result.removed == {"/contacts/2.vcf"}
+
+
+def test_parse_ctag() -> None:
+    """Check that the sync token is preferred over the CTag."""
+    response: bytes = b"""<?xml version="1.0"?>
+<d:multistatus xmlns:d="DAV:" xmlns:cs="http://calendarserver.org/ns/">
+ <d:response>
+  <d:href>/remote.php/dav/addressbooks/users/joey/contacts/</d:href>
+  <d:propstat>
+   <d:prop><cs:getctag>42</cs:getctag><d:sync-token>http://sabre.io/ns/sync/42</d:sync-token></d:prop>
+   <d:status>HTTP/1.1 200 OK</d:status>
+  </d:propstat>
+ </d:response>
+</d:multistatus>"""
+    assert parse_ctag(response) == "http://sabre.io/ns/sync/42"
+    assert parse_ctag(response.replace(b"http://sabre.io/ns/sync/42", b"")) == "42"
@@ -4,12 +4,11 @@ from typing import Any, Dict
 from uuid import UUID
 
 import pytest
-from phonenumbers import FrozenPhoneNumber, parse
 
 from nc2ldap.contact import Contact
 
 
-def is_valid_uuid(uuid_to_test: str, version: int = 4):
+def is_valid_uuid(uuid_to_test: str, version: int = 5):
     """Check if uuid_to_test is a valid UUID."""
     try:
         uuid_obj = UUID(uuid_to_test, version=version)
@@ -22,6 +21,7 @@ def is_valid_uuid(uuid_to_test: str, version: int = 4):
     ("contact", "expected"),
     [
         (Contact(), "uuid"),
+        (Contact(uid="abc-123"), "abc-123"),
         (Contact(first_name="Joey"), "Joey"),
         (Contact(last_name="Doe"), "Doe"),
         (Contact("Joey", "Doe"), "Joey Doe"),
@@ -37,7 +37,7 @@ def is_valid_uuid(uuid_to_test: str, version: int = 4):
         ),
         (Contact(email="cat@cathouse.cat"), "uuid"),
         (
-            Contact(phone_private=FrozenPhoneNumber(parse("+49 5555 123"))),
+            Contact(phone_private="+495555123"),
             "uuid",
         ),
     ],
@@ -47,5 +47,20 @@ def test_get_cn(contact: Contact, expected: Dict[str, Any]) -> None:
     result: str = contact.get_cn()
     if expected == "uuid":
         assert is_valid_uuid(result)
+        assert result == contact.get_cn()
     else:
         assert expected == result
+
+
+def test_compact_contact() -> None:
+    """Check that equal contacts share their hash and recurring strings."""
+    contact: Contact = Contact("Joey", "Doe", (None, "12345 Kittentown"), company="Cat Inc.")
+    other: Contact = Contact(
+        "".join(["Jo", "ey"]), "Doe", (None, "".join(["12345 ", "Kittentown"])), company="Cat Inc."
+    )
+    assert contact == other
+    assert hash(contact) == hash(other)
+    assert contact.first_name is other.first_name
+    assert contact.address[1] is other.address[1]
+    assert contact != Contact("Joey", "Doe")
+    assert not hasattr(contact, "__dict__")
@@ -1,16 +1,26 @@
 """Test contact converter functions."""
 
-from typing import Any, Dict
+from typing import Any, Dict, Tuple
 
 import pytest
-from phonenumbers import FrozenPhoneNumber, parse
 from vobject.base import Component, readOne
 
 from nc2ldap.contact import (
     Contact,
+    LdapRecord,
+    VCardConverter,
     contact_from_ldap_dict,
     contact_from_vcard,
+    contact_hash,
     contact_to_ldap_dict,
+    contact_to_ldap_record,
+    converters,
+    get_phone_cache_info,
+)
+from nc2ldap.contact.converters import (
+    format_phone_number,
+    get_phone_match_keys,
+    parse_phone_number,
 )
 
 
@@ -21,10 +31,10 @@ from nc2ldap.contact import (
         (Contact("Joey", "Doe"), {"givenName": "Joey", "sn": "Doe"}),
         (
             Contact(
-                phone_private=FrozenPhoneNumber(parse("+49 5555 123")),
-                phone_mobile=FrozenPhoneNumber(parse("+49 5555 234")),
-                phone_business1=FrozenPhoneNumber(parse("+49 5555 345")),
-                phone_business2=FrozenPhoneNumber(parse("+49 5555 456")),
+                phone_private="+495555123",
+                phone_mobile="+495555234",
+                phone_business1="+495555345",
+                phone_business2="+495555456",
             ),
             {
                 "sn": "",
@@ -50,6 +60,7 @@ from nc2ldap.contact import (
             Contact(first_name="Joey", email="cat@cathouse.cat"),
             {"sn": "", "givenName": "Joey", "mail": "cat@cathouse.cat"},
         ),
+        (Contact(last_name="Doe", uid="abc-123"), {"sn": "Doe", "uid": "abc-123"}),
     ],
 )
 def test_contact_to_ldap(contact: Contact, expected: Dict[str, Any]) -> None:
@@ -63,6 +74,7 @@ def test_contact_to_ldap(contact: Contact, expected: Dict[str, Any]) -> None:
     [
         ({}, Contact(last_name="<???>")),
         ({"sn": ""}, Contact(last_name="<???>")),
+        ({"sn": [], "givenName": []}, Contact(last_name="<???>")),
         (
             {"givenName": ["Joey"], "sn": "Doe"},
             Contact("Joey", "Doe"),
@@ -76,10 +88,10 @@ def test_contact_to_ldap(contact: Contact, expected: Dict[str, Any]) -> None:
             },
             Contact(
                 last_name="<???>",
-                phone_private=FrozenPhoneNumber(parse("+49 5555 123")),
-                phone_mobile=FrozenPhoneNumber(parse("+49 5555 234")),
-                phone_business1=FrozenPhoneNumber(parse("+49 5555 345")),
-                phone_business2=FrozenPhoneNumber(parse("+49 5555 456")),
+                phone_private="+495555123",
+                phone_mobile="+495555234",
+                phone_business1="+495555345",
+                phone_business2="+495555456",
             ),
         ),
         (
@@ -102,6 +114,7 @@ def test_contact_to_ldap(contact: Contact, expected: Dict[str, Any]) -> None:
                 email="cat@cathouse.cat",
             ),
         ),
+        ({"sn": "Doe", "uid": ["abc-123"]}, Contact(last_name="Doe", uid="abc-123")),
     ],
 )
 def test_ldap_to_contact(data: Dict[str, Any], expected: Contact) -> None:
@@ -119,6 +132,7 @@ BEGIN:VCARD
 VERSION:3.0
 N:Doe;Joey;;Spoiled cat;
 FN:Joey Doe
+UID:abc-123
 ORG:Black Cat & Paws Inc.;
 EMAIL;type=INTERNET;type=HOME;type=pref:cat@cathouse.cat
 TEL;type=CELL;type=VOICE;type=pref:+49 5555 234
@@ -137,10 +151,11 @@ END:VCARD
                 "cat@cathouse.cat",
                 "Black Cat & Paws Inc.",
                 "Spoiled cat",
-                FrozenPhoneNumber(parse("+49 5555 123")),
-                FrozenPhoneNumber(parse("+49 5555 234")),
-                FrozenPhoneNumber(parse("+49 5555 345")),
+                "+495555123",
+                "+495555234",
+                "+495555345",
                 None,
+                "abc-123",
             ),
         ),
         (
@@ -168,8 +183,8 @@ END:VCARD
             Contact(
                 first_name="Joey",
                 last_name="Doe",
-                phone_private=FrozenPhoneNumber(parse("+49 5555 123")),
-                phone_mobile=FrozenPhoneNumber(parse("+49 5555 234")),
+                phone_private="+495555123",
+                phone_mobile="+495555234",
             ),
         ),
     ],
@@ -180,3 +195,93 @@ def test_vcard_to_contact(serialized: str, expected: Contact):
     vcard: Component = readOne(serialized)
     result: Contact = contact_from_vcard(vcard)
     assert expected == result
+
+
+def test_vcard_converter(caplog: pytest.LogCaptureFixture) -> None:
+    """Check that the last value of each type wins, others are reported, and vCards are kept."""
+    vcard: Component = readOne("""
+BEGIN:VCARD
+VERSION:3.0
+N:;;;;
+FN:Black Cat & Paws Inc.
+ORG:Dogs Ltd.;
+ORG:Black Cat & Paws Inc.;Sales
+EMAIL:first@cathouse.cat
+EMAIL;type=WORK:second@cathouse.cat
+TEL;type=HOME;type=CELL;type=VOICE:+49 5555 111
+TEL;type=HOME;type=VOICE:+49 5555 123
+TEL;type=CELL;type=VOICE:+49 5555 234
+TEL;type=WORK;type=VOICE:+49 5555 345
+END:VCARD
+""")
+    expected: Contact = Contact(
+        last_name="Sales",
+        email="second@cathouse.cat",
+        phone_private="+495555123",
+        phone_mobile="+495555234",
+        phone_business1="+495555345",
+    )
+    converter: VCardConverter = VCardConverter()
+    assert converter.convert(vcard) == expected
+    assert list(converter.convert_many([vcard, vcard])) == [expected, expected]
+    assert "Found multiple 'home' attributes in vCard for Black Cat & Paws Inc." in caplog.text
+    assert "Found multiple 'cell' attributes in vCard for Black Cat & Paws Inc." in caplog.text
+    assert "Found multiple 'work' attributes" not in caplog.text
+
+
+def test_phone_cache() -> None:
+    """Check that recurring phone numbers are served from the cache."""
+    before: Dict[str, Dict[str, int]] = get_phone_cache_info()
+    for _ in range(3):
+        contact: Contact = contact_from_ldap_dict({"sn": "Doe", "mobile": "+49 5555 777"})
+        contact_to_ldap_dict(contact)
+    after: Dict[str, Dict[str, int]] = get_phone_cache_info()
+    assert after["parse"]["hits"] - before["parse"]["hits"] >= 2
+    assert after["format"]["hits"] - before["format"]["hits"] >= 2
+    assert parse_phone_number("+49 5555 777") == "+495555777"
+
+
+def test_phone_extension() -> None:
+    """Check that extensions are kept in the compact form of phone numbers."""
+    number: str = parse_phone_number("+49 5555 123 ext. 45")
+    assert number == "+495555123;ext=45"
+    assert format_phone_number(number) == "+49 5555 123 ext. 45"
+
+
+@pytest.mark.parametrize(
+    ("number", "suffix_digits", "expected"),
+    [
+        ("+49 5555 123", 0, ("+495555123", "495555123", "05555123")),
+        ("+49 5555 123", 6, ("+495555123", "495555123", "05555123", "555123", "5555123")),
+        (
+            "+1 650 253 0000",
+            7,
+            ("+16502530000", "16502530000", "0016502530000", "2530000", "02530000")
+            + ("502530000", "6502530000"),
+        ),
+    ],
+)
+def test_phone_match_keys(
+    monkeypatch: pytest.MonkeyPatch, number: str, suffix_digits: int, expected: Tuple[str, ...]
+) -> None:
+    """Check all forms a phone number might be looked up in, with digit suffixes if enabled."""
+    monkeypatch.setattr(converters, "LDAP_PHONE_KEYS_SUFFIX_DIGITS", suffix_digits)
+    get_phone_match_keys.cache_clear()
+    assert get_phone_match_keys(parse_phone_number(number)) == expected
+    get_phone_match_keys.cache_clear()
+
+
+def test_phone_match_keys_record(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Check that match keys are written if enabled, and ignored when reading contacts."""
+    contact: Contact = Contact(
+        last_name="Doe",
+        phone_private=parse_phone_number("+49 5555 123"),
+        phone_mobile=parse_phone_number("+49 5555 123"),
+    )
+    assert "pager" not in contact_to_ldap_record(contact)
+
+    monkeypatch.setattr(converters, "LDAP_PHONE_KEYS_ATTRIBUTE", "pager")
+    record: LdapRecord = contact_to_ldap_record(contact)
+    assert record["pager"] == ["+495555123", "495555123", "05555123"]
+    assert record["description"] == contact_hash(contact)
+    assert contact_from_ldap_dict({**record, "pager": list(record["pager"])}) == contact
@@ -0,0 +1,101 @@
+"""Test contact diff functions."""
+
+from typing import Dict, List
+
+import pytest
+from ldap3 import MODIFY_REPLACE
+
+from nc2ldap.contact import Contact, contact_hash
+from nc2ldap.contact.converters import ldap_dict_hash
+from nc2ldap.ldap import ContactDiff, PhoneBookEntry, diff_contacts
+from nc2ldap.ldap.diff import AttributeChanges, hash_attributes, replace_attributes
+
+
+def entry(contact: Contact, content_hash: str = "") -> PhoneBookEntry:
+    """Build the phone book entry of a contact as read from the server."""
+    return PhoneBookEntry(
+        f"cn={contact.get_cn()},ou=phonebook",
+        contact.get_cn(),
+        contact.uid,
+        content_hash or contact_hash(contact),
+    )
+
+
+def test_diff_contacts() -> None:
+    """Check matching contacts on their key and sorting them into changes by their hash."""
+    unchanged: Contact = Contact("Joey", "Doe", uid="1")
+    renamed: Contact = Contact("Joe", "Doe", uid="2")
+    deleted: Contact = Contact("Catto", uid="3")
+    added: Contact = Contact("Kitty", uid="4")
+    legacy: Contact = Contact("Paws", "Cat")
+    outdated: PhoneBookEntry = entry(Contact("Joe", "Dough", uid="2"))
+
+    result: ContactDiff = diff_contacts(
+        [entry(unchanged), outdated, entry(deleted), entry(legacy)],
+        [unchanged, renamed, added, legacy, Contact("Duplicate", uid="4")],
+    )
+    assert result.added == [added]
+    assert result.deleted == [entry(deleted)]
+    assert result.updated == [(outdated, renamed)]
+
+
+def test_diff_contacts_legacy() -> None:
+    """Check that entries without a matching hash are updated, and duplicates are removed."""
+    contact: Contact = Contact("Joey", "Doe", uid="1")
+    legacy: PhoneBookEntry = PhoneBookEntry("cn=Joey Doe,ou=phonebook", "Joey Doe", "1")
+    duplicate: PhoneBookEntry = entry(contact, "0123")
+
+    result: ContactDiff = diff_contacts([legacy, duplicate], [contact])
+    assert not result.added
+    assert result.deleted == [duplicate]
+    assert result.updated == [(legacy, contact)]
+
+
+def test_replace_attributes() -> None:
+    """Check that all contact attributes are replaced, removing those not set."""
+    result: AttributeChanges = replace_attributes({"sn": "Doe", "description": "0123"})
+    assert result["sn"] == [(MODIFY_REPLACE, ["Doe"])]
+    assert result["description"] == [(MODIFY_REPLACE, ["0123"])]
+    assert result["mobile"] == [(MODIFY_REPLACE, [])]
+    assert "cn" not in result
+
+
+def test_replace_changed_attributes() -> None:
+    """Check that only attributes differing from the old entry are replaced."""
+    old: PhoneBookEntry = PhoneBookEntry(
+        "cn=Joey Doe,ou=phonebook",
+        "Joey Doe",
+        "1",
+        "0123",
+        hash_attributes(
+            {"sN": ["Doe"], "mobile": "+49 5555", "description": "0123", "cn": "Joey Doe"}
+        ),
+    )
+    result: AttributeChanges = replace_attributes(
+        {"sn": "Doe", "homePhone": "+49 5555", "description": "4567", "cn": ["Joey Doe"]}, old
+    )
+    assert result == {
+        "homePhone": [(MODIFY_REPLACE, ["+49 5555"])],
+        "mobile": [(MODIFY_REPLACE, [])],
+        "description": [(MODIFY_REPLACE, ["4567"])],
+    }
+
+
+@pytest.mark.parametrize(
+    ("old", "new", "equal"),
+    [
+        ({"sn": "Doe"}, {"sn": "Doe"}, True),
+        ({"sn": "Doe", "givenName": "Joey"}, {"givenName": "Joey", "sn": "Doe"}, True),
+        ({"sn": "Doe"}, {"sn": "Dough"}, False),
+        ({"sn": "Doe", "mobile": "+49 5555"}, {"sn": "Doe", "homePhone": "+49 5555"}, False),
+    ],
+)
+def test_contact_hash(old: Dict[str, str], new: Dict[str, str], equal: bool) -> None:
+    """Check that content hashes are stable and differ for differing data."""
+    assert (ldap_dict_hash(old) == ldap_dict_hash(new)) == equal
+
+
+def test_diff_contacts_empty() -> None:
+    """Check that nothing changes for identical sets of contacts."""
+    contacts: List[Contact] = [Contact("Joey", "Doe", uid="1"), Contact(last_name="Catto")]
+    assert diff_contacts([entry(c) for c in contacts], contacts) == ContactDiff()
@@ -0,0 +1,45 @@
+"""Test the allocation of phone book DNs."""
+
+import pytest
+from ldap3.utils.dn import escape_rdn
+
+from nc2ldap.contact import Contact
+from nc2ldap.ldap.dn_index import DnIndex, get_rdn, get_rdn_value
+
+BASE: str = "ou=phonebook,dc=mytld,dc=com"
+
+
+@pytest.mark.parametrize(
+    "cn", ["Joey Doe", "Doe, Joey (Paws+Co)", ' Müller #1; \\ "<>=', "#Zoë Øster "]
+)
+def test_get_rdn_value(cn: str) -> None:
+    """Check that CNs are restored from escaped DNs."""
+    assert get_rdn_value(f"cn={escape_rdn(cn)},{BASE}") == cn
+    assert get_rdn(f"cn={escape_rdn(cn)},{BASE}") == f"cn={escape_rdn(cn)}"
+    assert get_rdn_value(r"cn=M\C3\BCller\2C Joey,ou=phonebook") == "Müller, Joey"
+
+
+def test_allocate() -> None:
+    """Check that equal CNs get stable suffixes and existing DNs are kept."""
+    index: DnIndex = DnIndex(BASE)
+    index.add(f"cn=Joey Doe (2),{BASE}", "2")
+    assert index.allocate(Contact("Joey", "Doe", uid="1")) == f"cn=Joey Doe,{BASE}"
+    assert index.allocate(Contact("Joey", "Doe", uid="2")) == f"cn=Joey Doe (2),{BASE}"
+    assert index.allocate(Contact("Joey", "Doe", uid="3")) == f"cn=Joey Doe (3),{BASE}"
+    assert index.allocate(Contact("joey", "doe", uid="3")) == f"cn=Joey Doe (3),{BASE}"
+    assert index.get_key(f"cn=Joey Doe (3),{BASE}") == "3"
+    assert len(index) == 3
+
+    # A renamed contact keeps its former DN reserved until it is removed
+    assert index.allocate(Contact("Joe", "Doe", uid="1")) == f"cn=Joe Doe,{BASE}"
+    assert index.allocate(Contact("Joey", "Doe", uid="4")) == f"cn=Joey Doe (4),{BASE}"
+    index.remove(f"cn=Joey Doe,{BASE}")
+    assert index.get_dn("1") == f"cn=Joe Doe,{BASE}"
+    assert index.allocate(Contact("Joey", "Doe", uid="5")) == f"cn=Joey Doe,{BASE}"
+
+
+def test_allocate_nameless() -> None:
+    """Check that contacts without a name get deterministic DNs."""
+    contact: Contact = Contact(email="cat@cathouse.cat")
+    assert DnIndex(BASE).allocate(contact) == DnIndex(BASE).allocate(contact)
+    assert DnIndex(BASE).allocate(Contact(uid="abc-123")) == f"cn=abc-123,{BASE}"
@@ -0,0 +1,90 @@
+"""Test downloading single vCard files concurrently."""
+
+from typing import Iterator, List
+
+import pytest
+from httpx import Client, ConnectError
+from webdav4.client import HTTPError
+
+from nc2ldap.benchmark.generator import generate_address_book
+from nc2ldap.benchmark.webdav_server import CardDavServer
+from nc2ldap.nextcloud.carddav import CardData
+from nc2ldap.nextcloud.fetcher import LatencyStats, VCardFetcher
+
+PATH: str = "/remote.php/dav/addressbooks/users/joey/contacts"
+
+
+@pytest.fixture(name="server")
+def fixture_server() -> Iterator[CardDavServer]:
+    """Serve a small address book."""
+    with CardDavServer(PATH, generate_address_book(20)) as server:
+        yield server
+
+
+def create_fetcher(server: CardDavServer, retries: int = 3) -> VCardFetcher:
+    """Create a fetcher for the server, retrying without noticeable backoff."""
+    return VCardFetcher(Client(base_url=server.url), 4, 5, retries, backoff=0.01)
+
+
+def test_fetch_all(server: CardDavServer) -> None:
+    """Check that all files are downloaded with their ETags, in order of completion."""
+    hrefs: List[str] = sorted(server.cards)
+    server.delays[hrefs[0]] = 1
+    fetcher: VCardFetcher = create_fetcher(server)
+    cards: List[CardData] = list(fetcher.fetch_all(hrefs))
+
+    assert [card.href for card in cards][-1] == hrefs[0]
+    assert {card.href: (card.etag, card.vcard) for card in cards} == server.cards
+    assert len(fetcher.stats.samples) == 20
+    assert fetcher.stats.retries == 0
+
+
+@pytest.mark.parametrize("status", [429, 500, 502, 503, 504])
+def test_fetch_retry(server: CardDavServer, status: int) -> None:
+    """Check that transient errors are retried."""
+    href: str = next(iter(server.cards))
+    server.failures[href] = [status, status]
+    fetcher: VCardFetcher = create_fetcher(server)
+    assert fetcher.fetch(href).vcard == server.cards[href][1]
+    assert fetcher.stats.retries == 2
+
+
+def test_fetch_errors(server: CardDavServer) -> None:
+    """Check that permanent errors fail at once, and transient ones once retries are used up."""
+    href: str = next(iter(server.cards))
+    fetcher: VCardFetcher = create_fetcher(server, retries=2)
+    with pytest.raises(HTTPError):
+        fetcher.fetch(f"{PATH}/missing.vcf")
+    server.failures[href] = [401, 503]
+    with pytest.raises(HTTPError):
+        fetcher.fetch(href)
+    assert fetcher.stats.retries == 0
+
+    server.failures[href] = [503, 503, 503, 503]
+    with pytest.raises(HTTPError):
+        fetcher.fetch(href)
+    assert fetcher.stats.retries == 2
+    assert server.failures[href] == [503]
+
+
+def test_fetch_transport_error() -> None:
+    """Check that connection errors are retried, too."""
+    fetcher: VCardFetcher = VCardFetcher(
+        Client(base_url="http://127.0.0.1:9"), 1, 1, 2, backoff=0.01
+    )
+    with pytest.raises(ConnectError):
+        fetcher.fetch("/contact.vcf")
+    assert fetcher.stats.retries == 2
+
+
+def test_latency_stats() -> None:
+    """Check the percentiles and summary of latency statistics."""
+    stats: LatencyStats = LatencyStats()
+    assert stats.percentile(50) == 0
+    for millis in range(1, 101):
+        stats.add(millis / 1000)
+    stats.add_retry()
+    assert stats.percentile(50) == 0.051
+    assert stats.percentile(95) == 0.096
+    assert stats.percentile(100) == 0.1
+    assert str(stats) == "100 requests, 1 retries, p50 51 ms, p95 96 ms, max 100 ms"
@@ -0,0 +1,50 @@
+"""Test managing slapd indexes through cn=config."""
+
+from typing import Dict, Set
+
+from ldap3 import MOCK_SYNC, Connection, Server
+
+from nc2ldap.ldap.indexes import WANTED_INDEXES, ensure_indexes, format_db_index, parse_db_index
+
+DATABASE: str = "olcDatabase={1}mdb,cn=config"
+
+
+def test_parse_db_index() -> None:
+    """Check parsing and formatting of olcDbIndex values."""
+    indexes: Dict[str, Set[str]] = parse_db_index(["objectClass eq", "cn,uid eq,sub", "sn"])
+    assert indexes == {
+        "objectClass": {"eq"},
+        "cn": {"eq", "sub"},
+        "uid": {"eq", "sub"},
+        "sn": set(),
+    }
+    assert format_db_index(indexes) == ["objectClass eq", "cn eq,sub", "uid eq,sub", "sn"]
+
+
+def test_ensure_indexes() -> None:
+    """Check that missing indexes are added to the right database, keeping existing ones."""
+    connection: Connection = Connection(Server("mock"), client_strategy=MOCK_SYNC)
+    connection.bind()
+    connection.strategy.add_entry("cn=config", {"objectClass": ["olcGlobal"]})
+    connection.strategy.add_entry(
+        "olcDatabase={0}config,cn=config", {"objectClass": ["olcDatabaseConfig"]}
+    )
+    connection.strategy.add_entry(
+        DATABASE,
+        {
+            "objectClass": ["olcDatabaseConfig", "olcMdbConfig"],
+            "olcSuffix": "dc=mytld,dc=com",
+            "olcDbIndex": ["objectClass eq", "cn,uid eq", "member,memberUid eq"],
+        },
+    )
+
+    indexes: Dict[str, Set[str]] = ensure_indexes(connection, "ou=phonebook,dc=mytld,dc=com")
+    assert indexes["telephoneNumber"] == {"eq", "sub"}
+    assert indexes["memberUid"] == {"eq"}
+    connection.search(DATABASE, "(objectClass=*)", attributes=["olcDbIndex"])
+    stored: Dict[str, Set[str]] = parse_db_index(connection.entries[0].olcDbIndex.values)
+    assert stored == indexes
+    assert all(stored[attribute] >= types for attribute, types in WANTED_INDEXES.items())
+
+    # Nothing is changed if all indexes are present
+    assert ensure_indexes(connection, "ou=phonebook,dc=mytld,dc=com") == indexes
@@ -0,0 +1,79 @@
+"""Test exporting phone books as LDIF."""
+
+from base64 import b64decode
+from io import StringIO
+from typing import Dict, List
+
+from nc2ldap.contact import Contact, contact_to_ldap_record
+from nc2ldap.ldap import PhoneBookEntry, diff_contacts, write_ldif
+from nc2ldap.ldap.dn_index import get_rdn_value
+from nc2ldap.ldap.ldif import format_attribute
+
+PHONE_BOOK: str = "ou=phonebook,dc=mytld,dc=com"
+
+
+def parse_ldif(data: str) -> Dict[str, Dict[str, List[str]]]:
+    """Parse unfolded LDIF content records into attribute values by DN."""
+    result: Dict[str, Dict[str, List[str]]] = {}
+    for record in data.strip().split("\n\n"):
+        values: Dict[str, List[str]] = {}
+        for line in record.split("\n"):
+            name, value = line.split(":", 1)
+            if value.startswith(":"):
+                value = b64decode(value[1:].strip()).decode()
+            values.setdefault(name, []).append(value.removeprefix(" "))
+        result[values.pop("dn")[0]] = values
+    return result
+
+
+def test_format_attribute() -> None:
+    """Check that only safe strings are written as they are."""
+    assert format_attribute("sn", "Doe") == "sn: Doe\n"
+    assert format_attribute("sn", "Müller") == "sn:: TcO8bGxlcg==\n"
+    assert format_attribute("sn", ":Doe") == "sn:: OkRvZQ==\n"
+    assert format_attribute("sn", "Doe ") == "sn:: RG9lIA==\n"
+    assert format_attribute("sn", "") == "sn: \n"
+
+
+def test_write_ldif() -> None:
+    """Check that exported entries are found up to date by the next sync."""
+    contacts: List[Contact] = [
+        Contact("Jürgen", "Doe", email="cat@cathouse.cat", uid="1"),
+        Contact("Jürgen", "Doe", uid="2"),
+        Contact(last_name="Paws, Inc."),
+    ]
+    handle: StringIO = StringIO()
+    entries: List[PhoneBookEntry] = write_ldif(
+        handle, PHONE_BOOK, "organizationalUnit", "inetOrgPerson", contacts
+    )
+    assert diff_contacts(entries, contacts).added == []
+    assert [get_rdn_value(e.dn) for e in entries] == ["Jürgen Doe", "Jürgen Doe (2)", "Paws, Inc."]
+
+    records: Dict[str, Dict[str, List[str]]] = parse_ldif(handle.getvalue())
+    assert records[PHONE_BOOK] == {
+        "objectClass": ["top", "organizationalUnit"],
+        "ou": ["phonebook"],
+    }
+    assert list(records)[1:] == [e.dn for e in entries]
+    assert records[entries[0].dn]["mail"] == ["cat@cathouse.cat"]
+    assert records[entries[1].dn]["cn"] == ["Jürgen Doe (2)", "Jürgen Doe"]
+    assert records[entries[1].dn]["description"] == [
+        contact_to_ldap_record(contacts[1])["description"]
+    ]
+
+
+def test_write_ldif_duplicates() -> None:
+    """Check that duplicate contacts are written once, keeping the first like a sync does."""
+    contacts: List[Contact] = [
+        Contact("Joey", "Doe", uid="1"),
+        Contact("Joe", "Doe", uid="1"),
+        Contact(last_name="Paws, Inc."),
+        Contact(last_name="Paws, Inc."),
+    ]
+    handle: StringIO = StringIO()
+    entries: List[PhoneBookEntry] = write_ldif(
+        handle, PHONE_BOOK, "organizationalUnit", "inetOrgPerson", contacts
+    )
+    assert [get_rdn_value(e.dn) for e in entries] == ["Joey Doe", "Paws, Inc."]
+    assert list(parse_ldif(handle.getvalue()))[1:] == [e.dn for e in entries]
+    assert diff_contacts(entries, contacts).added == []
@@ -0,0 +1,107 @@
+"""Test adapting the number of concurrent requests to the load of the server."""
+
+from email.utils import formatdate
+from threading import Lock, Thread
+from time import monotonic, sleep, time
+from typing import List
+
+import pytest
+from httpx import Client, MockTransport, PoolTimeout, Request, Response
+
+from nc2ldap.metrics import METRICS
+from nc2ldap.nextcloud.limiter import AdaptiveLimiter, LimitedTransport, parse_retry_after
+
+
+@pytest.mark.parametrize(
+    ("value", "expected"),
+    [(None, 0), ("", 0), ("7", 7), ("-1", 0), ("86400", 300), ("soon", 0)],
+)
+def test_parse_retry_after(value: str, expected: float) -> None:
+    """Check that delays are parsed and kept within bounds."""
+    assert parse_retry_after(value) == expected
+
+
+def test_parse_retry_after_date() -> None:
+    """Check that HTTP dates are converted into delays."""
+    assert 8 < parse_retry_after(formatdate(time() + 10, usegmt=True)) <= 10
+
+
+def test_aimd() -> None:
+    """Check that the limit grows additively and is halved once per window of requests."""
+    limiter: AdaptiveLimiter = AdaptiveLimiter("test-aimd", 8, 1.0)
+    assert limiter.limit == 2
+    for _ in range(40):
+        start: float = limiter.acquire()
+        limiter.release()
+        limiter.record(start)
+    assert limiter.limit == 8
+
+    starts: List[float] = [limiter.acquire() for _ in range(3)]
+    for start in starts:
+        limiter.release()
+        limiter.record(start, overloaded=True)
+    assert limiter.limit == 4
+    limiter.record(limiter.acquire() - 2)
+    assert limiter.limit == 4
+
+    # Slow responses to requests sent after the decrease reduce the limit further
+    limiter.target_latency = 0
+    limiter.record(limiter.acquire())
+    assert limiter.limit == 2
+    assert 'nc2ldap_nextcloud_concurrency_limit{host="test-aimd"} 2' in METRICS.render()
+
+
+def test_limited_transport() -> None:
+    """Check that requests in flight are limited and Retry-After is honoured."""
+    lock: Lock = Lock()
+    in_flight: List[int] = [0, 0]
+    calls: List[float] = []
+
+    def handle(_: Request) -> Response:
+        with lock:
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight)
+            calls.append(monotonic())
+        sleep(0.02)
+        with lock:
+            in_flight[0] -= 1
+        if len(calls) == 1:
+            return Response(429, headers={"Retry-After": "1"})
+        return Response(200, text="BEGIN:VCARD")
+
+    limiter: AdaptiveLimiter = AdaptiveLimiter("test-transport", 2, 1.0)
+    with Client(transport=LimitedTransport(MockTransport(handle), limiter)) as client:
+        assert client.get("http://nextcloud/").status_code == 429
+        threads: List[Thread] = [
+            Thread(target=client.get, args=("http://nextcloud/",)) for _ in range(20)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert calls[1] - calls[0] >= 0.95
+    assert in_flight[1] == 2
+    assert limiter.in_flight == 0
+
+
+def test_acquire_timeout() -> None:
+    """Check that requests fail instead of waiting forever for slots which are never freed."""
+    limiter: AdaptiveLimiter = AdaptiveLimiter("test-timeout", 2, 1.0)
+    limiter.acquire(0.1)
+    limiter.acquire(0.1)
+    with pytest.raises(PoolTimeout):
+        limiter.acquire(0.1)
+
+    # A response body that is never closed holds its slot, so the next request times out
+    def handle(_: Request) -> Response:
+        return Response(200, content=iter([b"BEGIN:VCARD"]))
+
+    limiter.release()
+    with Client(transport=LimitedTransport(MockTransport(handle), limiter), timeout=0.2) as client:
+        with client.stream("GET", "http://nextcloud/"):
+            start: float = monotonic()
+            with pytest.raises(PoolTimeout):
+                client.get("http://nextcloud/")
+            assert 0.15 < monotonic() - start < 1
+    assert limiter.in_flight == 1
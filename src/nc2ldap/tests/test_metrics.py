@@ -0,0 +1,44 @@
+"""Test the sync metrics."""
+
+from http.server import ThreadingHTTPServer
+from urllib.request import urlopen
+
+import pytest
+
+from nc2ldap.metrics import SyncMetrics, start_metrics_server
+
+
+def test_metrics() -> None:
+    """Check that stages, errors and bytes are rendered in the Prometheus text format."""
+    metrics: SyncMetrics = SyncMetrics()
+    with metrics.stage("parse") as stage:
+        stage.items = 42
+    with pytest.raises(ValueError):
+        with metrics.stage("diff"):
+            raise ValueError()
+    metrics.add_error("ldap_write", 3)
+    metrics.add_bytes(1024)
+
+    text: str = metrics.render()
+    assert "# TYPE nc2ldap_stage_duration_seconds gauge" in text
+    assert 'nc2ldap_stage_items{stage="parse"} 42' in text
+    assert 'nc2ldap_stage_runs_total{stage="diff"} 1' in text
+    assert 'nc2ldap_stage_errors_total{stage="diff"} 1' in text
+    assert 'nc2ldap_stage_errors_total{stage="ldap_write"} 3' in text
+    assert "nc2ldap_downloaded_bytes_total 1024" in text
+    assert "nc2ldap_last_success_timestamp_seconds 0" in text
+
+    metrics.mark_success()
+    assert "nc2ldap_last_success_timestamp_seconds 0" not in metrics.render()
+
+
+def test_metrics_server() -> None:
+    """Check that the endpoint serves the global metrics."""
+    server: ThreadingHTTPServer = start_metrics_server(0, "127.0.0.1")
+    try:
+        with urlopen(f"http://127.0.0.1:{server.server_address[1]}/metrics") as response:
+            assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+            assert b"nc2ldap_downloaded_bytes_total" in response.read()
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,241 @@
+"""Test writing to and reading from the phone book."""
+
+import sqlite3
+from pathlib import Path
+from typing import Any, Callable, List
+
+import pytest
+from ldap3 import MOCK_ASYNC, MOCK_SYNC, Connection
+from ldap3.core.exceptions import LDAPException
+
+from nc2ldap.contact import Contact
+from nc2ldap.ldap import (
+    ContactDiff,
+    PhoneBook,
+    PhoneBookEntry,
+    Snapshot,
+    StreamingDiff,
+    diff_contacts,
+)
+from nc2ldap.ldap.diff import AttributeChanges
+from nc2ldap.ldap.dn_index import get_rdn_value
+
+PHONE_BOOK: str = "ou=phonebook,dc=mytld,dc=com"
+
+
+def mock_phone_book() -> PhoneBook:
+    """Create a phone book backed by ldap3's in-memory mock strategies."""
+    phone_book: PhoneBook = PhoneBook("mock", PHONE_BOOK)
+    phone_book.ldap = Connection(phone_book.server, client_strategy=MOCK_SYNC)
+    phone_book.ldap_async = Connection(phone_book.server, client_strategy=MOCK_ASYNC)
+    phone_book.ldap.bind()
+    phone_book.ldap_async.bind()
+    phone_book.ldap.strategy.add_entry(PHONE_BOOK, {"objectClass": ["organizationalUnit"]})
+    return phone_book
+
+
+def test_apply_diff(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Check that a sync writes content hashes and a second sync finds nothing to do."""
+    phone_book: PhoneBook = mock_phone_book()
+    contacts: List[Contact] = [
+        Contact("Joey", "Doe", email="cat@cathouse.cat", uid="1"),
+        Contact("Catto", "Doe", uid="2"),
+        Contact(last_name="Paws Inc."),
+    ]
+    assert not phone_book.apply_diff(diff_contacts([], contacts))
+    written: List[PhoneBookEntry] = sorted(phone_book.entries.values(), key=PhoneBookEntry.get_key)
+    entries: List[PhoneBookEntry] = list(phone_book.get_entries())
+    assert all(e.content_hash and e.attribute_hashes for e in entries)
+    assert sorted(entries, key=PhoneBookEntry.get_key) == written
+    assert diff_contacts(entries, contacts) == ContactDiff()
+
+    # Updates only replace the attributes which have changed
+    modified: List[List[str]] = []
+    modify: Callable[..., Any] = phone_book.ldap_async.modify
+
+    def record_modify(dn: str, changes: AttributeChanges) -> Any:
+        """Keep track of the attributes replaced by an update."""
+        modified.append(sorted(changes))
+        return modify(dn, changes)
+
+    monkeypatch.setattr(phone_book.ldap_async, "modify", record_modify)
+    changed: List[Contact] = [Contact("Joey", "Doe", uid="1"), Contact("Kitty", "Doe", uid="2")]
+    assert not phone_book.apply_diff(diff_contacts(entries, changed))
+    assert sorted(modified) == [["cn", "description", "givenName"], ["description", "mail"]]
+    assert diff_contacts(phone_book.get_entries(), changed) == ContactDiff()
+    assert sorted(phone_book.get_contacts(), key=Contact.get_key) == changed
+
+
+def test_apply_diff_duplicate_names() -> None:
+    """Check that contacts with equal names are stored at stable, distinct DNs."""
+    phone_book: PhoneBook = mock_phone_book()
+    contacts: List[Contact] = [Contact("Joey", "Doe", uid=str(i)) for i in range(3)]
+    assert not phone_book.apply_diff(diff_contacts([], reversed(contacts)))
+
+    entries: List[PhoneBookEntry] = sorted(phone_book.get_entries(), key=PhoneBookEntry.get_key)
+    assert [get_rdn_value(e.dn) for e in entries] == ["Joey Doe", "Joey Doe (2)", "Joey Doe (3)"]
+    assert diff_contacts(entries, contacts) == ContactDiff()
+
+    # Renaming the first contact does not shift the suffixes of the others
+    changed: List[Contact] = [Contact("Joe", "Doe", uid="0"), *contacts[1:]]
+    assert not phone_book.apply_diff(diff_contacts(entries, changed))
+    entries = sorted(phone_book.get_entries(), key=PhoneBookEntry.get_key)
+    assert [get_rdn_value(e.dn) for e in entries] == ["Joe Doe", "Joey Doe (2)", "Joey Doe (3)"]
+
+
+def test_apply_diff_suffixed_without_uid() -> None:
+    """Check that a contact without UID is found at a suffixed DN by the next syncs."""
+    phone_book: PhoneBook = mock_phone_book()
+    contacts: List[Contact] = [Contact("Joey", "Doe", uid="1"), Contact("Joey", "Doe")]
+    assert not phone_book.apply_diff(diff_contacts([], contacts))
+    entries: List[PhoneBookEntry] = sorted(phone_book.get_entries(), key=PhoneBookEntry.get_key)
+    assert [get_rdn_value(e.dn) for e in entries] == ["Joey Doe", "Joey Doe (2)"]
+    assert diff_contacts(entries, contacts) == ContactDiff()
+    assert diff_contacts(phone_book.entries.values(), contacts) == ContactDiff()
+
+    # Renaming keeps the contact's own CN in sync with the one of its DN
+    changed: List[Contact] = [contacts[0], Contact("Joe", "Doe")]
+    assert not phone_book.apply_diff(diff_contacts(entries, changed))
+    entries = sorted(phone_book.get_entries(), key=PhoneBookEntry.get_key)
+    assert [(get_rdn_value(e.dn), e.cn) for e in entries] == [
+        ("Joey Doe", "Joey Doe"),
+        ("Joe Doe", "Joe Doe"),
+    ]
+    assert diff_contacts(entries, changed) == ContactDiff()
+
+
+def test_apply_stream_equal_names_without_uid() -> None:
+    """Check that contacts without UID sharing a name are told apart by their content."""
+    phone_book: PhoneBook = mock_phone_book()
+    contacts: List[Contact] = [
+        Contact("Joey", "Doe", phone_mobile="+49 5555 1"),
+        Contact("Joey", "Doe", phone_mobile="+49 5555 2"),
+    ]
+    stream: StreamingDiff = StreamingDiff(phone_book.get_entries())
+    assert not phone_book.apply_stream(stream, iter(contacts))
+    assert stream.added == 2
+    assert sorted(get_rdn_value(e.dn) for e in phone_book.get_entries()) == [
+        "Joey Doe",
+        "Joey Doe (2)",
+    ]
+    assert diff_contacts(phone_book.get_entries(), contacts) == ContactDiff()
+
+    # Changing one of them replaces its entry, leaving the other one alone
+    changed: List[Contact] = [contacts[0], Contact("Joey", "Doe", phone_mobile="+49 5555 3")]
+    result: ContactDiff = diff_contacts(phone_book.get_entries(), changed)
+    assert result.added == changed[1:]
+    assert [e.cn for e in result.deleted] == ["Joey Doe"]
+    assert not result.updated
+
+
+def test_apply_stream() -> None:
+    """Check that streamed writes lead to the same phone book as a batch of changes."""
+    phone_book: PhoneBook = mock_phone_book()
+    contacts: List[Contact] = [
+        Contact("Joey", "Doe", uid="1"),
+        Contact("Catto", "Doe", uid="2"),
+        Contact("Kitty", "Doe", uid="3"),
+    ]
+    stream: StreamingDiff = StreamingDiff(phone_book.get_entries())
+    assert not phone_book.apply_stream(stream, iter(contacts))
+    assert stream.added == 3
+
+    # Rename one contact to the name of a deleted one and add another with a taken name
+    changed: List[Contact] = [
+        Contact("Joey", "Doe", email="cat@cathouse.cat", uid="1"),
+        Contact("Kitty", "Doe", uid="2"),
+        Contact("Joey", "Doe", uid="4"),
+        Contact(last_name="Paws Inc."),
+    ]
+    stream = StreamingDiff(phone_book.get_entries())
+    assert not phone_book.apply_stream(stream, iter(changed))
+    assert (stream.added, stream.updated, len(stream.get_deleted())) == (2, 2, 1)
+
+    entries: List[PhoneBookEntry] = sorted(phone_book.get_entries(), key=PhoneBookEntry.get_key)
+    assert [get_rdn_value(e.dn) for e in entries] == [
+        "Joey Doe",
+        "Kitty Doe",
+        "Joey Doe (2)",
+        "Paws Inc.",
+    ]
+    assert diff_contacts(entries, changed) == ContactDiff()
+    assert sorted(phone_book.get_contacts(), key=Contact.get_key) == sorted(
+        changed, key=Contact.get_key
+    )
+
+
+def test_apply_stream_order() -> None:
+    """Check that suffixes of equal CNs don't depend on the order contacts arrive in."""
+    contacts: List[Contact] = [Contact("Joey", "Doe", uid=str(i)) for i in range(3)]
+    expected: PhoneBook = mock_phone_book()
+    assert not expected.apply_diff(diff_contacts([], contacts))
+    for order in (contacts, contacts[::-1], contacts[1:] + contacts[:1]):
+        phone_book: PhoneBook = mock_phone_book()
+        stream: StreamingDiff = StreamingDiff(phone_book.get_entries())
+        assert not phone_book.apply_stream(stream, iter(order))
+        assert phone_book.index.dns == expected.index.dns
+
+
+def test_snapshot_tracks_phone_book(tmp_path: Path) -> None:
+    """Check that a snapshot taken after writing matches what's read back from LDAP."""
+    phone_book: PhoneBook = mock_phone_book()
+    contacts: List[Contact] = [
+        Contact("Joey", "Doe", uid="1"),
+        Contact("Catto", "Doe", uid="2"),
+        Contact("Kitty", "Doe", uid="3"),
+    ]
+    assert not phone_book.apply_diff(diff_contacts(phone_book.get_entries(), contacts))
+    changed: List[Contact] = [Contact("Joe", "Doe", uid="1"), Contact("Catto", "Doe", uid="2")]
+    assert not phone_book.apply_diff(diff_contacts(phone_book.entries.values(), changed))
+
+    path: str = str(tmp_path / "snapshot.sqlite")
+    Snapshot(PHONE_BOOK, list(phone_book.entries.values()), 42.0).save(path)
+    snapshot = Snapshot.load(path, PHONE_BOOK)
+    assert snapshot is not None and snapshot.verified == 42.0
+
+    def by_dn(entries: List[PhoneBookEntry]) -> List[PhoneBookEntry]:
+        return sorted(entries, key=lambda e: e.dn)
+
+    assert by_dn(snapshot.entries) == by_dn(list(phone_book.get_entries()))
+    assert diff_contacts(snapshot.entries, changed) == ContactDiff()
+
+
+def test_snapshot_invalid(tmp_path: Path) -> None:
+    """Check that missing, foreign and tampered snapshots are ignored."""
+    path: str = str(tmp_path / "snapshot.sqlite")
+    assert Snapshot.load(path, PHONE_BOOK) is None
+
+    entries: List[PhoneBookEntry] = [PhoneBookEntry("cn=Joey Doe," + PHONE_BOOK, "Joey Doe", "1")]
+    Snapshot(PHONE_BOOK, entries, 0.0).save(path)
+    assert Snapshot.load(path, PHONE_BOOK) is not None
+    assert Snapshot.load(path, "ou=other,dc=mytld,dc=com") is None
+
+    with sqlite3.connect(path) as database:
+        database.execute("UPDATE entries SET content_hash = 'tampered'")
+    assert Snapshot.load(path, PHONE_BOOK) is None
+
+    Snapshot.remove(path)
+    assert Snapshot.load(path, PHONE_BOOK) is None
+
+
+def test_rebuild_rollback(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Check that the old phone book is put back if the new one cannot be swapped in."""
+    phone_book: PhoneBook = mock_phone_book()
+    assert not phone_book.apply_diff(diff_contacts([], [Contact("Joey", "Doe", uid="1")]))
+    rename: Callable[[PhoneBook, str], None] = PhoneBook.rename
+
+    def load(_: str) -> None:
+        phone_book.ldap.strategy.add_entry(
+            "ou=phonebook-rebuild,dc=mytld,dc=com", {"objectClass": ["organizationalUnit"]}
+        )
+
+    def fail_swap(self: PhoneBook, target: str) -> None:
+        if self.phone_book.startswith("ou=phonebook-rebuild,"):
+            raise LDAPException("Server is unwilling to perform")
+        rename(self, target)
+
+    monkeypatch.setattr(PhoneBook, "rename", fail_swap)
+    with pytest.raises(LDAPException):
+        phone_book.rebuild([Contact("Catto", "Doe", uid="2")], load)
+    assert phone_book.exists()
+    assert not phone_book.sibling("ou=phonebook-old,dc=mytld,dc=com").exists()
@@ -0,0 +1,62 @@
+"""Test running sync stages in background threads."""
+
+from itertools import count
+from typing import Generator, List
+
+import pytest
+
+from nc2ldap.pipeline import ThreadedStage
+
+
+def test_threaded_stage_order() -> None:
+    """Check that items pass through chained stages in order."""
+    numbers: ThreadedStage[int] = ThreadedStage(range(1000), "numbers", maxsize=4)
+    squares: ThreadedStage[int] = ThreadedStage((n * n for n in numbers), "squares", maxsize=4)
+    assert list(squares) == [n * n for n in range(1000)]
+    assert not list(squares)
+
+
+def test_threaded_stage_error() -> None:
+    """Check that errors of a stage are raised to its consumer."""
+
+    def fail() -> Generator[int, None, None]:
+        yield 1
+        raise ValueError("broken vCard")
+
+    stage: ThreadedStage[int] = ThreadedStage(fail(), "fail")
+    assert next(stage) == 1
+    with pytest.raises(ValueError, match="broken vCard"):
+        next(stage)
+
+
+def test_threaded_stage_close() -> None:
+    """Check that closing a stage stops an endless producer with a full queue."""
+    produced: List[int] = []
+
+    def endless() -> Generator[int, None, None]:
+        for number in count():
+            produced.append(number)
+            yield number
+
+    with ThreadedStage(endless(), "endless", maxsize=2) as stage:
+        assert next(stage) == 0
+    assert not stage.thread.is_alive()
+    assert len(produced) <= 5
+
+
+def test_threaded_stage_close_chained() -> None:
+    """Check that closing a stage stops the stage it consumes and closes that stage's source."""
+    closed: List[bool] = []
+
+    def endless() -> Generator[int, None, None]:
+        try:
+            yield from count()
+        finally:
+            closed.append(True)
+
+    numbers: ThreadedStage[int] = ThreadedStage(endless(), "numbers", maxsize=2)
+    with ThreadedStage(numbers, "squares", maxsize=2) as squares:
+        assert next(squares) == 0
+    assert not squares.thread.is_alive()
+    assert not numbers.thread.is_alive()
+    assert closed == [True]
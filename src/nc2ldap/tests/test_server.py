@@ -0,0 +1,150 @@
+"""Test serving phone books from memory to LDAP clients."""
+
+from typing import Iterator, List, Literal
+
+import pytest
+from ldap3 import BASE, LEVEL, SUBTREE, Connection, Server
+from ldap3.core.exceptions import LDAPBindError
+
+from nc2ldap import main
+from nc2ldap.benchmark.generator import generate_address_book
+from nc2ldap.benchmark.webdav_server import CardDavServer
+from nc2ldap.contact import Contact
+from nc2ldap.metrics import METRICS
+from nc2ldap.server import Directory, LdapServer
+from nc2ldap.server.filters import Index, PresentFilter, SubstringFilter, ValueIndex
+from nc2ldap.tenants import Tenant
+
+PHONE_BOOK: str = "ou=phonebook,dc=mytld,dc=com"
+USER: str = "cn=admin,dc=mytld,dc=com"
+PASSWORD: str = "secret"
+
+Scope = Literal["BASE", "LEVEL", "SUBTREE"]
+
+
+@pytest.fixture(name="directory")
+def fixture_directory() -> Directory:
+    """Publish a small phone book."""
+    directory: Directory = Directory()
+    directory.publish(
+        PHONE_BOOK,
+        [
+            Contact("Joey", "Doe", company="Paws Inc.", phone_mobile="+495555123", uid="1"),
+            Contact("Catto", "Doe", phone_private="+495555234", uid="2"),
+            Contact("Joey", "Miller", email="joey@cathouse.cat", uid="3"),
+        ],
+    )
+    return directory
+
+
+@pytest.fixture(name="server")
+def fixture_server(directory: Directory) -> Iterator[LdapServer]:
+    """Serve the phone book on a random local port."""
+    server: LdapServer = LdapServer(0, USER, PASSWORD, host="127.0.0.1", directory=directory)
+    yield server
+    server.close()
+
+
+def connect(server: LdapServer, user: str = USER, password: str = PASSWORD) -> Connection:
+    """Connect and bind to the server."""
+    return Connection(Server(f"ldap://127.0.0.1:{server.port}"), user, password, auto_bind=True)
+
+
+def search(connection: Connection, search_filter: str, scope: Scope = SUBTREE) -> List[str]:
+    """Get the CNs or OUs of all matching entries in the phone book."""
+    connection.search(PHONE_BOOK, search_filter, scope, attributes=["cn", "ou"])
+    return sorted(
+        (e.entry_attributes_as_dict.get("cn") or e.entry_attributes_as_dict["ou"])[0]
+        for e in connection.entries
+    )
+
+
+@pytest.mark.parametrize(
+    ("search_filter", "expected"),
+    [
+        ("(objectClass=inetOrgPerson)", ["Catto Doe", "Joey Doe (Paws Inc.)", "Joey Miller"]),
+        ("(objectClass=*)", ["Catto Doe", "Joey Doe (Paws Inc.)", "Joey Miller", "phonebook"]),
+        ("(mobile=+49 5555 123)", ["Joey Doe (Paws Inc.)"]),
+        ("(|(mobile=+495555234)(homePhone=+49-5555-234))", ["Catto Doe"]),
+        ("(&(sn=doe)(givenName=Joey))", ["Joey Doe (Paws Inc.)"]),
+        ("(&(objectClass=person)(!(sn=Doe)))", ["Joey Miller"]),
+        ("(cn=*oe*)", ["Catto Doe", "Joey Doe (Paws Inc.)", "Joey Miller"]),
+        ("(cn=Joey*r)", ["Joey Miller"]),
+        ("(cn=Catto*)", ["Catto Doe"]),
+        ("(|(mobile=*5555 123)(homePhone=*55-234))", ["Catto Doe", "Joey Doe (Paws Inc.)"]),
+        ("(mail=*)", ["Joey Miller"]),
+        ("(uid>=2)", ["Catto Doe", "Joey Miller"]),
+        ("(sn=Smith)", []),
+    ],
+)
+def test_search(server: LdapServer, search_filter: str, expected: List[str]) -> None:
+    """Check that searches are answered from the index."""
+    assert search(connect(server), search_filter) == expected
+
+
+def test_value_index() -> None:
+    """Check that substring and presence filters find their candidates in the index."""
+    values: ValueIndex = ValueIndex(
+        {"+495555123": {1}, "+495555234": {2}, "+4955551234": {3}, "+1650123": {3, 4}}
+    )
+    index: Index = {"mobile": values}
+    assert sorted(values.starting_with("+49")) == ["+495555123", "+4955551234", "+495555234"]
+    assert sorted(values.ending_with("123")) == ["+1650123", "+495555123"]
+    assert SubstringFilter("mobile", "", (), "123").lookup(index) == {1, 3, 4}
+    assert SubstringFilter("mobile", "+49", ("55",), "34").lookup(index) == {2, 3}
+    assert SubstringFilter("mobile", "", ("650",), "").lookup(index) == {3, 4}
+    assert SubstringFilter("homephone", "+49", (), "").lookup(index) == set()
+    assert PresentFilter("mobile").lookup(index) == {1, 2, 3, 4}
+
+
+def test_search_scopes(server: LdapServer) -> None:
+    """Check that search scopes and bases are respected."""
+    connection: Connection = connect(server)
+    assert search(connection, "(objectClass=*)", BASE) == ["phonebook"]
+    assert len(search(connection, "(objectClass=*)", LEVEL)) == 3
+
+    connection.search("dc=mytld,dc=com", "(cn=Catto Doe)", SUBTREE, attributes=["*"])
+    assert connection.entries[0].entry_dn == f"cn=Catto Doe,{PHONE_BOOK}"
+    assert str(connection.entries[0].homePhone) == "+49 5555 234"
+
+    assert not connection.search("ou=other,dc=example,dc=com", "(objectClass=*)")
+    assert connection.result["result"] == 32
+
+    connection.search("", "(objectClass=*)", BASE, attributes=["namingContexts"])
+    assert str(connection.entries[0].namingContexts) == PHONE_BOOK
+
+
+def test_publish(directory: Directory, server: LdapServer) -> None:
+    """Check that publishing a phone book replaces it as a whole."""
+    connection: Connection = connect(server)
+    directory.publish(PHONE_BOOK, [Contact("Joey", "Doe", uid="1")])
+    assert search(connection, "(sn=Doe)") == ["Joey Doe"]
+
+
+def test_access(server: LdapServer) -> None:
+    """Check that only authenticated clients may search, and nobody may write."""
+    with pytest.raises(LDAPBindError):
+        connect(server, password="wrong")
+
+    anonymous: Connection = connect(server, "", "")
+    assert search(anonymous, "(objectClass=*)") == []
+    assert anonymous.result["result"] == 50
+
+    connection: Connection = connect(server)
+    assert not connection.delete(f"cn=Catto Doe,{PHONE_BOOK}")
+    assert connection.result["result"] == 53
+    assert search(connection, "(sn=Doe)") == ["Catto Doe", "Joey Doe (Paws Inc.)"]
+
+
+def test_sync_to_memory(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Check that syncs publish their contacts instead of writing them to LDAP."""
+    directory: Directory = Directory()
+    monkeypatch.setattr(main, "LDAP_BACKEND", main.MEMORY_BACKEND)
+    monkeypatch.setattr(main, "DIRECTORY", directory)
+    with CardDavServer(
+        "/remote.php/dav/addressbooks/users/joey/kontakte", generate_address_book(20)
+    ) as server:
+        main.do_import([Tenant("memory", server.url, "joey", "", "Kontakte", PHONE_BOOK)])
+
+    assert len(directory.search(PHONE_BOOK, 1, PresentFilter("cn")) or []) == 20
+    assert 'nc2ldap_stage_items{tenant="memory",stage="publish"} 20' in METRICS.render()
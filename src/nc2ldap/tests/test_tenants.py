@@ -0,0 +1,118 @@
+"""Test multi-tenant configuration and syncs."""
+
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Dict, List
+
+import pytest
+from ldap3 import MOCK_ASYNC, MOCK_SYNC, Connection
+
+from nc2ldap import main
+from nc2ldap.benchmark.generator import generate_address_book
+from nc2ldap.benchmark.webdav_server import CardDavServer
+from nc2ldap.ldap import ConnectionPool, PhoneBookEntry
+from nc2ldap.ldap.pool import ConnectionPair
+from nc2ldap.metrics import METRICS
+from nc2ldap.tenants import Tenant, load_tenants
+
+CONFIG: str = """
+[defaults]
+host = "https://cloud.example.com"
+address_book = "Kontakte"
+
+[[tenant]]
+user = "Joey"
+app_token = "abc"
+phone_book = "ou=joey,dc=mytld,dc=com"
+
+[[tenant]]
+name = "office"
+user = "Office"
+app_token = "def"
+address_book = "Shared"
+phone_book = "ou=office,dc=mytld,dc=com"
+"""
+
+
+def test_load_tenants(tmp_path: Path) -> None:
+    """Check that tenants are read with defaults applied."""
+    path: Path = tmp_path / "tenants.toml"
+    path.write_text(CONFIG, encoding="utf-8")
+    tenants: List[Tenant] = load_tenants(str(path))
+    assert tenants == [
+        Tenant(
+            "joey",
+            "https://cloud.example.com",
+            "Joey",
+            "abc",
+            "Kontakte",
+            "ou=joey,dc=mytld,dc=com",
+        ),
+        Tenant(
+            "office",
+            "https://cloud.example.com",
+            "Office",
+            "def",
+            "Shared",
+            "ou=office,dc=mytld,dc=com",
+        ),
+    ]
+
+    path.write_text(CONFIG.replace('phone_book = "ou=joey,dc=mytld,dc=com"', ""), encoding="utf-8")
+    with pytest.raises(ValueError, match="phone_book"):
+        load_tenants(str(path))
+    path.write_text(CONFIG.replace('name = "office"', 'name = "joey"'), encoding="utf-8")
+    with pytest.raises(ValueError, match="unique"):
+        load_tenants(str(path))
+
+
+def test_sync_tenants(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    """Check that several tenants are synced concurrently into separate phone books."""
+    pool: ConnectionPool = ConnectionPool("mock", "", "")
+
+    def connect() -> ConnectionPair:
+        connections: ConnectionPair = (
+            Connection(pool.server, client_strategy=MOCK_SYNC),
+            Connection(pool.server, client_strategy=MOCK_ASYNC),
+        )
+        for connection in connections:
+            connection.bind()
+        return connections
+
+    monkeypatch.setattr(pool, "connect", connect)
+    monkeypatch.setattr(main, "LDAP_POOL", pool)
+    connect()[0].strategy.add_entry("dc=mytld,dc=com", {"objectClass": ["organization"]})
+
+    files: Dict[str, Dict[str, str]] = {
+        "joey": generate_address_book(20, seed=1),
+        "office": generate_address_book(30, seed=2),
+    }
+    with ExitStack() as stack:
+        tenants: List[Tenant] = []
+        for name, vcards in files.items():
+            server: CardDavServer = stack.enter_context(
+                CardDavServer(f"/remote.php/dav/addressbooks/users/{name}/kontakte", vcards)
+            )
+            tenants.append(
+                Tenant(
+                    name,
+                    server.url,
+                    name,
+                    "",
+                    "Kontakte",
+                    f"ou={name},dc=mytld,dc=com",
+                    snapshot_file=str(tmp_path / f"{name}.sqlite"),
+                )
+            )
+        main.do_import(tenants)
+
+        # The second import trusts the snapshots of the first one instead of reading LDAP
+        main.do_import(tenants)
+
+    for tenant in tenants:
+        with pool.phone_book(tenant.phone_book) as phone_book:
+            entries: List[PhoneBookEntry] = list(phone_book.get_entries())
+            assert len(entries) == len(files[tenant.name])
+    assert 'nc2ldap_stage_items{tenant="office",stage="ldap_write"} 0' in METRICS.render()
+    assert 'nc2ldap_stage_items{tenant="office",stage="snapshot_read"} 30' in METRICS.render()
+    assert pool.idle.qsize() <= 2
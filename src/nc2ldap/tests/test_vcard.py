@@ -0,0 +1,107 @@
+"""Test the fast vCard parser against vobject, and parsing in worker processes."""
+
+from typing import List, Optional
+
+import pytest
+from vobject.base import readOne
+
+from nc2ldap.contact import Contact, ParsePool, contact_from_vcard, read_vcard
+from nc2ldap.contact.converters import contact_from_tuple, contact_to_tuple
+from nc2ldap.contact.vcard import VCard, parse_vcard
+
+SUPPORTED_VCARDS = (
+    """
+BEGIN:VCARD
+VERSION:3.0
+N:Doe;Joey;;Spoiled cat;
+FN:Joey Doe
+UID:abc-123
+ORG:Black Cat & Paws Inc.;
+EMAIL;type=INTERNET;type=HOME;type=pref:cat@cathouse.cat
+TEL;type=CELL;type=VOICE;type=pref:+49 5555 234
+TEL;type=WORK;type=VOICE:05555 345
+TEL;type=HOME;type=VOICE:+49 5555 123
+TEL;type=HOME;type=FAX:+49 5555 999
+TEL:+49 5555 888
+item1.ADR;type=HOME;type=pref:;;Catstreet 42;Kittentown;;12345;Deutschland
+item1.X-ABADR:de
+END:VCARD
+""",
+    """
+BEGIN:VCARD
+VERSION:3.0
+N:One, Two, Three;;;Dres.;
+FN:Dres. One, Two, Three
+END:VCARD
+""",
+    "BEGIN:VCARD\r\nVERSION:3.0\r\nN:Do\\;e\\, Jr.;Jo,ey;;;\r\nFN:Joey\r\n"
+    "ORG:Paws\\, Inc.;Sales\r\nEMAIL;TYPE=HOME,INTERNET:cat@cat\\,house.cat\r\n"
+    "TEL;TYPE=VOICE:+49 5555\r\n  123\r\nPHOTO;ENCODING=b;TYPE=JPEG:AAAA\r\n BBBB\r\n"
+    "ADR;TYPE=work:;;Street 1, 2nd floor;Town;;12345;\r\nUID:urn:uuid:1234\r\n\t5678\r\n"
+    "END:VCARD\r\n",
+    """
+BEGIN:VCARD
+VERSION:4.0
+N:;;;;
+FN:Catnip Inc.
+ORG:Catnip Inc.
+TEL;TYPE=work,voice;VALUE=text:+49 5555 345
+END:VCARD
+""",
+)
+
+FALLBACK_VCARDS = (
+    """
+BEGIN:VCARD
+VERSION:2.1
+N:Doe;Joey;;;
+FN:Joey Doe
+TEL;HOME;VOICE:+49 5555 123
+END:VCARD
+""",
+    """
+BEGIN:VCARD
+VERSION:3.0
+N;ENCODING=QUOTED-PRINTABLE:D=C3=B6e;Joey;;;
+FN:Joey Doe
+END:VCARD
+""",
+    """
+BEGIN:VCARD
+VERSION:3.0
+N:Doe;Joey;;;
+FN:Joey Doe
+TEL;TYPE="home,voice":+49 5555 123
+END:VCARD
+""",
+)
+
+
+@pytest.mark.parametrize("serialized", SUPPORTED_VCARDS)
+def test_fast_parser(serialized: str) -> None:
+    """Check that the fast parser yields exactly the same contacts as vobject."""
+    vcard: Optional[VCard] = parse_vcard(serialized)
+    assert vcard is not None
+    result: Contact = contact_from_vcard(vcard)
+    assert contact_from_vcard(readOne(serialized)) == result
+
+
+@pytest.mark.parametrize("serialized", FALLBACK_VCARDS)
+def test_fallback_parser(serialized: str) -> None:
+    """Check that unusual vCards are left to vobject."""
+    assert parse_vcard(serialized) is None
+    result: Contact = contact_from_vcard(read_vcard(serialized))
+    assert contact_from_vcard(readOne(serialized)) == result
+
+
+def test_parse_pool() -> None:
+    """Check that worker processes yield the same contacts in the same order."""
+    vcards: List[str] = [*SUPPORTED_VCARDS, *FALLBACK_VCARDS] * 5
+    expected: List[Contact] = [contact_from_vcard(read_vcard(vcard)) for vcard in vcards]
+    assert [contact_from_tuple(contact_to_tuple(c)) for c in expected] == expected
+
+    pool: ParsePool = ParsePool(2, chunk_size=3)
+    try:
+        assert list(pool.parse(vcards)) == expected
+    finally:
+        pool.close()
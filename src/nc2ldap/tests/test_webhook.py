@@ -0,0 +1,70 @@
+"""Test requesting syncs via HTTP."""
+
+from functools import partial
+from time import monotonic, sleep
+from typing import Dict, List
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+import pytest
+
+from nc2ldap.webhook import WebhookServer, start_webhook_server
+from nc2ldap.worker import SyncWorker
+
+
+def post(server: WebhookServer, path: str, token: str = "secret") -> int:
+    """Send a request to the webhook endpoint, returning the status code."""
+    request: Request = Request(
+        f"http://127.0.0.1:{server.server_address[1]}{path}",
+        data=b'{"event": "card updated"}',
+        headers={"Authorization": f"Bearer {token}"},
+        method="POST",
+    )
+    try:
+        with urlopen(request) as response:
+            return response.status
+    except HTTPError as err:
+        return err.code
+
+
+def test_webhook() -> None:
+    """Check that bursts of requests cause a single sync of the requested tenants."""
+    runs: List[str] = []
+    workers: Dict[str, SyncWorker] = {
+        name: SyncWorker(partial(runs.append, name), debounce=60) for name in ("joey", "office")
+    }
+    for worker in workers.values():
+        worker.start()
+    server: WebhookServer = start_webhook_server(0, workers, "secret", 0.2, "127.0.0.1")
+    try:
+        assert post(server, "/sync", token="wrong") == 403
+        assert post(server, "/sync/nobody") == 404
+        assert post(server, "/metrics") == 404
+        for _ in range(3):
+            assert post(server, "/sync/joey") == 202
+        assert post(server, "/sync?token=secret", token="") == 202
+
+        end: float = monotonic() + 5
+        while len(runs) < 2 and monotonic() < end:
+            sleep(0.01)
+        sleep(0.3)
+        assert sorted(runs) == ["joey", "office"]
+    finally:
+        server.shutdown()
+        server.server_close()
+        for worker in workers.values():
+            worker.stop()
+
+
+@pytest.mark.parametrize("token", ["", "secret"])
+def test_webhook_without_token(token: str, caplog: pytest.LogCaptureFixture) -> None:
+    """Check that any request is accepted if no token is configured, which is warned about."""
+    worker: SyncWorker = SyncWorker(lambda: None, debounce=60)
+    server: WebhookServer = start_webhook_server(0, {"joey": worker}, "", 60, "127.0.0.1")
+    assert "No webhook token is set" in caplog.text
+    try:
+        assert post(server, "/sync", token=token) == 202
+        assert not worker.is_idle()
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,77 @@
+"""Test the background sync worker."""
+
+from threading import Event
+from time import monotonic, sleep
+
+from nc2ldap.worker import SyncWorker
+
+
+def wait_idle(worker: SyncWorker, timeout: float = 5) -> None:
+    """Wait until the worker has handled all triggers."""
+    end: float = monotonic() + timeout
+    while not worker.is_idle() and monotonic() < end:
+        sleep(0.01)
+
+
+def test_sync_worker_coalesces() -> None:
+    """Check that a burst of triggers results in a single run."""
+    worker: SyncWorker = SyncWorker(lambda: None, debounce=0.05)
+    worker.start()
+    for _ in range(5):
+        worker.trigger("test")
+    wait_idle(worker)
+    assert worker.runs == 1
+    worker.stop()
+
+
+def test_sync_worker_single_flight() -> None:
+    """Check that triggers during a run cause exactly one more run, never a parallel one."""
+    started: Event = Event()
+    release: Event = Event()
+    active: list = []
+
+    def task() -> None:
+        active.append(1)
+        assert len(active) == 1
+        started.set()
+        release.wait(5)
+        active.pop()
+
+    worker: SyncWorker = SyncWorker(task, debounce=0)
+    worker.start()
+    worker.trigger("first")
+    assert started.wait(5)
+    worker.trigger("second")
+    worker.trigger("third")
+    release.set()
+    wait_idle(worker)
+    assert worker.runs == 2
+    worker.stop()
+
+
+def test_sync_worker_survives_errors() -> None:
+    """Check that a failing task does not stop the worker."""
+
+    def task() -> None:
+        raise RuntimeError("Nextcloud is down")
+
+    worker: SyncWorker = SyncWorker(task, debounce=0)
+    worker.start()
+    worker.trigger("first")
+    wait_idle(worker)
+    worker.trigger("second")
+    wait_idle(worker)
+    assert worker.runs == 2
+    worker.stop()
+
+
+def test_sync_worker_max_delay() -> None:
+    """Check that a steady stream of triggers postpones a run by no more than the maximum delay."""
+    worker: SyncWorker = SyncWorker(lambda: None, debounce=0.1, max_delay=0.3)
+    worker.start()
+    end: float = monotonic() + 0.6
+    while monotonic() < end:
+        worker.trigger("test")
+        sleep(0.02)
+    assert worker.runs >= 1
+    worker.stop()
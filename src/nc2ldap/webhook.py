@@ -0,0 +1,87 @@
+"""Module to request syncs via HTTP, e.g. from a Nextcloud webhook, in addition to the schedule."""
+
+import logging
+from hmac import compare_digest
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from typing import List, Mapping, Optional
+from urllib.parse import SplitResult, parse_qs, urlsplit
+
+from nc2ldap.constants import LOG_LEVEL
+from nc2ldap.worker import SyncWorker
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+MAX_PAYLOAD_SIZE: int = 1 << 16
+
+
+class WebhookServer(ThreadingHTTPServer):
+    """Serve sync requests for the workers of all tenants."""
+
+    def __init__(
+        self, port: int, host: str, workers: Mapping[str, SyncWorker], token: str, debounce: float
+    ) -> None:
+        """Listen on a port; requests need to carry the token, if set."""
+        super().__init__((host, port), WebhookHandler)
+        self.workers: Mapping[str, SyncWorker] = workers
+        self.token: str = token
+        self.debounce: float = debounce
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    """Request syncs of all tenants at `/sync`, or of a single one at `/sync/<tenant>`."""
+
+    server: WebhookServer
+
+    def log_message(self, format: str, *args: object) -> None:  # pylint: disable=W0622
+        """Log requests only when debugging."""
+        logger.debug(format, *args)
+
+    def is_authorized(self, query: str) -> bool:
+        """Check the token passed as bearer token or as query parameter."""
+        if not self.server.token:
+            return True
+        header: str = self.headers.get("Authorization", "")
+        tokens: List[str] = parse_qs(query).get("token", [])
+        given: str = header.removeprefix("Bearer ") if header.startswith("Bearer ") else ""
+        return compare_digest(given or (tokens[0] if tokens else ""), self.server.token)
+
+    def do_POST(self) -> None:  # pylint: disable=invalid-name
+        """Trigger the requested syncs, which start after the debounce period."""
+        # The payload, e.g. the event of a Nextcloud webhook, doesn't matter
+        self.rfile.read(min(int(self.headers.get("Content-Length") or 0), MAX_PAYLOAD_SIZE))
+        url: SplitResult = urlsplit(self.path)
+        parts: List[str] = url.path.strip("/").split("/")
+        if parts[0] != "sync" or len(parts) > 2:
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+        if not self.is_authorized(url.query):
+            self.send_error(HTTPStatus.FORBIDDEN)
+            return
+
+        tenant: Optional[str] = parts[1] if len(parts) > 1 else None
+        if tenant is not None and tenant not in self.server.workers:
+            self.send_error(HTTPStatus.NOT_FOUND, f"Unknown tenant {tenant}")
+            return
+        for name, worker in self.server.workers.items():
+            if tenant in (None, name):
+                worker.trigger(f"webhook for {name}", self.server.debounce)
+
+        self.send_response(HTTPStatus.ACCEPTED)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+def start_webhook_server(
+    port: int, workers: Mapping[str, SyncWorker], token: str, debounce: float, host: str = ""
+) -> WebhookServer:
+    """Serve the webhook endpoint from a background thread."""
+    server: WebhookServer = WebhookServer(port, host, workers, token, debounce)
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, name="webhook", daemon=True).start()
+    logger.info("Accepting sync requests on port %i.", server.server_address[1])
+    if not token:
+        logger.warning("No webhook token is set, so anyone may request syncs; set WEBHOOK_TOKEN.")
+    return server
@@ -0,0 +1,85 @@
+"""Module to run syncs in the background, coalescing requests to run them."""
+
+import logging
+from threading import Condition, Thread
+from time import monotonic
+from typing import Callable, Optional
+
+from nc2ldap.constants import LOG_LEVEL
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+
+class SyncWorker:
+    """A background thread running a task on request, but never twice at the same time.
+
+    Each trigger starts the task after a quiet period (debounce), so that bursts of triggers
+    cause a single run; triggers received while the task is running cause one more run. A
+    steady stream of triggers postpones the run by no more than the maximum delay, if any.
+    """
+
+    def __init__(
+        self, task: Callable[[], None], debounce: float, max_delay: Optional[float] = None
+    ) -> None:
+        """Set up the worker, which needs to be started afterwards."""
+        self.task: Callable[[], None] = task
+        self.debounce: float = debounce
+        self.max_delay: Optional[float] = max_delay
+        self.condition: Condition = Condition()
+        self.due: Optional[float] = None
+        self.latest: Optional[float] = None
+        self.running: bool = False
+        self.runs: int = 0
+        self.stopped: bool = False
+        self.thread: Thread = Thread(target=self.run, name="sync-worker", daemon=True)
+
+    def start(self) -> None:
+        """Start the background thread."""
+        self.thread.start()
+
+    def stop(self) -> None:
+        """Stop the background thread after the current run, if any."""
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        self.thread.join()
+
+    def trigger(self, reason: str, debounce: Optional[float] = None) -> None:
+        """Request a run of the task after the (given or default) debounce period."""
+        with self.condition:
+            now: float = monotonic()
+            if self.latest is None and self.max_delay is not None:
+                self.latest = now + self.max_delay
+            self.due = now + (self.debounce if debounce is None else debounce)
+            if self.latest is not None:
+                self.due = min(self.due, self.latest)
+            logger.info("Sync requested (%s).", reason)
+            self.condition.notify_all()
+
+    def is_idle(self) -> bool:
+        """Check whether the task is neither running nor requested to run."""
+        with self.condition:
+            return not self.running and self.due is None
+
+    def run(self) -> None:
+        """Wait for triggers and run the task, until stopped."""
+        while True:
+            with self.condition:
+                while not self.stopped and (self.due is None or self.due > monotonic()):
+                    self.condition.wait(None if self.due is None else self.due - monotonic())
+                if self.stopped:
+                    return
+                self.due = None
+                self.latest = None
+                self.running = True
+
+            try:
+                self.task()
+            except Exception:  # pylint: disable=broad-exception-caught
+                logger.exception("Sync failed, waiting for the next request.")
+            finally:
+                with self.condition:
+                    self.running = False
+                    self.runs += 1
+                    self.condition.notify_all()